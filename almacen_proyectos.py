@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Almacén local de proyectos (SQLite) para el constructor de encuestas
+# - Una fila por pregunta (clave: qid), por regla (clave: id por contenido), por fila de
+#   catálogo y por texto fijo; el orden de preguntas y reglas va en filas aparte
+# - Autoguardado: solo escribe las filas que cambiaron (comparación por hash)
+# - Abrir proyecto: lee todas las filas vigentes (catálogo y opciones incluidos: la primera
+#   compilación los necesita); lo diferido es el historial, que nunca se lee al abrir
+# - Versiones (snapshots) con almacenamiento DELTA + checkpoints completos periódicos
+# ==========================================================================================
+
+import json
+import zlib
+import sqlite3
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import reglas
+
+DB_PATH_DEFAULT = "proyectos_encuesta.sqlite"
+
+# Cada cuántas versiones se guarda un snapshot completo (acota la reconstrucción)
+CHECKPOINT_CADA = 20
+
+SECCIONES = ("preguntas", "orden", "reglas", "catalogo", "textos", "meta")
+
+_SEP = "\x1f"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS proyectos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL UNIQUE,
+    creado TEXT NOT NULL,
+    actualizado TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS filas (
+    proyecto_id INTEGER NOT NULL,
+    seccion TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    orden INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    datos TEXT NOT NULL,
+    PRIMARY KEY (proyecto_id, seccion, clave)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS versiones (
+    proyecto_id INTEGER NOT NULL,
+    numero INTEGER NOT NULL,
+    creado TEXT NOT NULL,
+    nota TEXT,
+    completo INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    delta BLOB NOT NULL,
+    PRIMARY KEY (proyecto_id, numero)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS version_head (
+    proyecto_id INTEGER NOT NULL,
+    seccion TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (proyecto_id, seccion, clave)
+) WITHOUT ROWID;
+"""
+
+
+def conectar(path: str = DB_PATH_DEFAULT) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_ESQUEMA)
+    return conn
+
+
+def _ahora() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _dump(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _hash(txt: str) -> str:
+    return hashlib.sha1(txt.encode("utf-8")).hexdigest()
+
+
+# ------------------------------------------------------------------------------------------
+# Proyecto (dict) ⇄ filas por clave
+# ------------------------------------------------------------------------------------------
+def filas_proyecto(proyecto: Dict, base: Optional[Dict] = None,
+                   reutilizar: Tuple[str, ...] = ()) -> Dict[str, Dict[str, Tuple[int, str]]]:
+    """
+    Convierte el proyecto (mismo dict que el JSON exportado) en filas por sección:
+    {seccion: {clave: (orden, json)}}. El orden de las preguntas viaja en una fila
+    aparte ("orden"), así mover o borrar una pregunta no reescribe las demás.
+    Las secciones de `reutilizar` se toman de `base` sin volver a serializarlas (el
+    llamador sabe que no cambiaron, p. ej. el catálogo compartido).
+    """
+    out = {s: {} for s in SECCIONES}
+    if base:
+        for s in reutilizar:
+            out[s] = base.get(s, {})
+
+    qids = []
+    for q in proyecto.get("preguntas", []):
+        out["preguntas"][q["qid"]] = (0, _dump(dict(q)))
+        qids.append(q["qid"])
+    out["orden"]["preguntas"] = (0, _dump(qids))
+
+    # Reglas por id de contenido (reglas.id_regla): borrar una no reescribe las siguientes.
+    # Una regla repetida lleva sufijo de ocurrencia para no pisar a la primera.
+    for corto, tipo in reglas.TIPOS.items():
+        claves = []
+        for r in proyecto.get(tipo, []):
+            rid = f"{tipo}{_SEP}{reglas.id_regla(corto, r)}"
+            clave, n = rid, 2
+            while clave in out["reglas"]:
+                clave, n = f"{rid}{_SEP}{n}", n + 1
+            out["reglas"][clave] = (0, _dump(dict(r)))
+            claves.append(clave)
+        out["orden"][tipo] = (0, _dump(claves))
+
+    if not (base and "catalogo" in reutilizar):
+        for i, r in enumerate(proyecto.get("choices_ext_rows", [])):
+            out["catalogo"][f"{r.get('list_name')}{_SEP}{r.get('name')}"] = (i, _dump(dict(r)))
+
+    for i, (k, v) in enumerate(sorted((proyecto.get("textos_fijos") or {}).items())):
+        out["textos"][k] = (i, _dump(v))
+
+    meta = {k: v for k, v in proyecto.items()
+            if k not in ("preguntas", "reglas_visibilidad", "reglas_finalizar", "choices_ext_rows", "textos_fijos")}
+    for i, (k, v) in enumerate(sorted(meta.items())):
+        out["meta"][k] = (i, _dump(v))
+    return out
+
+
+def proyecto_desde_filas(filas: Dict[str, Dict[str, Tuple[int, str]]]) -> Dict:
+    def _ordenadas(seccion):
+        return sorted(filas.get(seccion, {}).items(), key=lambda kv: kv[1][0])
+
+    proyecto = {k: json.loads(v) for k, (_, v) in _ordenadas("meta")}
+    por_qid = {k: v for k, (_, v) in filas.get("preguntas", {}).items()}
+    orden = json.loads(filas.get("orden", {}).get("preguntas", (0, "[]"))[1])
+    proyecto["preguntas"] = [json.loads(por_qid.pop(qid)) for qid in orden if qid in por_qid]
+    proyecto["preguntas"] += [json.loads(v) for v in por_qid.values()]
+
+    # Filas de reglas guardadas antes de la fila de orden (clave tipo + índice) siguen su orden
+    por_tipo = {tipo: {} for tipo in reglas.TIPOS.values()}
+    for clave, (_, v) in _ordenadas("reglas"):
+        por_tipo.setdefault(clave.split(_SEP, 1)[0], {})[clave] = v
+    for tipo, filas_tipo in por_tipo.items():
+        orden_tipo = json.loads(filas.get("orden", {}).get(tipo, (0, "[]"))[1])
+        lista = [json.loads(filas_tipo.pop(k)) for k in orden_tipo if k in filas_tipo]
+        proyecto[tipo] = lista + [json.loads(v) for v in filas_tipo.values()]
+
+    proyecto["choices_ext_rows"] = [json.loads(v) for _, (_, v) in _ordenadas("catalogo")]
+    proyecto["textos_fijos"] = {k: json.loads(v) for k, (_, v) in _ordenadas("textos")}
+    return proyecto
+
+
+def hashes_filas(filas: Dict[str, Dict[str, Tuple[int, str]]]) -> Dict[str, Dict[str, str]]:
+    return {s: {k: _hash(f"{o}|{v}") for k, (o, v) in rows.items()} for s, rows in filas.items()}
+
+
+def delta_filas(previas: Dict[str, Dict[str, str]], filas: Dict[str, Dict[str, Tuple[int, str]]]) -> Dict:
+    """
+    Diferencia entre hashes previos y filas actuales. Devuelve
+    {"set": {seccion: {clave: [orden, json]}}, "del": {seccion: [claves]}}
+    con solo lo que cambió (tamaño proporcional al cambio).
+    """
+    nuevos = hashes_filas(filas)
+    d_set, d_del = {}, {}
+    for s in SECCIONES:
+        prev_s = previas.get(s, {})
+        cur_s = nuevos.get(s, {})
+        cambiadas = {k: list(filas[s][k]) for k, h in cur_s.items() if prev_s.get(k) != h}
+        borradas = [k for k in prev_s if k not in cur_s]
+        if cambiadas:
+            d_set[s] = cambiadas
+        if borradas:
+            d_del[s] = borradas
+    return {"set": d_set, "del": d_del}
+
+
+def aplicar_delta(filas: Dict[str, Dict[str, Tuple[int, str]]], delta: Dict) -> Dict:
+    for s, claves in delta.get("del", {}).items():
+        for k in claves:
+            filas.get(s, {}).pop(k, None)
+    for s, rows in delta.get("set", {}).items():
+        dest = filas.setdefault(s, {})
+        for k, (o, v) in rows.items():
+            dest[k] = (o, v)
+    return filas
+
+
+# ------------------------------------------------------------------------------------------
+# Proyectos
+# ------------------------------------------------------------------------------------------
+def listar_proyectos(conn: sqlite3.Connection) -> List[Dict]:
+    """Solo metadatos: no toca filas ni historial."""
+    cur = conn.execute(
+        "SELECT p.id, p.nombre, p.actualizado, "
+        "(SELECT COUNT(*) FROM versiones v WHERE v.proyecto_id = p.id) "
+        "FROM proyectos p ORDER BY p.actualizado DESC"
+    )
+    return [{"id": r[0], "nombre": r[1], "actualizado": r[2], "versiones": r[3]} for r in cur.fetchall()]
+
+
+def obtener_o_crear_proyecto(conn: sqlite3.Connection, nombre: str) -> int:
+    row = conn.execute("SELECT id FROM proyectos WHERE nombre = ?", (nombre,)).fetchone()
+    if row:
+        return row[0]
+    ts = _ahora()
+    cur = conn.execute("INSERT INTO proyectos (nombre, creado, actualizado) VALUES (?, ?, ?)", (nombre, ts, ts))
+    conn.commit()
+    return cur.lastrowid
+
+
+def eliminar_proyecto(conn: sqlite3.Connection, proyecto_id: int):
+    with conn:
+        for tabla in ("filas", "versiones", "version_head"):
+            conn.execute(f"DELETE FROM {tabla} WHERE proyecto_id = ?", (proyecto_id,))
+        conn.execute("DELETE FROM proyectos WHERE id = ?", (proyecto_id,))
+
+
+def hashes_guardados(conn: sqlite3.Connection, proyecto_id: int) -> Dict[str, Dict[str, str]]:
+    out = {s: {} for s in SECCIONES}
+    for s, k, h in conn.execute("SELECT seccion, clave, hash FROM filas WHERE proyecto_id = ?", (proyecto_id,)):
+        out.setdefault(s, {})[k] = h
+    return out
+
+
+def guardar_cambios(conn: sqlite3.Connection, proyecto_id: int, proyecto: Dict,
+                    previas: Optional[Dict[str, Dict[str, str]]] = None,
+                    filas: Optional[Dict] = None) -> Tuple[Dict[str, Dict[str, str]], int]:
+    """
+    Autoguardado incremental. `previas` son los hashes del último guardado que la sesión
+    ya conoce (si es None se leen de la base). `filas` permite reutilizar las filas ya
+    calculadas en el mismo rerun. Devuelve (hashes_nuevos, filas_escritas).
+    """
+    if previas is None:
+        previas = hashes_guardados(conn, proyecto_id)
+
+    if filas is None:
+        filas = filas_proyecto(proyecto)
+    delta = delta_filas(previas, filas)
+    escritas = sum(len(v) for v in delta["set"].values()) + sum(len(v) for v in delta["del"].values())
+    nuevos = hashes_filas(filas)
+    if not escritas:
+        return nuevos, 0
+
+    with conn:
+        for s, claves in delta["del"].items():
+            conn.executemany(
+                "DELETE FROM filas WHERE proyecto_id = ? AND seccion = ? AND clave = ?",
+                [(proyecto_id, s, k) for k in claves]
+            )
+        for s, rows in delta["set"].items():
+            conn.executemany(
+                "INSERT OR REPLACE INTO filas (proyecto_id, seccion, clave, orden, hash, datos) VALUES (?, ?, ?, ?, ?, ?)",
+                [(proyecto_id, s, k, o, nuevos[s][k], v) for k, (o, v) in rows.items()]
+            )
+        conn.execute("UPDATE proyectos SET actualizado = ? WHERE id = ?", (_ahora(), proyecto_id))
+    return nuevos, escritas
+
+
+def cargar_filas(conn: sqlite3.Connection, proyecto_id: int, secciones=SECCIONES) -> Dict[str, Dict[str, Tuple[int, str]]]:
+    filas = {s: {} for s in secciones}
+    marcas = ",".join("?" for _ in secciones)
+    cur = conn.execute(
+        f"SELECT seccion, clave, orden, datos FROM filas WHERE proyecto_id = ? AND seccion IN ({marcas})",
+        (proyecto_id, *secciones)
+    )
+    for s, k, o, v in cur:
+        filas[s][k] = (o, v)
+    return filas
+
+
+def cargar_proyecto(conn: sqlite3.Connection, proyecto_id: int) -> Tuple[Dict, Dict[str, Dict[str, str]]]:
+    """
+    Carga el estado vigente completo (sin historial). Devuelve (proyecto, hashes).
+    No hay carga perezosa de catálogo ni de opciones: el rerun que abre el proyecto compila
+    el XLSForm y los usa todos; solo versiones e historial quedan sin leer.
+    """
+    filas = cargar_filas(conn, proyecto_id)
+    return proyecto_desde_filas(filas), hashes_filas(filas)
+
+
+# ------------------------------------------------------------------------------------------
+# Versiones (snapshots con delta)
+# ------------------------------------------------------------------------------------------
+def _head(conn: sqlite3.Connection, proyecto_id: int) -> Dict[str, Dict[str, str]]:
+    out = {s: {} for s in SECCIONES}
+    for s, k, h in conn.execute("SELECT seccion, clave, hash FROM version_head WHERE proyecto_id = ?", (proyecto_id,)):
+        out.setdefault(s, {})[k] = h
+    return out
+
+
+def crear_version(conn: sqlite3.Connection, proyecto_id: int, proyecto: Dict, nota: str = "") -> Optional[int]:
+    """
+    Guarda un snapshot. Solo se almacena la diferencia contra la versión anterior,
+    salvo cada CHECKPOINT_CADA versiones (snapshot completo). Devuelve el número de
+    versión, o None si no hubo cambios desde la última.
+    """
+    row = conn.execute("SELECT MAX(numero) FROM versiones WHERE proyecto_id = ?", (proyecto_id,)).fetchone()
+    ultimo = row[0] or 0
+    numero = ultimo + 1
+    completo = (ultimo == 0) or (numero % CHECKPOINT_CADA == 1)
+
+    filas = filas_proyecto(proyecto)
+    previas = {} if completo else _head(conn, proyecto_id)
+    delta = delta_filas(previas, filas)
+    if not completo and not delta["set"] and not delta["del"]:
+        return None
+
+    blob = zlib.compress(_dump(delta).encode("utf-8"), 6)
+    nuevos = hashes_filas(filas)
+    with conn:
+        conn.execute(
+            "INSERT INTO versiones (proyecto_id, numero, creado, nota, completo, bytes, delta) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (proyecto_id, numero, _ahora(), nota or "", int(completo), len(blob), blob)
+        )
+        conn.execute("DELETE FROM version_head WHERE proyecto_id = ?", (proyecto_id,))
+        conn.executemany(
+            "INSERT INTO version_head (proyecto_id, seccion, clave, hash) VALUES (?, ?, ?, ?)",
+            [(proyecto_id, s, k, h) for s, rows in nuevos.items() for k, h in rows.items()]
+        )
+    return numero
+
+
+def listar_versiones(conn: sqlite3.Connection, proyecto_id: int) -> List[Dict]:
+    cur = conn.execute(
+        "SELECT numero, creado, nota, completo, bytes FROM versiones WHERE proyecto_id = ? ORDER BY numero DESC",
+        (proyecto_id,)
+    )
+    return [{"numero": r[0], "creado": r[1], "nota": r[2], "completo": bool(r[3]), "bytes": r[4]} for r in cur.fetchall()]
+
+
+def reconstruir_version(conn: sqlite3.Connection, proyecto_id: int, numero: int) -> Dict:
+    """Parte del último checkpoint completo ≤ numero y aplica los deltas siguientes."""
+    row = conn.execute(
+        "SELECT MAX(numero) FROM versiones WHERE proyecto_id = ? AND numero <= ? AND completo = 1",
+        (proyecto_id, numero)
+    ).fetchone()
+    base = row[0]
+    if base is None:
+        raise KeyError(f"No existe la versión {numero}.")
+
+    filas = {s: {} for s in SECCIONES}
+    cur = conn.execute(
+        "SELECT delta FROM versiones WHERE proyecto_id = ? AND numero BETWEEN ? AND ? ORDER BY numero",
+        (proyecto_id, base, numero)
+    )
+    for (blob,) in cur:
+        aplicar_delta(filas, json.loads(zlib.decompress(blob).decode("utf-8")))
+    return proyecto_desde_filas(filas)
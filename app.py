@@ -5,7 +5,38 @@
 # - Constructor completo (agregar/editar/ordenar/borrar)
 # - Condicionales (relevant) + finalizar temprano
 # - Listas en cascada (choice_filter) Cantón→Distrito [CATÁLOGO MANUAL POR LOTES]
-# - Exportar/Importar proyecto (JSON)
+# - Exportar/Importar proyecto (JSON y formato compacto .ecproj con esquema versionado)
+# - Proyectos locales (SQLite): autoguardado incremental + historial de versiones (delta)
+# - Deshacer / Rehacer (deltas por fila, profundidad configurable)
+# - Seed y catálogos compartidos entre sesiones (solo lectura, copia al escribir)
+# - Caché de XLSForm compilados por hash de contenido (compilación y .xlsx reproducibles)
+# - settings.version derivada del contenido (hash) con contador monótono opcional
+# - Panel de depuración opcional: tiempo / memoria por fase del rerun + log local
+# - Huella de memoria de la sesión por clave/categoría + limpieza de estado obsoleto
+# - Logo procesado una vez por contenido (reducido para campo) + ZIP para Survey123 Connect
+# - Cuestionario en papel a Word (.docx), individual o en lote por delegación
+# - Cuestionario imprimible en PDF; lote por delegación en procesos paralelos (un ZIP)
+# - Plantillas de encuesta como archivos de datos (plantillas/*.json), precompiladas y
+#   compartidas por proceso; proyectos se actualizan a la versión nueva de su plantilla
+# - Capas por delegación (agregar / reemplazar / eliminar sobre la plantilla), compuestas y
+#   cacheadas: cada variante guarda solo sus diferencias
+# - Importar un XLSForm existente (survey / choices / settings) al constructor
+# - Preguntas fuera de las páginas fijas se publican en páginas propias (su página de origen o
+#   "Preguntas adicionales") en vez de quedar fuera del XLSForm
+# - Comparar versiones (proyecto o XLSForm): cambios por página y cambios que rompen el esquema
+# - Etiquetas multilingües (label::idioma) con memoria de traducción por texto fuente,
+#   compartida entre preguntas y plantillas; columnas por idioma cacheadas sobre un solo compilado
+# - Matrices (table-list) como tipo: lista compartida + N filas, agrupadas al generar las filas
+#   del survey; cualquier cantidad por formulario
+# - Presupuesto de complejidad (expresiones, páginas, listas) medido en cada compilación, con
+#   avisos y sugerencia de división de páginas
+# - División automática opcional de páginas largas en sub-páginas (sin separar "Otro" ni matrices)
+# - Diccionario de datos (codebook) en CSV / Parquet desde el mismo compilado, versionado por hash
+# - Migración de respuestas entre versiones (renombres de campos y opciones por qid) a un solo CSV
+# - Reglas con grupos Y / O anidados; relevant combinado y minimizado (sin paréntesis ni
+#   guardas repetidas: lo que ya garantiza la página se pliega)
+# - Índice de reglas por id / target / fuente: sin duplicados, validadas contra las opciones
+#   actuales (reglas obsoletas marcadas al editar opciones)
 # - Exportar a XLSForm (survey/choices/settings)
 # - PÁGINAS reales (style="pages"): Intro + Consentimiento + P3.. (por secciones)
 # - Portada con logo (media::image) y texto de introducción
@@ -22,27 +53,56 @@
 #   - P2 Consentimiento + Finalización si NO
 #   - P3 Datos demográficos + texto comercio + Q6 Tipo local comercial
 #   - P4 II. Percepción Comercio (7–10 + Matriz 9)
-#   - P5 III. Riesgos (11–16)
-#   - P6 Delitos (17–21)
-#   - P7 Victimización (22–23.1) (incluye 22.1 por bloques A–D)
-#   - P8 Propuestas (24–25)
-#   - P9 Confianza Policial (26–31)
-#   - ✅ P10 Información Adicional y Contacto Voluntario (32–34)  ← NUEVO
+#   - P5 III. Riesgos (11–17)
+#   - P6 Delitos (18–22)
+#   - P7 Victimización (23–24.1) (incluye 23.1 por bloques A–D)
+#   - P8 Propuestas (25–26)
+#   - P9 Confianza Policial (27–32)
+#   - ✅ P10 Información Adicional y Contacto Voluntario (33–35)  ← NUEVO
 # ==========================================================================================
 
+import os
 import re
 import json
+import time
 import uuid
+import hashlib
+import zipfile
+from types import MappingProxyType
 from io import BytesIO
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 import streamlit as st
 import pandas as pd
 
+import almacen_proyectos
+import formato_proyecto
+import historial
+import cache_compartido
+import instrumentacion
+import estado_sesion
+import medios
+import cuestionario_papel
+import exportar_word
+import exportar_pdf
+import importar_xlsform
+import diferencias
+import plantillas
+import capas
+import traducciones
+import complejidad
+import diccionario_datos
+import matrices
+import migracion_respuestas
+import motor_reglas
+import reglas
+from nombres import asegurar_nombre_unico, slugify_name, slugs_opciones
+
 # ------------------------------------------------------------------------------------------
 # Configuración de la app
 # ------------------------------------------------------------------------------------------
+_T0_RERUN = time.perf_counter()
 st.set_page_config(page_title="Encuesta Comercio → XLSForm (Survey123)", layout="wide")
 st.title("🏪 Encuesta Comercio → XLSForm para ArcGIS Survey123")
 
@@ -72,33 +132,45 @@ TIPOS = [
     "GPS (ubicación)",
 ]
 
+# ------------------------------------------------------------------------------------------
+# Instrumentación por fase del rerun (solo si está activa: ENCUESTA_PERF=1 o panel de depuración)
+# - Tiempo siempre; memoria (tracemalloc) solo con ENCUESTA_PERF_MEM=1 o la casilla del panel
+# - Log local JSON Lines en ENCUESTA_PERF_LOG (por defecto encuesta_perf.log)
+# ------------------------------------------------------------------------------------------
+def _perf_activo() -> bool:
+    return os.environ.get("ENCUESTA_PERF") == "1" or bool(st.session_state.get("_perf_activo"))
+
+def _perf_memoria() -> bool:
+    return os.environ.get("ENCUESTA_PERF_MEM") == "1" or bool(st.session_state.get("_perf_memoria"))
+
+def _perf_registro():
+    """Registro de fases de este rerun, o None si la instrumentación está apagada."""
+    return st.session_state.get("_perf_fases") if _perf_activo() else None
+
+def _fase_ini():
+    return instrumentacion.fase_ini(_perf_registro())
+
+def _fase_fin(nombre: str, t0, **tamanos):
+    instrumentacion.fase_fin(_perf_registro(), nombre, t0, **tamanos)
+
+# tracemalloc es del proceso: cada sesión solo suelta su parte (no lo apaga para las demás)
+_perf_sesion = st.session_state.setdefault("_perf_sesion", uuid.uuid4().hex[:8])
+if _perf_activo():
+    st.session_state["_perf_fases"] = {}
+    instrumentacion.activar_memoria(_perf_sesion, _perf_memoria())
+else:
+    st.session_state.pop("_perf_fases", None)
+    instrumentacion.activar_memoria(_perf_sesion, False)
+
 def _rerun():
+    # Toda acción del constructor termina aquí: el token marca que el estado cambió y el
+    # historial lo registra al inicio del siguiente rerun, antes de dibujar Deshacer
+    st.session_state["_mut"] = st.session_state.get("_mut", 0) + 1
     if hasattr(st, "rerun"):
         st.rerun()
     else:
         st.experimental_rerun()
 
-def slugify_name(texto: str) -> str:
-    if not texto:
-        return "campo"
-    t = texto.lower()
-    t = re.sub(r"[áàäâ]", "a", t)
-    t = re.sub(r"[éèëê]", "e", t)
-    t = re.sub(r"[íìïî]", "i", t)
-    t = re.sub(r"[óòöô]", "o", t)
-    t = re.sub(r"[úùüû]", "u", t)
-    t = re.sub(r"ñ", "n", t)
-    t = re.sub(r"[^a-z0-9]+", "_", t).strip("_")
-    return t or "campo"
-
-def asegurar_nombre_unico(base: str, usados: set) -> str:
-    if base not in usados:
-        return base
-    i = 2
-    while f"{base}_{i}" in usados:
-        i += 1
-    return f"{base}_{i}"
-
 def map_tipo_to_xlsform(tipo_ui: str, name: str):
     if tipo_ui == "Texto (corto)":
         return ("text", None, None)
@@ -125,32 +197,6 @@ def xlsform_or_expr(conds):
         return conds[0]
     return "(" + " or ".join(conds) + ")"
 
-def xlsform_not(expr):
-    if not expr:
-        return None
-    return f"not({expr})"
-
-def build_relevant_expr(rules_for_target: List[Dict]):
-    or_parts = []
-    for r in rules_for_target:
-        src = r["src"]
-        op = r.get("op", "=")
-        vals = r.get("values", [])
-        if not vals:
-            continue
-
-        if op == "=":
-            segs = [f"${{{src}}}='{v}'" for v in vals]
-        elif op == "selected":
-            segs = [f"selected(${{{src}}}, '{v}')" for v in vals]
-        elif op == "!=":
-            segs = [f"${{{src}}}!='{v}'" for v in vals]
-        else:
-            segs = [f"${{{src}}}='{v}'" for v in vals]
-
-        or_parts.append(xlsform_or_expr(segs))
-    return xlsform_or_expr(or_parts)
-
 # ------------------------------------------------------------------------------------------
 # FIX REFLEJO DE EDICIÓN: ID estable por pregunta (qid) + editor por qid
 # ------------------------------------------------------------------------------------------
@@ -165,6 +211,131 @@ def q_index_by_qid(qid: str) -> int:
             return i
     return -1
 
+# ------------------------------------------------------------------------------------------
+# Datos compartidos entre sesiones (solo lectura) + copia al escribir
+# ------------------------------------------------------------------------------------------
+# Plantillas y catálogos se guardan UNA vez por proceso (st.cache_resource, con TTL y
+# máximo de entradas) como estructuras inmutables. Cada sesión solo guarda referencias;
+# cuando necesita modificar una pregunta/fila la copia y reemplaza su propia referencia.
+CACHE_TTL_S = 6 * 3600
+CACHE_MAX_CATALOGOS = 16
+CACHE_MAX_PLANTILLAS = 8
+CACHE_MAX_CAPAS = 256
+CACHE_MAX_MEMORIAS = 16
+
+def _congelar(obj):
+    if isinstance(obj, dict) or isinstance(obj, MappingProxyType):
+        return MappingProxyType({k: _congelar(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return tuple(_congelar(v) for v in obj)
+    return obj
+
+def _json_default(obj):
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    raise TypeError(f"Objeto no serializable: {type(obj).__name__}")
+
+def _q_editable(idx: int) -> Dict:
+    """Copia al escribir: reemplaza la pregunta compartida por una copia propia de la sesión."""
+    q = st.session_state.preguntas[idx]
+    if not isinstance(q, dict):
+        q = dict(q)
+        st.session_state.preguntas[idx] = q
+    return q
+
+@st.cache_resource(ttl=CACHE_TTL_S, max_entries=CACHE_MAX_CATALOGOS, show_spinner=False)
+def _catalogo_por_hash(contenido_hash: str, _rows):
+    return tuple(_congelar(r) for r in _rows)
+
+def _hash_filas_catalogo(rows) -> str:
+    return uuid.uuid5(uuid.NAMESPACE_URL, json.dumps(rows, ensure_ascii=False, sort_keys=True, default=_json_default)).hex
+
+def _catalogo_compartido(rows) -> tuple:
+    """
+    Internaliza el catálogo: sesiones con el mismo contenido comparten las mismas filas.
+    El hash de contenido queda en la sesión junto a las filas (ver _hash_catalogo).
+    """
+    rows = list(rows)
+    h = _hash_filas_catalogo(rows)
+    compartido = _catalogo_por_hash(h, rows)
+    st.session_state["_catalogo_hash"] = {"rows": compartido, "n": len(compartido), "hash": h}
+    return compartido
+
+def _hash_catalogo() -> str:
+    """
+    Hash de contenido del catálogo de la sesión, para las claves de la caché de compilados.
+    Solo se recalcula si cambió la lista: otro objeto o, con _append_choice_unique, otro largo.
+    """
+    rows = st.session_state.choices_ext_rows
+    guardado = st.session_state.get("_catalogo_hash")
+    if guardado is None or guardado["rows"] is not rows or guardado["n"] != len(rows):
+        guardado = {"rows": rows, "n": len(rows), "hash": _hash_filas_catalogo(rows)}
+        st.session_state["_catalogo_hash"] = guardado
+    return guardado["hash"]
+
+@st.cache_resource(ttl=CACHE_TTL_S, max_entries=CACHE_MAX_PLANTILLAS, show_spinner=False)
+def _plantilla_por_firma(plantilla_id: str, firma: tuple) -> MappingProxyType:
+    return _congelar(plantillas.leer(plantilla_id))
+
+def _plantilla(plantilla_id: str) -> MappingProxyType:
+    """Plantilla precompilada y compartida; se vuelve a leer solo si cambia su archivo."""
+    return _plantilla_por_firma(plantilla_id, plantillas.firma(plantilla_id))
+
+def _instanciar_plantilla(plantilla_id: str) -> tuple:
+    """(preguntas, {"id", "version"}): copia de la tupla compartida, sin copiar las preguntas."""
+    p = _plantilla(plantilla_id)
+    return list(p["preguntas"]), {"id": p["id"], "version": p["version"]}
+
+def _textos_base(plantilla_id: str) -> Dict:
+    return {**TEXTOS_FIJOS_DEFECTO, **_plantilla(plantilla_id)["textos_fijos"]}
+
+# Capas por delegación: base compartida + diferencias. El resultado compuesto se cachea por
+# (plantilla, firma, hash de la capa); las preguntas que la capa no toca son las de la base.
+@st.cache_resource(ttl=CACHE_TTL_S, max_entries=CACHE_MAX_CAPAS, show_spinner=False)
+def _capa_por_hash(plantilla_id: str, firma: tuple, hash_capa: str, _capa: Dict) -> MappingProxyType:
+    preguntas, textos, avisos = capas.componer(_plantilla(plantilla_id)["preguntas"], _textos_base(plantilla_id), _capa)
+    return MappingProxyType({
+        "preguntas": tuple(
+            q if isinstance(q, MappingProxyType)
+            else _congelar({**q, "qid": q.get("qid") or plantillas.qid_plantilla(plantilla_id, q["name"])})
+            for q in preguntas
+        ),
+        "textos_fijos": _congelar(textos),
+        "avisos": tuple(avisos),
+    })
+
+def _capa_compuesta(capa: Dict) -> MappingProxyType:
+    plantilla_id = (capa.get("base") or {}).get("id") or plantillas.PLANTILLA_DEFAULT
+    if plantilla_id not in plantillas.disponibles():
+        raise ValueError(f"La capa usa la plantilla '{plantilla_id}', que no está en el registro.")
+    return _capa_por_hash(plantilla_id, plantillas.firma(plantilla_id), capas.hash_capa(capa), capa)
+
+def _capa_actual(nombre: str) -> Dict:
+    """Capa (solo diferencias) del proyecto actual respecto de su plantilla."""
+    pl = st.session_state.plantilla
+    base = _plantilla(pl["id"])
+    capa = {
+        "tipo": capas.TIPO_CAPA,
+        "nombre": nombre,
+        "base": {"id": pl["id"], "version": base["version"]},
+        "operaciones": capas.derivar(base["preguntas"], _textos_base(pl["id"]),
+                                     st.session_state.preguntas, st.session_state.textos_fijos),
+    }
+    for k in ("reglas_visibilidad", "reglas_finalizar"):
+        if st.session_state[k]:
+            capa[k] = list(st.session_state[k])
+    return capa
+
+# Memoria de traducción compartida por idioma (plantillas/traducciones/<idioma>.json); la
+# del proyecto (st.session_state.traducciones) la sobrescribe texto a texto
+@st.cache_resource(ttl=CACHE_TTL_S, max_entries=CACHE_MAX_MEMORIAS, show_spinner=False)
+def _memoria_por_firma(idioma: str, firma: tuple) -> MappingProxyType:
+    return MappingProxyType(traducciones.leer_memoria_compartida(idioma))
+
+def _memoria(idioma: str) -> Dict[str, str]:
+    propia = st.session_state.get("traducciones", {}).get(idioma) or {}
+    return {**_memoria_por_firma(idioma, traducciones.firma(idioma)), **propia}
+
 # ------------------------------------------------------------------------------------------
 # Estado base (session_state)
 # ------------------------------------------------------------------------------------------
@@ -174,12 +345,22 @@ if "reglas_visibilidad" not in st.session_state:
     st.session_state.reglas_visibilidad = []
 if "reglas_finalizar" not in st.session_state:
     st.session_state.reglas_finalizar = []
-
-# ✅ Textos fijos editables (Matriz 9 Comercio)
+# Memoria de traducción del proyecto: {idioma: {hash del texto fuente: traducción}}
+if "traducciones" not in st.session_state:
+    st.session_state.traducciones = {}
+# Presupuestos de complejidad propios del proyecto (solo los que cambian el valor base)
+if "presupuestos" not in st.session_state:
+    st.session_state.presupuestos = {}
+# División automática de páginas que se pasan del presupuesto (al compilar el XLSForm)
+if "dividir_paginas" not in st.session_state:
+    st.session_state.dividir_paginas = False
+
+# ✅ Textos fijos editables (Matriz 9 Comercio, introducción)
+TEXTOS_FIJOS_DEFECTO = {
+    "matriz_9_label_comercio": "9. En términos de seguridad, indique qué tan seguros percibe los siguientes espacios alrededor de su comercio."
+}
 if "textos_fijos" not in st.session_state:
-    st.session_state.textos_fijos = {
-        "matriz_9_label_comercio": "9. En términos de seguridad, indique qué tan seguros percibe los siguientes espacios alrededor de su comercio."
-    }
+    st.session_state.textos_fijos = dict(TEXTOS_FIJOS_DEFECTO)
 
 # Editor: solo una pregunta abierta a la vez (por qid estable)
 if "edit_qid" not in st.session_state:
@@ -192,6 +373,23 @@ with st.expander("✏️ Textos fijos (editables)", expanded=False):
         value=st.session_state.textos_fijos.get("matriz_9_label_comercio", ""),
         key="txt_matriz9_comercio"
     )
+    for _mid in matrices.nombres(st.session_state.get("preguntas", [])):
+        if _mid != matrices.MATRIZ_9:
+            st.session_state.textos_fijos[matrices.clave_texto(_mid)] = st.text_input(
+                f"Encabezado de la matriz `{_mid}`",
+                value=st.session_state.textos_fijos.get(matrices.clave_texto(_mid), ""),
+                key=f"txt_matriz_{_mid}"
+            )
+    _intro_propia = st.text_area(
+        "Texto de introducción (portada)",
+        value=st.session_state.textos_fijos.get("intro_comercio", ""),
+        key="txt_intro_comercio", height=100,
+        help="Vacío = texto de introducción estándar."
+    ).strip()
+    if _intro_propia:
+        st.session_state.textos_fijos["intro_comercio"] = _intro_propia
+    else:
+        st.session_state.textos_fijos.pop("intro_comercio", None)
 
 # ------------------------------------------------------------------------------------------
 # Catálogo manual por lotes: Cantón → Distritos
@@ -205,6 +403,8 @@ def _append_choice_unique(row: Dict):
     key = (row.get("list_name"), row.get("name"))
     exists = any((r.get("list_name"), r.get("name")) == key for r in st.session_state.choices_ext_rows)
     if not exists:
+        if not isinstance(st.session_state.choices_ext_rows, list):
+            st.session_state.choices_ext_rows = list(st.session_state.choices_ext_rows)
         st.session_state.choices_ext_rows.append(row)
 
 def _asegurar_placeholders_catalogo():
@@ -280,6 +480,7 @@ with st.expander("Agrega un lote (un Cantón y varios Distritos)", expanded=True
             st.success(f"Lote agregado: {c} → {len(distritos)} distritos.")
             _rerun()
 
+_t_fase = _fase_ini()
 if st.session_state.choices_ext_rows:
     st.dataframe(
         pd.DataFrame(st.session_state.choices_ext_rows),
@@ -287,28 +488,54 @@ if st.session_state.choices_ext_rows:
         hide_index=True,
         height=240
     )
+_fase_fin("catalogo_render", _t_fase, filas=len(st.session_state.choices_ext_rows))
 
 # ------------------------------------------------------------------------------------------
 # Cabecera: Logo + Delegación
 # ------------------------------------------------------------------------------------------
 DEFAULT_LOGO_PATH = "001.png"
+CACHE_MEDIOS_MAX_BYTES = 16 * 1024 * 1024
+
+@st.cache_resource(show_spinner=False)
+def _cache_medios() -> cache_compartido.CacheLRUBytes:
+    return cache_compartido.CacheLRUBytes(CACHE_MEDIOS_MAX_BYTES)
+
+def _logo_procesado(datos: bytes):
+    """(bytes, info) del logo reducido para campo; una vez por contenido (entre sesiones)."""
+    clave = f"logo:{medios.hash_bytes(datos)}:{medios.MAX_LADO_DEFAULT}:{medios.PRESUPUESTO_BYTES_DEFAULT}"
+    hit = _cache_medios().get(clave)
+    if hit is None:
+        hit = medios.procesar_imagen(datos)
+        _cache_medios().put(clave, hit, len(hit[0]))
+    return hit
+
+def _leer_logo_defecto():
+    try:
+        with open(DEFAULT_LOGO_PATH, "rb") as fh:
+            return fh.read()
+    except OSError:
+        return None
 
 col_logo, col_txt = st.columns([1, 3], vertical_alignment="center")
 with col_logo:
     up_logo = st.file_uploader("Logo (PNG/JPG)", type=["png", "jpg", "jpeg"], key="uploader_logo")
-    if up_logo:
-        st.image(up_logo, caption="Logo cargado", use_container_width=True)
-        st.session_state["_logo_bytes"] = up_logo.getvalue()
-        st.session_state["_logo_name"] = up_logo.name
+    _logo_src = up_logo.getvalue() if up_logo else _leer_logo_defecto()
+    if _logo_src is not None:
+        _logo_bytes, _logo_info = _logo_procesado(_logo_src)
+        st.session_state["_logo_bytes"] = _logo_bytes
+        st.session_state["_logo_hash"] = _logo_info["hash"]
+        st.session_state["_logo_name"] = up_logo.name if up_logo else "001.png"
+        st.image(_logo_bytes, caption=("Logo cargado" if up_logo else "Logo (001.png)"), use_container_width=True)
+        if _logo_info.get("procesada"):
+            st.caption(
+                f"Reducido para campo: {_logo_info['bytes_original'] / 1024:.0f} KB → "
+                f"{_logo_info['bytes'] / 1024:.0f} KB ({_logo_info['dimensiones'][0]}×{_logo_info['dimensiones'][1]} px)"
+            )
     else:
-        try:
-            st.image(DEFAULT_LOGO_PATH, caption="Logo (001.png)", use_container_width=True)
-            st.session_state["_logo_bytes"] = None
-            st.session_state["_logo_name"] = "001.png"
-        except Exception:
-            st.warning("Sube un logo para incluirlo en el XLSForm.")
-            st.session_state["_logo_bytes"] = None
-            st.session_state["_logo_name"] = "logo.png"
+        st.warning("Sube un logo para incluirlo en el XLSForm.")
+        st.session_state["_logo_bytes"] = None
+        st.session_state.pop("_logo_hash", None)
+        st.session_state["_logo_name"] = "logo.png"
 
 with col_txt:
     st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
@@ -402,867 +629,396 @@ INTRO_INFO_ADICIONAL_CONTACTO = (
     "para continuar colaborando de manera confidencial con Fuerza Pública. La información suministrada será tratada con confidencialidad."
 )
 
+# ------------------------------------------------------------------------------------------
+# Proyecto (dict serializable) ⇄ session_state
+# ------------------------------------------------------------------------------------------
+def _proyecto_actual(idioma: str, version: str) -> Dict:
+    return {
+        "idioma": idioma,
+        "version": version,
+        "preguntas": st.session_state.preguntas,  # incluye qid
+        "reglas_visibilidad": st.session_state.reglas_visibilidad,
+        "reglas_finalizar": st.session_state.reglas_finalizar,
+        "choices_ext_rows": st.session_state.choices_ext_rows,
+        "choices_extra_cols": sorted(st.session_state.choices_extra_cols),
+        "textos_fijos": st.session_state.textos_fijos,
+        "version_contador": st.session_state.get("version_contador", {"n": 0, "hash": None}),
+        "plantilla": st.session_state.get("plantilla"),
+        "idiomas_extra": list(st.session_state.get("sb_idiomas_extra", [])),
+        "traducciones": st.session_state.traducciones,
+        "presupuestos": st.session_state.presupuestos,
+        "dividir_paginas": st.session_state.dividir_paginas,
+    }
+
+def _aplicar_proyecto(data: Dict):
+    preguntas = list(data.get("preguntas", []))
+    # Proyecto creado desde una plantilla: se pone al día con su versión actual
+    plantilla = dict(data["plantilla"]) if data.get("plantilla") else None
+    if plantilla and plantilla.get("id") in plantillas.disponibles():
+        vigente = _plantilla(plantilla["id"])
+        if int(plantilla.get("version") or 1) < vigente["version"]:
+            preguntas, agregadas = plantillas.actualizar(preguntas, vigente, int(plantilla.get("version") or 1))
+            if agregadas:
+                st.session_state.setdefault("_avisos_import", []).append(
+                    f"Plantilla '{vigente['nombre']}' actualizada a v{vigente['version']}: "
+                    f"{len(agregadas)} preguntas agregadas ({', '.join(agregadas)})."
+                )
+            plantilla["version"] = vigente["version"]
+    st.session_state.plantilla = plantilla
+    # Proyectos guardados en SQLite antes de que la matriz fuera un tipo (el archivo lo migra formato_proyecto)
+    st.session_state.preguntas = [ensure_qid(q) for q in matrices.marcar_legadas(preguntas)]
+
+    st.session_state.reglas_visibilidad = list(data.get("reglas_visibilidad", []))
+    st.session_state.reglas_finalizar = list(data.get("reglas_finalizar", []))
+    st.session_state.choices_ext_rows = _catalogo_compartido(data.get("choices_ext_rows", []))
+    st.session_state.choices_extra_cols = set(data.get("choices_extra_cols", []))
+    st.session_state.textos_fijos = dict(data.get("textos_fijos", st.session_state.textos_fijos))
+    if data.get("version_contador"):
+        st.session_state.version_contador = dict(data["version_contador"])
+    if "traducciones" in data:
+        st.session_state.traducciones = {i: dict(m) for i, m in (data["traducciones"] or {}).items()}
+    st.session_state.presupuestos = dict(data.get("presupuestos") or {})
+    st.session_state.dividir_paginas = bool(data.get("dividir_paginas"))
+    if "idiomas_extra" in data:
+        # El multiselect ya existe en este rerun: se aplica al inicio del siguiente
+        st.session_state["_idiomas_pendientes"] = list(data["idiomas_extra"] or [])
+
+    st.session_state.edit_qid = None
+    for _k in [k for k in st.session_state if str(k).startswith(("txt_matriz9_comercio", "txt_matriz_"))]:
+        st.session_state.pop(_k, None)
+    for _k in [k for k in st.session_state if str(k).startswith("pres_")]:
+        st.session_state.pop(_k, None)
+    st.session_state.pop("chk_dividir_paginas", None)
+    st.session_state.pop("txt_intro_comercio", None)
+    _asegurar_placeholders_catalogo()
+
+def _proyecto_desde_capa(capa: Dict) -> Dict:
+    """Proyecto = plantilla vigente + capa. Catálogo y logo se conservan de la sesión."""
+    comp = _capa_compuesta(capa)
+    plantilla_id = (capa.get("base") or {}).get("id") or plantillas.PLANTILLA_DEFAULT
+    st.session_state.setdefault("_avisos_import", []).append(
+        f"Capa «{capa.get('nombre') or 'sin nombre'}» aplicada sobre '{plantilla_id}': "
+        f"{len(capa.get('operaciones', []))} operaciones."
+    )
+    st.session_state["_avisos_import"].extend(comp["avisos"])
+    return {
+        "preguntas": list(comp["preguntas"]),
+        "plantilla": {"id": plantilla_id, "version": _plantilla(plantilla_id)["version"]},
+        "textos_fijos": dict(comp["textos_fijos"]),
+        "reglas_visibilidad": list(capa.get("reglas_visibilidad", [])),
+        "reglas_finalizar": list(capa.get("reglas_finalizar", [])),
+        "choices_ext_rows": st.session_state.choices_ext_rows,
+        "choices_extra_cols": st.session_state.choices_extra_cols,
+    }
+
+def _db_conn():
+    if "_db_conn" not in st.session_state:
+        st.session_state["_db_conn"] = almacen_proyectos.conectar(almacen_proyectos.DB_PATH_DEFAULT)
+    return st.session_state["_db_conn"]
+
 # ------------------------------------------------------------------------------------------
 # Sidebar: Exportar/Importar proyecto (JSON) + Config
 # ------------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------------
+# Versión derivada del contenido (settings.version)
+# ------------------------------------------------------------------------------------------
+MODOS_VERSION = ["Contenido (hash)", "Contador + hash", "Manual"]
+
+if "version_contador" not in st.session_state:
+    st.session_state.version_contador = {"n": 0, "hash": None}
+
+def _resolver_version(modo: str, hash_contenido: str, manual: str) -> str:
+    """
+    Contenido (hash): primeros 10 hex del hash de survey/choices.
+    Contador + hash: N.hash8, donde N es el de la última descarga del XLSForm; si el contenido
+    cambió desde entonces se propone N+1, que solo queda fijo al descargar (_confirmar_version).
+    """
+    if modo == "Manual":
+        return manual
+    if modo == "Contador + hash":
+        vc = st.session_state.version_contador
+        n = int(vc.get("n") or 0)
+        return f"{n if vc.get('hash') == hash_contenido else n + 1}.{hash_contenido[:8]}"
+    return hash_contenido[:10]
+
+def _confirmar_version(modo: str, hash_contenido: str):
+    """on_click de las descargas del XLSForm / ZIP: fija el N con el que salió el archivo."""
+    vc = st.session_state.version_contador
+    if modo == "Contador + hash" and vc.get("hash") != hash_contenido:
+        st.session_state.version_contador = {"n": int(vc.get("n") or 0) + 1, "hash": hash_contenido}
+
+if "_historial" not in st.session_state:
+    st.session_state["_historial"] = historial.nuevo_historial()
+
+_PROY_GRANDES = ("preguntas", "reglas_visibilidad", "reglas_finalizar", "choices_ext_rows", "traducciones")
+
+def _filas_estado(proy: Dict) -> Dict:
+    """
+    Filas del proyecto (almacen_proyectos.filas_proyecto). Solo se serializa de nuevo si cambió la huella: token de
+    mutación, identidad / largo de las listas grandes y el resto del proyecto (chico, se
+    compara completo: textos fijos, meta). El catálogo se reutiliza si es la misma lista.
+    Sin cambios devuelve el mismo objeto: quien ya lo procesó lo reconoce por identidad.
+    """
+    ss = st.session_state
+    huella = (
+        ss.get("_mut", 0), ss.get("_proy_id"),
+        tuple((id(proy.get(k)), len(proy.get(k) or ())) for k in _PROY_GRANDES),
+        json.dumps({k: v for k, v in proy.items() if k not in _PROY_GRANDES}, ensure_ascii=False,
+                   sort_keys=True, default=_json_default),
+    )
+    previo = ss.get("_filas_huella")
+    if previo is not None and previo[0] == huella:
+        return previo[1]
+    t0 = _fase_ini()
+    catalogo = (id(proy.get("choices_ext_rows")), len(proy.get("choices_ext_rows") or ()))
+    filas = almacen_proyectos.filas_proyecto(
+        proy, base=previo[1] if previo else None,
+        reutilizar=("catalogo",) if previo is not None and previo[2] == catalogo else (),
+    )
+    if t0 is not None:
+        _fase_fin("filas_proyecto", t0, preguntas=len(filas["preguntas"]))
+    ss["_filas_huella"] = (huella, filas, catalogo)
+    return filas
+
+def _hash_preguntas(preguntas) -> str:
+    """
+    Hash de contenido de las preguntas, para las claves de la caché de compilados. Sale de las
+    filas que ya serializó el historial (una por pregunta, más el orden) si son de esta misma
+    lista y token de mutación; si no, se serializan aquí. Se guarda hasta el próximo cambio.
+    """
+    ss = st.session_state
+    huella = (ss.get("_mut", 0), ss.get("_proy_id"), (id(preguntas), len(preguntas)))
+    previo = ss.get("_preguntas_hash")
+    if previo is not None and previo[0] == huella:
+        return previo[1]
+    historial_filas = ss.get("_filas_huella")
+    if historial_filas is not None and historial_filas[0][:2] == huella[:2] and historial_filas[0][2][0] == huella[2]:
+        filas = historial_filas[1]
+    else:
+        filas = almacen_proyectos.filas_proyecto({"preguntas": preguntas})
+    h = hashlib.sha256(filas["orden"]["preguntas"][1].encode("utf-8"))
+    for _, fila in filas["preguntas"].values():
+        h.update(fila.encode("utf-8"))
+    ss["_preguntas_hash"] = (huella, h.hexdigest())
+    return ss["_preguntas_hash"][1]
+
+def _registrar_historial(filas: Dict):
+    if st.session_state.get("_filas_historial") is not filas:
+        historial.registrar(st.session_state["_historial"], filas)
+        st.session_state["_filas_historial"] = filas
+
+# Cambios del rerun anterior (acciones que terminan en _rerun): se registran antes de dibujar
+# Deshacer / Rehacer, así el botón ya está habilitado justo después de la acción. En el primer
+# rerun el head lo fija el final del script (la semilla aún no está cargada aquí).
+if st.session_state["_historial"]["head"] is not None:
+    _registrar_historial(_filas_estado(_proyecto_actual(*st.session_state.get("_proy_meta_fin", ("es", "")))))
+
 with st.sidebar:
     st.header("⚙️ Configuración")
+
+    # --------------------------------------------------------------------------------------
+    # Deshacer / Rehacer
+    # --------------------------------------------------------------------------------------
+    _hist = st.session_state["_historial"]
+    historial.ajustar_profundidad(
+        _hist,
+        int(st.session_state.get("sb_hist_prof", historial.PROFUNDIDAD_DEFAULT))
+    )
+    col_u, col_r = st.columns(2)
+    if col_u.button("↩️ Deshacer", use_container_width=True, key="btn_undo", disabled=not _hist["undo"]):
+        res = historial.deshacer(_hist)
+        if res:
+            _aplicar_proyecto(res[0])
+            st.session_state["_toast_hist"] = f"Deshecho: {res[1]}"
+            _rerun()
+    if col_r.button("↪️ Rehacer", use_container_width=True, key="btn_redo", disabled=not _hist["redo"]):
+        res = historial.rehacer(_hist)
+        if res:
+            _aplicar_proyecto(res[0])
+            st.session_state["_toast_hist"] = f"Rehecho: {res[1]}"
+            _rerun()
+    if st.session_state.get("_toast_hist"):
+        st.caption(st.session_state.pop("_toast_hist"))
+    st.number_input("Pasos de deshacer (máx.)", min_value=1, max_value=500,
+                    value=historial.PROFUNDIDAD_DEFAULT, step=10, key="sb_hist_prof")
+    st.markdown("---")
     _ = st.text_input(
         "Título del formulario (referencia)",
         value=(f"Encuesta comercio – {delegacion.strip()}" if delegacion.strip() else "Encuesta comercio"),
         key="sb_form_title_ref"
     )
     idioma = st.selectbox("Idioma por defecto (default_language)", options=["es", "en"], index=0, key="sb_idioma")
-    version_auto = datetime.now().strftime("%Y%m%d%H%M")
-    version = st.text_input("Versión (settings.version)", value=version_auto, key="sb_version")
+    if "_idiomas_pendientes" in st.session_state:
+        st.session_state["sb_idiomas_extra"] = [
+            i for i in st.session_state.pop("_idiomas_pendientes") if i in traducciones.IDIOMAS
+        ]
+    idiomas_extra = st.multiselect(
+        "Idiomas adicionales (label::idioma)",
+        options=[i for i in traducciones.IDIOMAS if i != traducciones.IDIOMA_FUENTE],
+        format_func=traducciones.nombre_idioma, key="sb_idiomas_extra",
+        help="Agrega columnas por idioma al XLSForm (etiquetas, opciones, notas y mensajes). "
+             "Las traducciones salen de la memoria de traducción; lo que falte queda en español."
+    )
+    modo_version = st.selectbox(
+        "Versión (settings.version)",
+        options=MODOS_VERSION,
+        index=0,
+        key="sb_modo_version",
+        help="Por contenido: la versión solo cambia si cambia lo que se publica (survey/choices)."
+    )
+    if modo_version == "Manual":
+        version_auto = datetime.now().strftime("%Y%m%d%H%M")
+        version = st.text_input("Versión manual", value=version_auto, key="sb_version")
+    else:
+        # Se resuelve tras compilar (hash del contenido): lo que la usa en este panel (exportar,
+        # guardar) se dibuja en su lugar pero se ejecuta después, con la versión ya resuelta
+        version = ""
+
+    st.markdown("---")
+    st.caption("🧩 Plantilla de encuesta")
+    _ids_plantilla = plantillas.disponibles()
+    _pl_actual = st.session_state.get("plantilla") or {}
+    if _ids_plantilla:
+        sel_plantilla = st.selectbox(
+            "Plantilla", options=_ids_plantilla,
+            index=_ids_plantilla.index(_pl_actual["id"]) if _pl_actual.get("id") in _ids_plantilla else 0,
+            format_func=lambda i: i.capitalize(), key="sb_plantilla", label_visibility="collapsed"
+        )
+        if _pl_actual.get("id"):
+            st.caption(f"Proyecto basado en «{_plantilla(_pl_actual['id'])['nombre']}» v{_pl_actual.get('version')}")
+        if st.button("Cargar plantilla", use_container_width=True, key="btn_plantilla",
+                     help="Reemplaza las preguntas y reglas por las de la plantilla (conserva catálogo y logo)."):
+            _preg_pl, _meta_pl = _instanciar_plantilla(sel_plantilla)
+            _aplicar_proyecto({
+                "preguntas": _preg_pl,
+                "plantilla": _meta_pl,
+                "choices_ext_rows": st.session_state.choices_ext_rows,
+                "choices_extra_cols": st.session_state.choices_extra_cols,
+                "textos_fijos": {**st.session_state.textos_fijos, **_plantilla(sel_plantilla)["textos_fijos"]},
+            })
+            _rerun()
+        if _pl_actual.get("id") and st.button(
+                "Exportar capa (delegación)", use_container_width=True, key="btn_export_capa",
+                help="Solo las diferencias con la plantilla (preguntas, opciones, textos y reglas). "
+                     "Se importa como un proyecto."):
+            _capa_json = json.dumps(_capa_actual(delegacion.strip()), ensure_ascii=False, indent=2,
+                                    default=_json_default)
+            st.download_button(
+                "Descargar capa (JSON)",
+                data=_capa_json.encode("utf-8"),
+                file_name=f"capa_{slugify_name(delegacion or 'comercio')}.json",
+                mime="application/json",
+                use_container_width=True,
+                key="btn_export_capa_descargar",
+            )
 
     st.markdown("---")
     st.caption("💾 Exporta/Importa tu proyecto (JSON)")
     col_exp, col_imp = st.columns(2)
 
-    if col_exp.button("Exportar proyecto (JSON)", use_container_width=True, key="btn_export_json"):
-        proj = {
-            "idioma": idioma,
-            "version": version,
-            "preguntas": st.session_state.preguntas,  # incluye qid
-            "reglas_visibilidad": st.session_state.reglas_visibilidad,
-            "reglas_finalizar": st.session_state.reglas_finalizar,
-            "choices_ext_rows": st.session_state.choices_ext_rows,
-            "choices_extra_cols": list(st.session_state.choices_extra_cols),
-            "textos_fijos": st.session_state.textos_fijos,
-        }
-        jbuf = BytesIO(json.dumps(proj, ensure_ascii=False, indent=2).encode("utf-8"))
-        st.download_button(
-            "Descargar JSON",
-            data=jbuf,
-            file_name="proyecto_encuesta_comercio.json",
-            mime="application/json",
-            use_container_width=True
-        )
+    _sb_exportar = col_exp.container()
 
-    up = col_imp.file_uploader("Importar JSON", type=["json"], label_visibility="collapsed", key="uploader_json")
-    if up is not None:
+    up = col_imp.file_uploader("Importar proyecto (JSON / .ecproj) o XLSForm (.xlsx)",
+                               type=["json", formato_proyecto.EXTENSION, "xlsx"],
+                               label_visibility="collapsed", key="uploader_json")
+    # El uploader conserva el archivo entre reruns: sin esta marca, cada rerun (cualquier clic)
+    # volvía a importarlo y pisaba lo editado después. Se importa una vez por archivo subido
+    # (file_id cambia al subirlo de nuevo, aunque sea el mismo archivo)
+    if up is not None and st.session_state.get("_import_file_id") != up.file_id:
         try:
-            raw = up.read().decode("utf-8")
-            data = json.loads(raw)
-
-            preguntas = list(data.get("preguntas", []))
-            st.session_state.preguntas = [ensure_qid(q) for q in preguntas]
+            if up.name.lower().endswith(".xlsx"):
+                data, avisos = importar_xlsform.leer_xlsform(up, slugify_name)
+                st.session_state["_avisos_import"] = (
+                    [f"XLSForm importado: {len(data['preguntas'])} preguntas, "
+                     f"{len(data['choices_ext_rows'])} filas de catálogo"
+                     + (f" ({data['form_title']})." if data.get("form_title") else ".")] + avisos
+                )
+            else:
+                # Una capa no es un proyecto: se lee aparte, sin las migraciones de proyecto
+                capa = capas.leer_capa(up.getvalue())
+                data = (_proyecto_desde_capa(capa) if capa is not None
+                        else formato_proyecto.leer_proyecto(up))
+            _aplicar_proyecto(data)
+            st.session_state["_import_file_id"] = up.file_id
+            _rerun()
+        except Exception as e:
+            st.error(f"No se pudo importar el proyecto: {e}")
+    for _aviso in st.session_state.pop("_avisos_import", []):
+        st.caption(f"📥 {_aviso}")
 
-            st.session_state.reglas_visibilidad = list(data.get("reglas_visibilidad", []))
-            st.session_state.reglas_finalizar = list(data.get("reglas_finalizar", []))
-            st.session_state.choices_ext_rows = list(data.get("choices_ext_rows", []))
-            st.session_state.choices_extra_cols = set(data.get("choices_extra_cols", []))
-            st.session_state.textos_fijos = dict(data.get("textos_fijos", st.session_state.textos_fijos))
+    # --------------------------------------------------------------------------------------
+    # Proyectos locales (SQLite): autoguardado incremental + historial de versiones
+    # --------------------------------------------------------------------------------------
+    st.markdown("---")
+    st.caption("🗄️ Proyectos locales (SQLite)")
+    _conn = _db_conn()
 
-            st.session_state.edit_qid = None
-            _asegurar_placeholders_catalogo()
+    proy_nombre = st.text_input(
+        "Nombre del proyecto",
+        value=st.session_state.get("_proy_nombre") or "",
+        key="sb_proy_nombre"
+    )
+    st.checkbox("Autoguardado", value=True, key="sb_autosave",
+                help="Tras cada cambio se escriben solo las filas modificadas (preguntas, reglas, catálogo, textos).")
+
+    _sb_guardar = st.container()
+    for _aviso in st.session_state.pop("_avisos_db", []):
+        st.success(_aviso)
+
+    proyectos_db = almacen_proyectos.listar_proyectos(_conn)
+    if proyectos_db:
+        por_id = {p["id"]: p for p in proyectos_db}
+        sel_pid = st.selectbox(
+            "Proyectos guardados",
+            options=list(por_id),
+            format_func=lambda i: f"{por_id[i]['nombre']} · {por_id[i]['actualizado']} · {por_id[i]['versiones']} versiones",
+            key="sb_proy_sel"
+        )
+        if st.button("Abrir proyecto", use_container_width=True, key="btn_db_abrir"):
+            data, hashes = almacen_proyectos.cargar_proyecto(_conn, sel_pid)
+            _aplicar_proyecto(data)
+            st.session_state["_proy_id"] = sel_pid
+            st.session_state["_proy_nombre"] = por_id[sel_pid]["nombre"]
+            st.session_state["_proy_hashes"] = hashes
             _rerun()
-        except Exception as e:
-            st.error(f"No se pudo importar el JSON: {e}")
+
+    if st.session_state.get("_proy_id"):
+        versiones_db = almacen_proyectos.listar_versiones(_conn, st.session_state["_proy_id"])
+        if versiones_db:
+            por_num = {v["numero"]: v for v in versiones_db}
+            sel_ver = st.selectbox(
+                "Historial de versiones",
+                options=list(por_num),
+                format_func=lambda n: f"v{n} · {por_num[n]['creado']} · {por_num[n]['bytes']} B"
+                                      + (" · completo" if por_num[n]["completo"] else ""),
+                key="sb_ver_sel"
+            )
+            if st.button("Restaurar versión", use_container_width=True, key="btn_db_restaurar"):
+                _aplicar_proyecto(almacen_proyectos.reconstruir_version(_conn, st.session_state["_proy_id"], sel_ver))
+                _rerun()
 
 # ============================ FIN PARTE 1 / 5 ============================================
 # ================================ PARTE 2 / 5 ============================================
 # (Continuación exacta)
 # Aquí agregamos:
-# ✅ Precarga (seed) COMPLETA de preguntas (hasta 35)
-# ✅ Incluye la NUEVA pregunta 15 (inversión social) con “Otro” → texto
-# ✅ Incluye la NUEVA última página: Información Adicional y Contacto Voluntario (33–35)
+# ✅ Precarga de preguntas desde la plantilla (plantillas/comercio.json, preguntas 1–35)
 # ✅ Mantiene qid estable, slugify, y relevant correcto para “Otro” y para 33.1
 
 # ------------------------------------------------------------------------------------------
-# Precarga limpia de preguntas (seed) — COMERCIO (1..35)
+# Precarga de preguntas desde la plantilla por defecto (ver _plantilla)
+# Todas las sesiones referencian las mismas preguntas y copian solo las que editan
+# (ver _q_editable).
 # ------------------------------------------------------------------------------------------
+_t_fase = _fase_ini()
 if "seed_cargado" not in st.session_state:
-    v_muy_inseguro = slugify_name("Muy inseguro")
-    v_inseguro = slugify_name("Inseguro")
-
-    SLUG_SI = slugify_name("Sí")
-    SLUG_NO = slugify_name("No")
-
-    # LISTA COMPARTIDA para matriz (table-list)
-    LISTA_MATRIZ_COM = "list_matriz_comercio"
-
-    seed = [
-        # ---------------- Consentimiento ----------------
-        {"tipo_ui": "Selección única",
-         "label": "¿Acepta participar en esta encuesta?",
-         "name": "consentimiento",
-         "required": True,
-         "opciones": ["Sí", "No"],
-         "appearance": "horizontal",
-         "choice_filter": None,
-         "relevant": None},
-
-        # ---------------- I. DATOS DEMOGRÁFICOS ----------------
-        {"tipo_ui": "Selección única", "label": "1. Cantón:", "name": "canton", "required": True,
-         "opciones": [], "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Selección única", "label": "2. Distrito:", "name": "distrito", "required": True,
-         "opciones": [], "appearance": None, "choice_filter": "canton_key=${canton}", "relevant": None},
-
-        {"tipo_ui": "Selección única",
-         "label": "3. Edad (en años cumplidos): marque una categoría que incluya su edad.",
-         "name": "edad_rango",
-         "required": True,
-         "opciones": ["18 a 29 años", "30 a 44 años", "45 a 64 años", "65 años o más"],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Selección única",
-         "label": "4. ¿Con cuál de estas opciones se identifica?",
-         "name": "genero",
-         "required": True,
-         "opciones": ["Femenino", "Masculino", "Persona no Binaria", "Prefiero no decir"],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Selección única",
-         "label": "5. Escolaridad:",
-         "name": "escolaridad",
-         "required": True,
-         "opciones": [
-             "Ninguna",
-             "Primaria incompleta",
-             "Primaria completa",
-             "Secundaria incompleta",
-             "Secundaria completa",
-             "Técnico",
-             "Universitaria incompleta",
-             "Universitaria completa",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        # ✅ 6 - Tipo de local comercial
-        {"tipo_ui": "Selección única",
-         "label": "6. Tipo de local comercial",
-         "name": "tipo_local_comercial",
-         "required": True,
-         "opciones": [
-             "Supermercado",
-             "Pulpería / Licorera",
-             "Restaurante / Soda",
-             "Bar",
-             "Tienda de artículos",
-             "Gasolinera",
-             "Servicios estéticos",
-             "Puesto de lotería",
-             "Ferretería",
-             "Otro",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro tipo de local comercial:",
-         "name": "tipo_local_comercial_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"${{tipo_local_comercial}}='{slugify_name('Otro')}'"},
-
-        # ---------------- II. PERCEPCIÓN COMERCIO (7–10) ----------------
-        {"tipo_ui": "Selección única",
-         "label": "7. ¿Qué tan seguro percibe usted el entorno en su local comercial?",
-         "name": "percep_seg_local",
-         "required": True,
-         "opciones": ["Muy inseguro", "Inseguro", "Ni seguro ni inseguro", "Seguro", "Muy seguro"],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "7.1. Indique por qué considera inseguro el entorno del local comercial (Marque todos los que apliquen):",
-         "name": "motivos_inseguridad_local",
-         "required": True,
-         "opciones": [
-             "Venta de drogas",
-             "Consumo de drogas",
-             "Consumo de alcohol en vía pública",
-             "Riñas o peleas",
-             "Asaltos",
-             "Robos o tachas",
-             "Extorsiones o amenazas",
-             "Daños a la propiedad",
-             "Vandalismo",
-             "Ventas informales desordenadas",
-             "Presencia de personas en situación de calle que influye en su percepción de seguridad",
-             "Presencia de personas en situación de ocio (sin actividad laboral o educativa)",
-             "Intentos de cobro ilegal o exigencias indebidas a comercios",
-             "Otro",
-         ],
-         "appearance": "columns",
-         "choice_filter": None,
-         "relevant": xlsform_or_expr([
-             f"${{percep_seg_local}}='{v_muy_inseguro}'",
-             f"${{percep_seg_local}}='{v_inseguro}'"
-         ])},
-
-        {"tipo_ui": "Párrafo (texto largo)",
-         "label": "Indique cuál es ese otro motivo:",
-         "name": "motivos_inseguridad_local_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": "multiline",
-         "choice_filter": None,
-         "relevant": f"selected(${{motivos_inseguridad_local}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección única",
-         "label": "8. ¿En comparación con los 12 meses anteriores, cómo percibe que ha cambiado la seguridad en los alrededores del lugar comercial?",
-         "name": "cambio_seguridad_12m_comercio",
-         "required": True,
-         "opciones": ["Mucho menos seguro (1)", "Menos seguro (2)", "Se mantiene igual (3)", "Más seguro (4)", "Mucho más seguro (5)"],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Párrafo (texto largo)",
-         "label": "8.1. Indique por qué (explique brevemente la razón de su respuesta anterior):",
-         "name": "motivo_cambio_12m_comercio",
-         "required": True,
-         "opciones": [],
-         "appearance": "multiline",
-         "choice_filter": None,
-         "relevant": "string-length(${cambio_seguridad_12m_comercio})>0"},
-
-        # 9 MATRIZ (table-list)
-        {"tipo_ui": "Selección única", "label": "Afuera del comercio", "name": "seg_afuera_comercio",
-         "required": True,
-         "opciones": ["Muy inseguro (1)", "Inseguro (2)", "Ni seguro ni inseguro (3)", "Seguro (4)", "Muy seguro (5)", "No aplica"],
-         "appearance": None, "choice_filter": None, "relevant": None, "list_override": LISTA_MATRIZ_COM},
-
-        {"tipo_ui": "Selección única", "label": "Pasillos / aceras comerciales", "name": "seg_pasillos_aceras",
-         "required": True,
-         "opciones": ["Muy inseguro (1)", "Inseguro (2)", "Ni seguro ni inseguro (3)", "Seguro (4)", "Muy seguro (5)", "No aplica"],
-         "appearance": None, "choice_filter": None, "relevant": None, "list_override": LISTA_MATRIZ_COM},
-
-        {"tipo_ui": "Selección única", "label": "Parqueos", "name": "seg_parqueos",
-         "required": True,
-         "opciones": ["Muy inseguro (1)", "Inseguro (2)", "Ni seguro ni inseguro (3)", "Seguro (4)", "Muy seguro (5)", "No aplica"],
-         "appearance": None, "choice_filter": None, "relevant": None, "list_override": LISTA_MATRIZ_COM},
-
-        {"tipo_ui": "Selección única", "label": "Paradas de bus", "name": "seg_paradas_bus",
-         "required": True,
-         "opciones": ["Muy inseguro (1)", "Inseguro (2)", "Ni seguro ni inseguro (3)", "Seguro (4)", "Muy seguro (5)", "No aplica"],
-         "appearance": None, "choice_filter": None, "relevant": None, "list_override": LISTA_MATRIZ_COM},
-
-        {"tipo_ui": "Selección única", "label": "Calles cercanas", "name": "seg_calles_cercanas",
-         "required": True,
-         "opciones": ["Muy inseguro (1)", "Inseguro (2)", "Ni seguro ni inseguro (3)", "Seguro (4)", "Muy seguro (5)", "No aplica"],
-         "appearance": None, "choice_filter": None, "relevant": None, "list_override": LISTA_MATRIZ_COM},
-
-        {"tipo_ui": "Selección única",
-         "label": "10. Desde su percepción, ¿en qué lugar se concentra principalmente la inseguridad alrededor de su comercio?",
-         "name": "foco_inseguridad_comercio",
-         "required": True,
-         "opciones": [
-             "Zonas residenciales cercanas (calles y barrios)",
-             "Paradas, estaciones y transporte público",
-             "Espacios recreativos (parques y plazas)",
-             "Centros educativos",
-             "Lugares de entretenimiento (bares, discotecas y similares)",
-             "Lugares de interés turístico",
-             "Alrededores inmediatos del comercio",
-             "Zona bancaria",
-             "Otro (especifique)",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro lugar:",
-         "name": "foco_inseguridad_comercio_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"${{foco_inseguridad_comercio}}='{slugify_name('Otro (especifique)')}'"},
-
-        # ---------------- III. RIESGOS (11–17) ----------------
-        {"tipo_ui": "Selección múltiple",
-         "label": "11. ¿En qué horarios percibe mayor inseguridad en el entorno comercial donde se ubica su comercio?",
-         "name": "horarios_inseguridad_comercio",
-         "required": True,
-         "opciones": ["Mañana", "Tarde", "Noche", "Madrugada"],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "12. Seleccione las problemáticas que, según su observación, afectan la zona comercial donde se ubica su comercio:",
-         "name": "problematicas_zona_comercial",
-         "required": True,
-         "opciones": [
-             "Presencia de personas en situación de calle (personas que viven permanentemente en la vía pública)",
-             "Actividades sexuales comerciales en el entorno",
-             "Consumo de alcohol en vía pública",
-             "Consumo de drogas",
-             "Acumulación de basura / aguas negras / alcantarillado deficiente",
-             "Falta o deficiencia de alumbrado público",
-             "Lotes baldíos y edificaciones abandonadas",
-             "Ventas informales (ambulantes)",
-             "Sitios de reciclaje o compra de chatarra (chatarreras)",
-             "Intentos de cobro ilegal o exigencias indebidas en la zona comercial",
-             "Otro",
-             "No se observan en el lugar comercial",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro problema:",
-         "name": "problematicas_zona_comercial_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{problematicas_zona_comercial}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "13. En los casos en que se observa consumo de drogas en los alrededores del local comercial, indique dónde ocurre (Marque todas las que observe):",
-         "name": "consumo_drogas_donde_comercio",
-         "required": True,
-         "opciones": [
-             "Área pública (calle, aceras, alrededores del local)",
-             "Área semipública (parques, lotes abandonados)",
-             "No se observa consumo",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro lugar:",
-         "name": "consumo_drogas_donde_comercio_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{consumo_drogas_donde_comercio}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "14. Indique las principales deficiencias de infraestructura vial que afectan el entorno del local comercial:",
-         "name": "infra_vial_deficiencias_comercio",
-         "required": True,
-         "opciones": [
-             "Calles en mal estado",
-             "Falta de señalización",
-             "Falta o deterioro de aceras",
-             "No se observan deficiencias.",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es esa otra deficiencia:",
-         "name": "infra_vial_deficiencias_comercio_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{infra_vial_deficiencias_comercio}}, '{slugify_name('Otro')}')"},
-
-        # ✅ NUEVA 15 (Inversión social) + Otro→texto
-        {"tipo_ui": "Selección múltiple",
-         "label": "15. Desde su experiencia en el entorno del local comercial, indique cuáles situaciones considera que hacen falta para fortalecer la convivencia y el uso positivo del espacio público cercano (inversión social):",
-         "name": "inv_social_necesidades",
-         "required": True,
-         "opciones": [
-             "Falta de actividades deportivas en la zona",
-             "Falta de actividades recreativas",
-             "Falta de actividades culturales",
-             "Pocas opciones educativas cercanas",
-             "No se observa falta de inversión",
-             "Otro aspecto",
-         ],
-         "appearance": "columns",
-         "choice_filter": None,
-         "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro aspecto que considera importante:",
-         "name": "inv_social_necesidades_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None,
-         "choice_filter": None,
-         "relevant": f"selected(${{inv_social_necesidades}}, '{slugify_name('Otro aspecto')}')"},
-
-        # (ANTES 15) → ahora 16
-        {"tipo_ui": "Selección múltiple",
-         "label": "16. Según su conocimiento u observación, indique si ha identificado situaciones de inseguridad asociadas al transporte en los alrededores de su comercio (Marque todas las que correspondan):",
-         "name": "inseguridad_transporte_comercio",
-         "required": True,
-         "opciones": [
-             "Transporte informal o no autorizado (taxis piratas)",
-             "Plataformas de transporte digital que se estacionan de forma indebida u obstruyen el paso",
-             "Paradas de bus cercanas percibidas como inseguras",
-             "Servicios de reparto o mensajería (motocicleta, bicimoto) asociados a situaciones de riesgo",
-             "Otro tipo de situación relacionada con el transporte",
-             "No se observan situaciones de inseguridad asociadas al transporte",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro tipo de situación relacionada con el transporte:",
-         "name": "inseguridad_transporte_comercio_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{inseguridad_transporte_comercio}}, '{slugify_name('Otro tipo de situación relacionada con el transporte')}')"},
-
-        # (ANTES 16) → ahora 17
-        {"tipo_ui": "Selección única",
-         "label": "17. ¿Con qué frecuencia observa presencia policial en el entorno del local comercial?",
-         "name": "frecuencia_presencia_policial_comercio",
-         "required": True,
-         "opciones": ["Todos los días", "Varias veces por semana", "Una vez por semana", "Casi nunca", "Nunca"],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        # ===================== DELITOS (18–22) =====================
-        {"tipo_ui": "Selección múltiple",
-         "label": "18. Selección múltiple de delitos:",
-         "name": "delitos_observados_zona",
-         "required": True,
-         "opciones": [
-             "Disturbios en vía pública (riñas o agresiones)",
-             "Daños a la propiedad (viviendas, comercios, vehículos u otros bienes)",
-             "Extorsión (amenazas o intimidación para exigir cobro de dinero u otros beneficios de manera ilegal a comercios)",
-             "Hurto (sustracción de artículos mediante el descuido)",
-             "Compra o venta de artículos robados (receptación)",
-             "Contrabando (licor, cigarrillos, medicinas, ropa, calzado, etc.)",
-             "Maltrato animal",
-             "Otro",
-             "No se observan delitos",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro delito:",
-         "name": "delitos_observados_zona_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{delitos_observados_zona}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "19. Según su conocimiento u observación, ¿de qué forma se presenta la venta de drogas en los alrededores de local comercial?",
-         "name": "venta_drogas_forma",
-         "required": True,
-         "opciones": [
-             "En espacios cerrados (casas, edificaciones u otros inmuebles)",
-             "En vía pública",
-             "De forma ocasional o móvil modalidad exprés (sin punto fijo)",
-             "No se observa venta de drogas",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es esa otra forma:",
-         "name": "venta_drogas_forma_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{venta_drogas_forma}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "20. Asaltos:",
-         "name": "asaltos_tipologia",
-         "required": True,
-         "opciones": [
-             "Asalto a personas",
-             "Asalto a comercios",
-             "Asalto en transporte público",
-             "Otro",
-             "No se observan asaltos",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro tipo de asalto:",
-         "name": "asaltos_tipologia_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{asaltos_tipologia}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "21. Estafas que afectan al comercio",
-         "name": "estafas_tipologia",
-         "required": True,
-         "opciones": [
-             "Billetes falsos",
-             "Documentos falsos",
-             "Estafas con oro",
-             "Estafas con lotería",
-             "Estafas informáticas",
-             "Estafa telefónica",
-             "Estafa con tarjetas",
-             "Otro",
-             "No se observan estafas",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es esa otra estafa:",
-         "name": "estafas_tipologia_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{estafas_tipologia}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "22. Robos (Sustracción mediante la utilización de la fuerza)",
-         "name": "robos_tipologia",
-         "required": True,
-         "opciones": [
-             "Robo a comercios",
-             "Robo a edificaciones (bodegas, locales cerrados)",
-             "Robo a viviendas cercanas al comercio",
-             "Robo de vehículos completos",
-             "Robo a vehículos (tacha o sustracción de partes)",
-             "Robo de cable",
-             "Otro",
-             "No se observan robos",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro robo:",
-         "name": "robos_tipologia_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{robos_tipologia}}, '{slugify_name('Otro')}')"},
-
-        # ---------------- VICTIMIZACIÓN (23–24.1) ----------------
-        {"tipo_ui": "Selección única",
-         "label": "23. Durante los últimos 12 meses, ¿su local comercial fue afectado por algún delito?",
-         "name": "victima_12m",
-         "required": True,
-         "opciones": ["No", "Sí, y denuncié", "Sí, pero no denuncié."],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        # 23.1 por BLOQUES A/B/C/D (cada bloque es su select_multiple + Otro→texto)
-        {"tipo_ui": "Selección múltiple",
-         "label": "A. Robo y Asalto (Violencia y Fuerza)",
-         "name": "victima_22_1_a",
-         "required": True,
-         "opciones": [
-             "Asalto a mano armada (amenaza con arma o uso de violencia) en la calle o espacio público.",
-             "Asalto en el transporte público (bus, taxi, metro, etc.).",
-             "Asalto o robo de su vehículo (coche, motocicleta, etc.).",
-             "Robo de accesorios o partes de su vehículo (espejos, llantas, radio).",
-             "Robo o intento de robo con fuerza a su comercio (ej. forzar una puerta o ventana).",
-             "Robo o intento de robo con fuerza a su comercio o negocio.",
-             "No aplica.",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro delito (Bloque A):",
-         "name": "victima_22_1_a_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{victima_22_1_a}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "B. Hurto y Daños (Sin Violencia Directa)",
-         "name": "victima_22_1_b",
-         "required": True,
-         "opciones": [
-             "Hurto de su cartera, bolso o celular (sin que se diera cuenta, por descuido).",
-             "Daños a su propiedad (ej. grafitis, rotura de cristales, destrucción de cercas).",
-             "Compra o venta de artículos robados (receptación)",
-             "Pérdida de artículos (celular, bicicleta, etc.) por descuido.",
-             "No aplica.",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro delito (Bloque B):",
-         "name": "victima_22_1_b_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{victima_22_1_b}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "C. Fraude y Engaño (Estafas)",
-         "name": "victima_22_1_c",
-         "required": True,
-         "opciones": [
-             "Estafa telefónica (ej. llamadas para pedir dinero o datos personales).",
-             "Estafa o fraude informático (ej. a través de internet, redes sociales o correo electrónico).",
-             "Fraude con tarjetas bancarias (clonación o uso no autorizado).",
-             "Ser víctima de billetes o documentos falsos.",
-             "No aplica.",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro delito (Bloque C):",
-         "name": "victima_22_1_c_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{victima_22_1_c}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "D. Otros Delitos y Problemas Personales",
-         "name": "victima_22_1_d",
-         "required": True,
-         "opciones": [
-             "Extorsión (intimidación o amenaza para obtener dinero u otro beneficio).",
-             "Maltrato animal (si usted o alguien de su hogar fue testigo o su mascota fue la víctima).",
-             "Acoso o intimidación sexual en un espacio público.",
-             "Algún tipo de delito sexual (abuso, violación).",
-             "Lesiones personales (haber sido herido en una riña o agresión).",
-             "Violencia Intrafamiliar (violencia domestica)",
-             "No aplica.",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro delito (Bloque D):",
-         "name": "victima_22_1_d_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{victima_22_1_d}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "23.2 En caso de NO haber realizado la denuncia ante el OIJ, indique cuál fue el motivo:",
-         "name": "motivo_no_denuncia",
-         "required": True,
-         "opciones": [
-             "Distancia o dificultad de acceso a oficinas para denunciar",
-             "Miedo a represalias.",
-             "Falta de respuesta o seguimiento en denuncias anteriores",
-             "Complejidad o dificultad para realizar la denuncia (trámites, requisitos, tiempo)",
-             "Desconocimiento de dónde colocar la denuncia (falta de información)",
-             "El Policía me dijo que era mejor no denunciar.",
-             "Falta de tiempo para colocar la denuncia",
-             "Desconfianza en las autoridades o en el proceso de denuncia",
-             "Otro",
-         ],
-         "appearance": None, "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro motivo:",
-         "name": "motivo_no_denuncia_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{motivo_no_denuncia}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección única",
-         "label": "23.3 ¿Tiene conocimiento del horario en el cual se presentó el hecho delictivo que afectó a su local comercial o a personas vinculadas a su actividad comercial?",
-         "name": "horario_hecho_delictivo",
-         "required": True,
-         "opciones": [
-             "00:00 – 02:59 (madrugada)",
-             "03:00 – 05:59 (madrugada)",
-             "06:00 – 08:59 (mañana)",
-             "09:00 – 11:59 (mañana)",
-             "12:00 – 14:59 (mediodía / tarde)",
-             "15:00 – 17:59 (tarde)",
-             "18:00 – 20:59 (noche)",
-             "21:00 – 23:59 (noche)",
-             "Desconocido",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "24. ¿Cuál fue la forma o modo en que ocurrió la situación que afectó a su local comercial?",
-         "name": "modo_ocurrio_hecho",
-         "required": True,
-         "opciones": [
-             "Arma blanca (cuchillo, machete, tijeras).",
-             "Arma de fuego.",
-             "Amenazas",
-             "Arrebato",
-             "Boquete",
-             "Ganzúa (pata de chancho)",
-             "Engaño",
-             "No sé.",
-             "Otro",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro modo:",
-         "name": "modo_ocurrio_hecho_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{modo_ocurrio_hecho}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "24.1 Incidentes de inseguridad asociados a la operación del comercio",
-         "name": "incidentes_operacion_comercio",
-         "required": True,
-         "opciones": [
-             "Riñas o disturbios dentro del local",
-             "Riñas o disturbios en las inmediaciones del comercio",
-             "Agresiones físicas al personal del comercio",
-             "Amenazas verbales al personal",
-             "Ingreso de personas en estado de ebriedad o bajo efectos de drogas que generaron conflictos",
-             "Daños ocasionados por clientes o terceros",
-             "Ninguno de los anteriores",
-             "Otro",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es ese otro incidente:",
-         "name": "incidentes_operacion_comercio_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{incidentes_operacion_comercio}}, '{slugify_name('Otro')}')"},
-
-        # ---------------- PROPUESTAS (25–26) ----------------
-        {"tipo_ui": "Selección múltiple",
-         "label": "25. ¿Qué actividad considera que deba realizar la Fuerza Pública para mejorar la seguridad en zona comercial?",
-         "name": "propuesta_fp",
-         "required": True,
-         "opciones": [
-             "Mayor presencia policial y patrullaje",
-             "Acciones disuasivas en puntos conflictivos",
-             "Acciones contra consumo y venta de drogas",
-             "Mejorar el servicio policial de la zona comercial",
-             "Acercamiento comercial",
-             "Actividades de prevención y educación",
-             "Coordinación interinstitucional",
-             "Integridad y credibilidad policial",
-             "Otro",
-             "No indica",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es esa otra actividad (Fuerza Pública):",
-         "name": "propuesta_fp_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{propuesta_fp}}, '{slugify_name('Otro')}')"},
-
-        {"tipo_ui": "Selección múltiple",
-         "label": "26. ¿Qué actividad considera que deba realizar la municipalidad para mejorar la seguridad en zona comercial?",
-         "name": "propuesta_muni",
-         "required": True,
-         "opciones": [
-             "Mantenimiento e iluminación del espacio público en áreas comerciales",
-             "Limpieza, recolección de desechos y ordenamiento urbano",
-             "Instalación de cámaras municipales y vigilancia en puntos comerciales",
-             "Control de ventas informales y ocupación indebida del espacio público",
-             "Regulación del transporte informal y mejora de paradas de bus",
-             "Mejoramiento de aceras, calles y espacios públicos del casco comercial",
-             "Coordinación interinstitucional con Fuerza Pública y otras entidades",
-             "Acercamiento y comunicación directa con las personas comerciantes",
-             "Otro",
-             "No indica",
-         ],
-         "appearance": "columns", "choice_filter": None, "relevant": None},
-
-        {"tipo_ui": "Texto (corto)",
-         "label": "Indique cuál es esa otra actividad (Municipalidad):",
-         "name": "propuesta_muni_otro",
-         "required": True,
-         "opciones": [],
-         "appearance": None, "choice_filter": None,
-         "relevant": f"selected(${{propuesta_muni}}, '{slugify_name('Otro')}')"},
-
-        # ---------------- CONFIANZA POLICIAL (27–32) ----------------
-        {"tipo_ui": "Selección única",
-         "label": "27. ¿Cómo ha sido el servicio policial de Fuerza Pública de Costa Rica en los últimos 24 meses?",
-         "name": "servicio_policial_24m",
-         "required": True,
-         "opciones": ["Mejor servicio", "Igual", "Peor servicio"],
-         "appearance": "horizontal",
-         "choice_filter": None,
-         "relevant": None},
-
-        {"tipo_ui": "Selección única",
-         "label": "28. ¿Conoce usted a los policías de la Fuerza Pública de Costa Rica de su zona comercial?",
-         "name": "conoce_policias_zona",
-         "required": True,
-         "opciones": ["Sí", "No"],
-         "appearance": "horizontal",
-         "choice_filter": None,
-         "relevant": None},
-
-        {"tipo_ui": "Selección única",
-         "label": "29. ¿Conoce el programa de \"Seguridad Comercial\" que imparte Fuerza Pública?",
-         "name": "conoce_programa_seg_com",
-         "required": True,
-         "opciones": ["Sí", "No"],
-         "appearance": "horizontal",
-         "choice_filter": None,
-         "relevant": None},
-
-        {"tipo_ui": "Selección única",
-         "label": "30. ¿Está inscrito en el programa de \"Seguridad Comercial\" que imparte Fuerza Pública?",
-         "name": "inscrito_programa_seg_com",
-         "required": True,
-         "opciones": ["Sí", "No"],
-         "appearance": "horizontal",
-         "choice_filter": None,
-         "relevant": f"${{conoce_programa_seg_com}}='{SLUG_SI}'"},
-
-        {"tipo_ui": "Selección única",
-         "label": "31. ¿Le gustaría que se le contacte para formar parte del programa?",
-         "name": "quiere_contacto_programa",
-         "required": True,
-         "opciones": ["Sí", "No"],
-         "appearance": "horizontal",
-         "choice_filter": None,
-         "relevant": None},
-
-        {"tipo_ui": "Párrafo (texto largo)",
-         "label": "32. Si su respuesta es afirmativa, indicar nombre del comercio, correo electrónico y número de teléfono para contactarlo(a)",
-         "name": "datos_contacto_programa",
-         "required": True,
-         "opciones": [],
-         "appearance": "multiline",
-         "choice_filter": None,
-         "relevant": f"${{quiere_contacto_programa}}='{SLUG_SI}'"},
-
-        # ===================== INFORMACIÓN ADICIONAL Y CONTACTO VOLUNTARIO (33–35) =====================
-        {"tipo_ui": "Selección única",
-         "label": "33. ¿Usted tiene información de alguna persona o grupo que se dedique a realizar algún delito en la zona comercial?",
-         "name": "info_persona_grupo_delito",
-         "required": True,
-         "opciones": ["Sí", "No"],
-         "appearance": "horizontal",
-         "choice_filter": None,
-         "relevant": None},
-
-        {"tipo_ui": "Párrafo (texto largo)",
-         "label": "33.1. Si su respuesta es \"SI\", describa aquellas características que pueda aportar tales como nombre de estructura o banda criminal... (nombre de personas, alias, domicilio, vehículos, etc.)",
-         "name": "info_persona_grupo_delito_detalle",
-         "required": True,
-         "opciones": [],
-         "appearance": "multiline",
-         "choice_filter": None,
-         "relevant": f"${{info_persona_grupo_delito}}='{SLUG_SI}'"},
-
-        {"tipo_ui": "Párrafo (texto largo)",
-         "label": "34. En el siguiente espacio de forma voluntaria podrá anotar su nombre, teléfono o correo electrónico en el cual desee ser contactado y continuar colaborando de forma confidencial con Fuerza Pública.",
-         "name": "contacto_voluntario",
-         "required": False,
-         "opciones": [],
-         "appearance": "multiline",
-         "choice_filter": None,
-         "relevant": None},
-
-        {"tipo_ui": "Párrafo (texto largo)",
-         "label": "35. En el siguiente espacio podrá registrar alguna otra información que estime pertinente.",
-         "name": "info_adicional",
-         "required": False,
-         "opciones": [],
-         "appearance": "multiline",
-         "choice_filter": None,
-         "relevant": None},
-    ]
-
-    st.session_state.preguntas = [ensure_qid(q) for q in seed]
+    st.session_state.preguntas, st.session_state.plantilla = _instanciar_plantilla(plantillas.PLANTILLA_DEFAULT)
     st.session_state.seed_cargado = True
 
-# Asegurar qid también si ya existían preguntas en session_state
-st.session_state.preguntas = [ensure_qid(q) for q in st.session_state.preguntas]
+# Asegurar qid también si ya existían preguntas en session_state (la lista se reemplaza solo si
+# falta alguno: su identidad es parte de la huella del historial)
+if any(not q.get("qid") for q in st.session_state.preguntas):
+    st.session_state.preguntas = [ensure_qid(q) for q in st.session_state.preguntas]
+_fase_fin("seed", _t_fase, preguntas=len(st.session_state.preguntas))
 
 # ============================ FIN PARTE 2 / 5 ============================================
 
@@ -1280,7 +1036,7 @@ st.session_state.preguntas = [ensure_qid(q) for q in st.session_state.preguntas]
 st.subheader("📝 Diseña tus preguntas")
 
 with st.form("form_add_q", clear_on_submit=False):
-    tipo_ui = st.selectbox("Tipo de pregunta", options=TIPOS, key="add_tipo")
+    tipo_ui = st.selectbox("Tipo de pregunta", options=TIPOS + [matrices.TIPO_MATRIZ], key="add_tipo")
     label = st.text_input("Etiqueta (texto exacto)", key="add_label")
     sugerido = slugify_name(label) if label else ""
     col_n1, col_n2, col_n3 = st.columns([2, 1, 1])
@@ -1289,15 +1045,38 @@ with st.form("form_add_q", clear_on_submit=False):
     appearance = col_n3.text_input("Appearance (opcional)", value="", key="add_appearance")
 
     opciones = []
-    if tipo_ui in ("Selección única", "Selección múltiple"):
-        st.markdown("**Opciones (una por línea)**")
+    if tipo_ui in ("Selección única", "Selección múltiple", matrices.TIPO_MATRIZ):
+        st.markdown("**Opciones (una por línea)**" if tipo_ui != matrices.TIPO_MATRIZ
+                    else "**Opciones / columnas de la matriz (una por línea, compartidas por todas las filas)**")
         txt_opts = st.text_area("Opciones", height=120, key="add_opts")
         if txt_opts.strip():
             opciones = [o.strip() for o in txt_opts.splitlines() if o.strip()]
 
+    filas_matriz = []
+    if tipo_ui == matrices.TIPO_MATRIZ:
+        txt_filas = st.text_area("Filas de la matriz (una por línea)", height=120, key="add_filas")
+        filas_matriz = [f.strip() for f in txt_filas.splitlines() if f.strip()]
+        matriz_multiple = st.checkbox("Varias respuestas por fila (select_multiple)", value=False, key="add_matriz_mult")
+
     add = st.form_submit_button("➕ Agregar pregunta")
 
-if add:
+if add and tipo_ui == matrices.TIPO_MATRIZ:
+    if not label.strip() or not filas_matriz or not opciones:
+        st.warning("Una matriz necesita encabezado (etiqueta), filas y opciones.")
+    else:
+        usados = {q["name"] for q in st.session_state.preguntas}
+        matriz = asegurar_nombre_unico(slugify_name(name or label), usados | set(matrices.nombres(st.session_state.preguntas)))
+        nuevas = matrices.crear_filas(
+            matriz, filas_matriz, opciones,
+            "Selección múltiple" if matriz_multiple else "Selección única", required,
+            slugify_name, asegurar_nombre_unico, usados,
+        )
+        st.session_state.preguntas.extend(ensure_qid(q) for q in nuevas)
+        st.session_state.textos_fijos[matrices.clave_texto(matriz)] = label.strip()
+        st.session_state.edit_qid = None
+        st.success(f"Matriz agregada: **{label}** ({len(nuevas)} filas, lista `{matrices.lista(matriz)}`)")
+        _rerun()
+elif add:
     if not label.strip():
         st.warning("Agrega una etiqueta.")
     else:
@@ -1323,6 +1102,32 @@ if add:
 # ------------------------------------------------------------------------------------------
 # Lista / Ordenado / Edición (completa) — editor por qid estable
 # ------------------------------------------------------------------------------------------
+# Índice de reglas (por id / target / fuente) y lo que hay que revisar frente al formulario
+# actual. El índice vive en la sesión y lo mantienen reglas.agregar / reglas.quitar; se rehace
+# solo si las listas se reemplazaron (abrir, importar, deshacer). La validación sí corre en
+# cada rerun: editar opciones marca al instante las reglas afectadas
+def _slugs_opciones(q: Dict):
+    """Names de las opciones tal como los genera la compilación; None si no hay lista que validar."""
+    if q["name"] in {"canton", "distrito"} or not q.get("opciones"):
+        return None
+    return slugs_opciones(tuple(q["opciones"]))
+
+def _indice_reglas() -> Dict:
+    ss = st.session_state
+    vis, fin = ss.reglas_visibilidad, ss.reglas_finalizar
+    guardado = ss.get("_indice_reglas")
+    if (guardado is None or guardado["vis"] is not vis or guardado["fin"] is not fin
+            or reglas.cantidad(guardado["indice"]) != len(vis) + len(fin)):
+        guardado = {"vis": vis, "fin": fin, "indice": reglas.indexar(vis, fin)}
+        ss["_indice_reglas"] = guardado
+    return guardado["indice"]
+
+_t_fase = _fase_ini()
+indice_reglas = _indice_reglas()
+problemas_reglas = reglas.problemas(indice_reglas, st.session_state.preguntas, _slugs_opciones)
+_fase_fin("indice_reglas", _t_fase, reglas=len(indice_reglas["por_id"]), a_revisar=len(problemas_reglas))
+
+_t_fase = _fase_ini()
 st.subheader("📚 Preguntas (ordénalas y edítalas)")
 
 if not st.session_state.preguntas:
@@ -1345,10 +1150,16 @@ else:
                 meta += f"  •  relevant: `{q['relevant']}`"
             if q.get("list_override"):
                 meta += f"  •  list_override: `{q['list_override']}`"
+            if q.get("matriz"):
+                meta += f"  •  matriz: `{q['matriz']}`"
             c1.caption(meta)
 
             if q["tipo_ui"] in ("Selección única", "Selección múltiple"):
                 c1.caption("Opciones: " + ", ".join(q.get("opciones") or []))
+            n_fuente, n_target = reglas.resumen(problemas_reglas, indice_reglas, q["name"])
+            if n_fuente or n_target:
+                c1.caption(f"⚠️ Reglas a revisar: {n_fuente} la usan como fuente · {n_target} la muestran "
+                           f"(ver Condicionales)")
 
             up_btn = c2.button("⬆️ Subir", key=f"up_{qid}", use_container_width=True, disabled=(idx == 0))
             down_btn = c3.button("⬇️ Bajar", key=f"down_{qid}", use_container_width=True, disabled=(idx == len(st.session_state.preguntas) - 1))
@@ -1402,15 +1213,21 @@ else:
                     usados = {qq["name"] for j, qq in enumerate(st.session_state.preguntas) if j != cur_idx}
                     ne_name_final = new_base if new_base not in usados else asegurar_nombre_unico(new_base, usados)
 
-                    st.session_state.preguntas[cur_idx]["label"] = ne_label.strip() or q["label"]
-                    st.session_state.preguntas[cur_idx]["name"] = ne_name_final
-                    st.session_state.preguntas[cur_idx]["required"] = ne_required
-                    st.session_state.preguntas[cur_idx]["appearance"] = ne_appearance.strip() or None
-                    st.session_state.preguntas[cur_idx]["choice_filter"] = ne_choice_filter.strip() or None
-                    st.session_state.preguntas[cur_idx]["relevant"] = ne_relevant.strip() or None
+                    q_ed = _q_editable(cur_idx)
+                    q_ed["label"] = ne_label.strip() or q["label"]
+                    q_ed["name"] = ne_name_final
+                    q_ed["required"] = ne_required
+                    q_ed["appearance"] = ne_appearance.strip() or None
+                    q_ed["choice_filter"] = ne_choice_filter.strip() or None
+                    q_ed["relevant"] = ne_relevant.strip() or None
 
                     if q["tipo_ui"] in ("Selección única", "Selección múltiple"):
-                        st.session_state.preguntas[cur_idx]["opciones"] = ne_opciones
+                        q_ed["opciones"] = ne_opciones
+                        # Matriz: la lista es compartida, las demás filas reciben las mismas opciones
+                        if q.get("matriz") and list(q.get("opciones") or []) != ne_opciones:
+                            for j, qq in enumerate(st.session_state.preguntas):
+                                if j != cur_idx and qq.get("matriz") == q["matriz"]:
+                                    _q_editable(j)["opciones"] = list(ne_opciones)
 
                     st.success("Cambios guardados.")
                     st.session_state.edit_qid = None
@@ -1420,97 +1237,157 @@ else:
                     st.session_state.edit_qid = None
                     _rerun()
 
+_fase_fin("lista_preguntas", _t_fase, preguntas=len(st.session_state.preguntas))
+
 # ------------------------------------------------------------------------------------------
 # Condicionales (panel)
 # ------------------------------------------------------------------------------------------
+_t_fase = _fase_ini()
 st.subheader("🔀 Condicionales (mostrar / finalizar)")
 if not st.session_state.preguntas:
     st.info("Agrega preguntas para definir condicionales.")
 else:
-    # Mostrar
-    with st.expander("👁️ Mostrar pregunta si se cumple condición", expanded=False):
-        names = [q["name"] for q in st.session_state.preguntas]
-        labels_by_name = {q["name"]: q["label"] for q in st.session_state.preguntas}
-
-        target = st.selectbox(
-            "Pregunta a mostrar (target)",
-            options=names,
-            format_func=lambda n: f"{n} — {labels_by_name[n]}",
-            key="vis_target"
-        )
+    names = [q["name"] for q in st.session_state.preguntas]
+    labels_by_name = {q["name"]: q["label"] for q in st.session_state.preguntas}
+
+    def _editor_condicion(prefijo: str, etiqueta_src: str, ops: List[str]):
+        """
+        Condición (src / operador / valores) + borrador de grupos: las condiciones de un grupo se
+        unen con "dentro" y los grupos entre sí con "entre". Devuelve la condición actual o None.
+        """
         src = st.selectbox(
-            "Depende de (source)",
+            etiqueta_src,
             options=names,
             format_func=lambda n: f"{n} — {labels_by_name[n]}",
-            key="vis_src"
+            key=f"{prefijo}_src"
         )
-        op = st.selectbox("Operador", options=["=", "selected"], key="vis_op")
+        op = st.selectbox("Operador", options=ops, format_func=lambda o: f"{o} ({motor_reglas.OPERADORES[o]})",
+                          key=f"{prefijo}_op")
         src_q = next((qq for qq in st.session_state.preguntas if qq["name"] == src), None)
 
-        vals = []
         if src_q and src_q.get("opciones"):
-            vals = st.multiselect("Valores (usa texto, internamente se usará slug)", options=src_q["opciones"], key="vis_vals")
+            vals = st.multiselect("Valores (usa texto, internamente se usará slug)", options=src_q["opciones"], key=f"{prefijo}_vals")
             vals = [slugify_name(v) for v in vals]
         else:
-            manual = st.text_input("Valor (si la pregunta no tiene opciones)", key="vis_manual")
+            manual = st.text_input("Valor (si la pregunta no tiene opciones)", key=f"{prefijo}_manual")
             vals = [slugify_name(manual)] if manual.strip() else []
+        actual = {"src": src, "op": op, "values": vals} if vals else None
+
+        borrador = st.session_state.setdefault(f"_{prefijo}_borrador", [])
+        c_add, c_grupo, c_vaciar = st.columns(3)
+        if c_add.button("➕ Condición al grupo", key=f"btn_{prefijo}_cond", use_container_width=True,
+                        disabled=actual is None):
+            (borrador[-1] if borrador else borrador.append([]) or borrador[-1]).append(actual)
+            _rerun()
+        if c_grupo.button("➕ Nuevo grupo", key=f"btn_{prefijo}_grupo", use_container_width=True,
+                          disabled=actual is None):
+            borrador.append([actual])
+            _rerun()
+        if c_vaciar.button("🗑️ Vaciar borrador", key=f"btn_{prefijo}_vaciar", use_container_width=True,
+                           disabled=not borrador):
+            borrador.clear()
+            _rerun()
+        if borrador:
+            c_d, c_e = st.columns(2)
+            dentro = c_d.selectbox("Dentro de cada grupo", options=list(motor_reglas.GRUPOS),
+                                   format_func=motor_reglas.GRUPOS.get, key=f"{prefijo}_dentro")
+            entre = c_e.selectbox("Entre grupos", options=["o", "y"],
+                                  format_func=motor_reglas.GRUPOS.get, key=f"{prefijo}_entre")
+            st.caption("Borrador: " + motor_reglas.describir(_condicion_borrador(borrador, dentro, entre)) +
+                       " — la condición de arriba (si tiene valores) se suma al último grupo al guardar.")
+        return actual
+
+    def _condicion_borrador(borrador, dentro: str, entre: str) -> Dict:
+        grupos = [g[0] if len(g) == 1 else {"grupo": dentro, "condiciones": list(g)} for g in borrador if g]
+        return grupos[0] if len(grupos) == 1 else {"grupo": entre, "condiciones": grupos}
+
+    def _condicion_a_guardar(prefijo: str, actual):
+        """Condición del borrador (más la actual) o la actual sola; vacía el borrador."""
+        borrador = [list(g) for g in st.session_state.get(f"_{prefijo}_borrador", []) if g]
+        if actual is not None:
+            if borrador:
+                borrador[-1].append(actual)
+            else:
+                borrador = [[actual]]
+        if not borrador:
+            return None
+        st.session_state[f"_{prefijo}_borrador"] = []
+        return _condicion_borrador(borrador, st.session_state.get(f"{prefijo}_dentro", "y"),
+                                   st.session_state.get(f"{prefijo}_entre", "o"))
+
+    def _listar_reglas(tipo: str, texto):
+        """Reglas únicas del tipo (por id), con sus problemas; eliminar quita también las repetidas."""
+        lista = st.session_state[reglas.TIPOS[tipo]]
+        for n, (rid, (t, r)) in enumerate(((k, v) for k, v in indice_reglas["por_id"].items() if v[0] == tipo), 1):
+            st.write(f"{n}. {texto(r)}")
+            for p in problemas_reglas.get(rid, []):
+                st.caption(f"⚠️ {p}")
+            c_del, c_dup = st.columns(2)
+            if c_del.button(f"Eliminar regla #{n}", key=f"del_{tipo}_{rid}"):
+                reglas.quitar(lista, tipo, rid, indice_reglas)
+                _rerun()
+            if rid in indice_reglas["duplicadas"] and c_dup.button("Dejar una sola", key=f"dup_{tipo}_{rid}"):
+                reglas.quitar(lista, tipo, rid, indice_reglas, dejar=1)
+                _rerun()
+
+    if problemas_reglas:
+        st.warning(f"{len(problemas_reglas)} reglas a revisar (detalle en cada listado).")
+
+    # Mostrar
+    with st.expander("👁️ Mostrar pregunta si se cumple condición", expanded=False):
+        target = st.selectbox(
+            "Pregunta a mostrar (target)",
+            options=names,
+            format_func=lambda n: f"{n} — {labels_by_name[n]}",
+            key="vis_target"
+        )
+        actual_vis = _editor_condicion("vis", "Depende de (source)", ["=", "!=", "selected", "!selected"])
 
         if st.button("➕ Agregar regla de visibilidad", key="btn_add_vis"):
-            if target == src:
-                st.error("Target y Source no pueden ser la misma pregunta.")
-            elif not vals:
+            cond = _condicion_a_guardar("vis", actual_vis)
+            if cond is None:
                 st.error("Indica al menos un valor.")
+            elif target in motor_reglas.fuentes(cond):
+                st.error("Target y Source no pueden ser la misma pregunta.")
             else:
-                st.session_state.reglas_visibilidad.append({"target": target, "src": src, "op": op, "values": vals})
-                st.success("Regla agregada.")
-                _rerun()
+                # Una condición simple se guarda en el formato original (src / op / values)
+                regla = {"target": target, **cond} if "grupo" not in cond else {"target": target, "condicion": cond}
+                if reglas.agregar(st.session_state.reglas_visibilidad, "vis", regla, indice_reglas):
+                    st.success("Regla agregada.")
+                    _rerun()
+                else:
+                    st.warning("Esa regla ya existe.")
 
         if st.session_state.reglas_visibilidad:
             st.markdown("**Reglas de visibilidad actuales:**")
-            for i, r in enumerate(st.session_state.reglas_visibilidad):
-                st.write(f"- Mostrar **{r['target']}** si **{r['src']}** {r['op']} {r['values']}")
-                if st.button(f"Eliminar regla #{i+1}", key=f"del_vis_{i}"):
-                    del st.session_state.reglas_visibilidad[i]
-                    _rerun()
+            _listar_reglas("vis", lambda r: f"Mostrar **{r['target']}** si {motor_reglas.describir(r)}")
 
     # Finalizar
     with st.expander("⏹️ Finalizar temprano si se cumple condición", expanded=False):
-        names = [q["name"] for q in st.session_state.preguntas]
-        labels_by_name = {q["name"]: q["label"] for q in st.session_state.preguntas}
-
-        src2 = st.selectbox(
-            "Condición basada en",
-            options=names,
-            format_func=lambda n: f"{n} — {labels_by_name[n]}",
-            key="final_src"
-        )
-        op2 = st.selectbox("Operador", options=["=", "selected", "!="], key="final_op")
-        src2_q = next((qq for qq in st.session_state.preguntas if qq["name"] == src2), None)
-
-        vals2 = []
-        if src2_q and src2_q.get("opciones"):
-            vals2 = st.multiselect("Valores (slug interno)", options=src2_q["opciones"], key="final_vals")
-            vals2 = [slugify_name(v) for v in vals2]
-        else:
-            manual2 = st.text_input("Valor (si no hay opciones)", key="final_manual")
-            vals2 = [slugify_name(manual2)] if manual2.strip() else []
+        actual_fin = _editor_condicion("final", "Condición basada en", ["=", "!=", "selected", "!selected"])
 
         if st.button("➕ Agregar regla de finalización", key="btn_add_fin"):
-            if not vals2:
+            cond = _condicion_a_guardar("final", actual_fin)
+            if cond is None:
                 st.error("Indica al menos un valor.")
             else:
-                idx_src = next((i for i, qq in enumerate(st.session_state.preguntas) if qq["name"] == src2), 0)
-                st.session_state.reglas_finalizar.append({"src": src2, "op": op2, "values": vals2, "index_src": idx_src})
-                st.success("Regla agregada.")
-                _rerun()
+                # Oculta lo que sigue a la última pregunta de la que depende la condición
+                idx_src = max(next((i for i, qq in enumerate(st.session_state.preguntas) if qq["name"] == n), 0)
+                              for n in motor_reglas.fuentes(cond))
+                regla = {**cond} if "grupo" not in cond else {"condicion": cond}
+                if reglas.agregar(st.session_state.reglas_finalizar, "fin", {**regla, "index_src": idx_src},
+                                  indice_reglas):
+                    st.success("Regla agregada.")
+                    _rerun()
+                else:
+                    st.warning("Esa regla ya existe.")
 
         if st.session_state.reglas_finalizar:
             st.markdown("**Reglas de finalización actuales:**")
-            for i, r in enumerate(st.session_state.reglas_finalizar):
-                st.write(f"- Si **{r['src']}** {r['op']} {r['values']} ⇒ ocultar lo que sigue (efecto fin)")
-                if st.button(f"Eliminar regla fin #{i+1}", key=f"del_fin_{i}"):
-                    del st.session_state.reglas_finalizar[i]
-                    _rerun()
+            _listar_reglas("fin", lambda r: f"Si {motor_reglas.describir(r)} ⇒ ocultar lo que sigue (efecto fin)")
+
+_fase_fin("condiciones", _t_fase, reglas_vis=len(st.session_state.reglas_visibilidad),
+          reglas_fin=len(st.session_state.reglas_finalizar))
 
 # ============================ FIN PARTE 3 / 5 ============================================
 # ================================ PARTE 4 / 5 ============================================
@@ -1522,10 +1399,18 @@ else:
 # ==========================================================================================
 
 def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
-                      reglas_vis, reglas_fin):
+                      reglas_vis, reglas_fin, paginado: Optional[Dict[str, int]] = None,
+                      indice: Optional[Dict] = None):
+    """
+    `paginado`: presupuestos de página (complejidad.PRESUPUESTOS) para dividir las páginas que
+    se pasan en sub-páginas; None = una página por sección, como siempre.
+    `indice`: índice de reglas de la sesión (reglas.indexar sobre reglas_vis / reglas_fin); si
+    no se pasa se arma aquí.
+    """
     survey_rows = []
     choices_rows = []
     choices_keys = set()
+    _reg = _perf_registro()
 
     def _choices_add_unique(row: Dict):
         key = (row.get("list_name"), row.get("name"))
@@ -1535,17 +1420,42 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
 
     idx_by_name = {q.get("name"): i for i, q in enumerate(preguntas)}
 
+    # Reglas del panel → nodos del motor de reglas (varias reglas de un mismo target: O; las
+    # repetidas cuentan una vez)
+    if indice is None:
+        indice = reglas.indexar(reglas_vis, reglas_fin)
     vis_by_target = {}
-    for r in reglas_vis:
-        vis_by_target.setdefault(r["target"], []).append(
-            {"src": r["src"], "op": r.get("op", "="), "values": r.get("values", [])}
-        )
+    for target, ids in indice["por_target"].items():
+        for rid in ids:
+            nodo = motor_reglas.desde_regla(indice["por_id"][rid][1])
+            if nodo is not None:
+                vis_by_target.setdefault(target, []).append(nodo)
 
     fin_conds = []
     for r in reglas_fin:
-        cond = build_relevant_expr([{"src": r["src"], "op": r.get("op", "="), "values": r.get("values", [])}])
-        if cond:
-            fin_conds.append((r["index_src"], cond))
+        nodo = motor_reglas.desde_regla(r)
+        if nodo is not None:
+            fin_conds.append((r["index_src"], ("no", nodo)))
+
+    fin_por_conjunto = {}
+
+    # relevant que la estructura de páginas impone a preguntas concretas (no se escribe en `preguntas`).
+    # Cambio de salida: antes se escribía en las preguntas después de armar sus filas, así que
+    # el primer compilado de una sesión salía sin estos relevant y solo el segundo los traía;
+    # ahora están desde el primero. Los proyectos exportados ya no los guardan en sus preguntas
+    relevant_forzado = {}
+
+    def _sumar_constraint(row: Dict, expr: str, mensaje: str):
+        """
+        Suma una condición generada al constraint de la fila, que puede traer el de la pregunta
+        (XLSForm importado). Si ya la contiene (p. ej. reimportar lo exportado), no se repite.
+        """
+        previo = row.get("constraint")
+        if not previo:
+            row["constraint"], row["constraint_message"] = expr, mensaje
+        elif expr not in previo:
+            row["constraint"] = f"({previo}) and ({expr})"
+            row["constraint_message"] = " ".join(m for m in (row.get("constraint_message"), mensaje) if m)
 
     def _aplicar_exclusividad_no_observa(row: Dict, q: Dict):
         if q.get("tipo_ui") != "Selección múltiple":
@@ -1564,10 +1474,10 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
         ex_slug = slugify_name(ex_label)
         nm = q["name"]
 
-        row["constraint"] = f"not(selected(${{{nm}}}, '{ex_slug}') and count-selected(${{{nm}}})>1)"
-        row["constraint_message"] = f"Si selecciona “{ex_label}”, no puede marcar otras opciones."
+        _sumar_constraint(row, f"not(selected(${{{nm}}}, '{ex_slug}') and count-selected(${{{nm}}})>1)",
+                          f"Si selecciona “{ex_label}”, no puede marcar otras opciones.")
 
-    def add_q(q, idx):
+    def add_q(q, idx, hechos=frozenset()):
         x_type, default_app, list_name = map_tipo_to_xlsform(q["tipo_ui"], q["name"])
 
         # Matriz: list_override compartido
@@ -1580,14 +1490,17 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
                 x_type = f"select_multiple {list_override}"
                 list_name = list_override
 
-        rel_manual = q.get("relevant") or None
-        rel_panel = build_relevant_expr(vis_by_target.get(q["name"], []))
-
-        nots = [xlsform_not(cond) for idx_src, cond in fin_conds if idx_src < idx]
-        rel_fin = "(" + " and ".join(nots) + ")" if nots else None
-
-        parts = [p for p in [rel_manual, rel_panel, rel_fin] if p]
-        rel_final = parts[0] if parts and len(parts) == 1 else ("(" + ") and (".join(parts) + ")" if parts else None)
+        # relevant = manual (o forzado por la página) Y panel Y no-finalizado, simplificado
+        # sabiendo lo que ya garantiza el grupo de la página (`hechos`)
+        rel_manual = relevant_forzado.get(q["name"], q.get("relevant")) or None
+        reglas_q = vis_by_target.get(q["name"])
+        rel_panel = ("o", tuple(reglas_q)) if reglas_q else None
+        # Las preguntas seguidas comparten la misma cadena de "no finalizó": se arma una vez
+        aplicables = tuple(i for i, (idx_src, _) in enumerate(fin_conds) if idx_src < idx)
+        if aplicables not in fin_por_conjunto:
+            fin_por_conjunto[aplicables] = ("y", tuple(fin_conds[i][1] for i in aplicables))
+        rel_fin = fin_por_conjunto[aplicables] if aplicables else None
+        rel_final = motor_reglas.combinar(tuple(p for p in (rel_manual, rel_panel, rel_fin) if p), hechos)
 
         row = {"type": x_type, "name": q["name"], "label": q["label"]}
         if q.get("required"):
@@ -1599,15 +1512,17 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
             row["choice_filter"] = q["choice_filter"]
         if rel_final:
             row["relevant"] = rel_final
+        if q.get("constraint"):
+            row["constraint"] = q["constraint"]
+            if q.get("constraint_message"):
+                row["constraint_message"] = q["constraint_message"]
 
         # Constraints placeholders SOLO si NO hay catálogo real
         if not _hay_catalogo_real():
             if q["name"] == "canton":
-                row["constraint"] = ". != '__pick_canton__'"
-                row["constraint_message"] = "Seleccione un cantón válido."
+                _sumar_constraint(row, ". != '__pick_canton__'", "Seleccione un cantón válido.")
             if q["name"] == "distrito":
-                row["constraint"] = ". != '__pick_distrito__'"
-                row["constraint_message"] = "Seleccione un distrito válido."
+                _sumar_constraint(row, ". != '__pick_distrito__'", "Seleccione un distrito válido.")
 
         # Exclusividad "No se observa / No se observan"
         _aplicar_exclusividad_no_observa(row, q)
@@ -1623,13 +1538,15 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
                 usados.add(opt_name)
                 _choices_add_unique({"list_name": list_name, "name": opt_name, "label": str(opt_label)})
 
+    add_q = instrumentacion.envolver(_reg, "construir_xlsform/add_q", add_q)
+
     # --------------------------------------------------------------------------------------
     # Página 1: Intro
     # --------------------------------------------------------------------------------------
     survey_rows += [
         {"type": "begin_group", "name": "p1_intro", "label": "Introducción", "appearance": "field-list"},
         {"type": "note", "name": "intro_logo", "label": form_title, "media::image": _get_logo_media_name()},
-        {"type": "note", "name": "intro_texto", "label": INTRO_COMERCIO},
+        {"type": "note", "name": "intro_texto", "label": st.session_state.textos_fijos.get("intro_comercio") or INTRO_COMERCIO},
         {"type": "end_group", "name": "p1_end"},
     ]
 
@@ -1744,7 +1661,7 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
         "datos_contacto_programa",
     }
 
-    # ✅ ÚLTIMA PÁGINA (32–34)
+    # ✅ ÚLTIMA PÁGINA (33–35)
     p_info_adicional = {
         "info_persona_grupo_delito",
         "info_persona_grupo_delito_detalle",
@@ -1755,32 +1672,90 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
     # --------------------------------------------------------------------------------------
     # Helper de páginas
     # --------------------------------------------------------------------------------------
+    textos_fijos = st.session_state.textos_fijos
+    grupos_matriz = set()  # una matriz partida en dos tramos recibe un segundo nombre de grupo
+
     def add_page(group_name, page_label, names_set, intro_note_text: str = None,
                  group_appearance: str = "field-list", group_relevant: str = None,
                  extra_notes: List[Dict] = None):
+        pos_grupo = len(survey_rows)
         row = {"type": "begin_group", "name": group_name, "label": page_label, "appearance": group_appearance}
         if group_relevant:
             row["relevant"] = group_relevant
         survey_rows.append(row)
+        # Lo que garantiza el relevant del grupo no se repite en sus filas
+        hechos = motor_reglas.conocidos(motor_reglas.parsear(group_relevant)) if group_relevant else frozenset()
 
         if intro_note_text:
-            note = {"type": "note", "name": f"{group_name}_intro", "label": intro_note_text}
-            if group_relevant:
-                note["relevant"] = group_relevant
-            survey_rows.append(note)
+            survey_rows.append({"type": "note", "name": f"{group_name}_intro", "label": intro_note_text})
 
         if extra_notes:
             for nn in extra_notes:
                 nrow = dict(nn)
-                if group_relevant and "relevant" not in nrow:
-                    nrow["relevant"] = group_relevant
+                rel = motor_reglas.combinar((nrow.pop("relevant", None),), hechos)
+                if rel:
+                    nrow["relevant"] = rel
                 survey_rows.append(nrow)
 
+        # Filas consecutivas de una misma matriz → grupo table-list (abre / cierra al vuelo).
+        # `unidades`: dónde empieza cada bloque que no se separa al dividir la página (una
+        # pregunta con su "_otro", o una matriz completa)
+        matriz_abierta = None
+        unidades = []
+        nombres_unidad = set()
         for i, qq in enumerate(preguntas):
-            if qq["name"] in names_set:
-                add_q(qq, i)
+            if qq["name"] not in names_set:
+                continue
+            matriz = qq.get("matriz")
+            sigue = matriz == matriz_abierta and (
+                bool(matriz) or (qq["name"].endswith("_otro") and qq["name"][:-len("_otro")] in nombres_unidad))
+            if not sigue:
+                if matriz_abierta:
+                    survey_rows.append({"type": "end_group", "name": f"{grupo_matriz}_end"})
+                unidades.append(len(survey_rows))
+                nombres_unidad = set()
+                matriz_abierta = matriz
+                if matriz_abierta:
+                    grupo_matriz = asegurar_nombre_unico(matriz_abierta, grupos_matriz)
+                    grupos_matriz.add(grupo_matriz)
+                    survey_rows.append({
+                        "type": "begin_group",
+                        "name": grupo_matriz,
+                        "label": textos_fijos.get(matrices.clave_texto(matriz_abierta)) or matriz_abierta,
+                        "appearance": "table-list",
+                    })
+            nombres_unidad.add(qq["name"])
+            add_q(qq, i, hechos)
+        if matriz_abierta:
+            survey_rows.append({"type": "end_group", "name": f"{grupo_matriz}_end"})
 
         survey_rows.append({"type": "end_group", "name": f"{group_name}_end"})
+        if paginado and unidades:
+            _dividir_pagina(pos_grupo, unidades)
+
+    def _dividir_pagina(pos_grupo: int, unidades: List[int]):
+        """
+        Parte la página que empieza en survey_rows[pos_grupo] en sub-páginas dentro del
+        presupuesto (`paginado`). Cada sub-página repite el relevant del grupo; las notas de
+        introducción quedan con el primer bloque.
+        """
+        fila_grupo = survey_rows[pos_grupo]
+        cuerpo = survey_rows[pos_grupo + 1:-1]
+        cortes = [0] + [u - pos_grupo - 1 for u in unidades[1:]] + [len(cuerpo)]
+        bloques = [cuerpo[a:b] for a, b in zip(cortes, cortes[1:])]
+        tramos = complejidad.repartir([complejidad.costo_filas(b) for b in bloques], paginado)
+        if len(tramos) == 1:
+            return
+        filas = []
+        for k, tramo in enumerate(tramos, start=1):
+            nombre = fila_grupo["name"] if k == 1 else f"{fila_grupo['name']}_{k}"
+            filas.append({**fila_grupo, "name": nombre, "label": f"{fila_grupo['label']} ({k}/{len(tramos)})"})
+            for b in tramo:
+                filas.extend(bloques[b])
+            filas.append({"type": "end_group", "name": f"{nombre}_end"})
+        survey_rows[pos_grupo:] = filas
+
+    add_page = instrumentacion.envolver(_reg, "construir_xlsform/add_page", add_page)
 
     # --------------------------------------------------------------------------------------
     # P3 Demográficos
@@ -1843,10 +1818,31 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
     note_221 = {
         "type": "note",
         "name": "victima_22_1_titulo",
-        "label": "22.1 ¿Cuál fue el delito por el cual su local comercial o personas vinculadas a su actividad comercial resultaron directamente afectadas?",
+        "label": "23.1 ¿Cuál fue el delito por el cual su local comercial o personas vinculadas a su actividad comercial resultaron directamente afectadas?",
         "relevant": rel_221
     }
 
+    def _otro(qname: str, base: str) -> str:
+        return f"{base} and selected(${{{qname}}}, '{slugify_name('Otro')}')"
+
+    relevant_forzado.update({
+        "victima_22_1_a": rel_221,
+        "victima_22_1_a_otro": _otro("victima_22_1_a", rel_221),
+        "victima_22_1_b": rel_221,
+        "victima_22_1_b_otro": _otro("victima_22_1_b", rel_221),
+        "victima_22_1_c": rel_221,
+        "victima_22_1_c_otro": _otro("victima_22_1_c", rel_221),
+        "victima_22_1_d": rel_221,
+        "victima_22_1_d_otro": _otro("victima_22_1_d", rel_221),
+        "motivo_no_denuncia": rel_222,
+        "motivo_no_denuncia_otro": _otro("motivo_no_denuncia", rel_222),
+        "horario_hecho_delictivo": rel_223,
+        "modo_ocurrio_hecho": rel_23,
+        "modo_ocurrio_hecho_otro": _otro("modo_ocurrio_hecho", rel_23),
+        "incidentes_operacion_comercio": rel_231,
+        "incidentes_operacion_comercio_otro": _otro("incidentes_operacion_comercio", rel_231),
+    })
+
     add_page(
         "p7_victimizacion_comercio",
         "Victimización",
@@ -1857,35 +1853,6 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
         extra_notes=[note_221]
     )
 
-    def _set_relevant_force(qname: str, expr: str):
-        for qq in preguntas:
-            if qq.get("name") == qname:
-                qq["relevant"] = expr
-                return
-
-    _set_relevant_force("victima_22_1_a", rel_221)
-    _set_relevant_force("victima_22_1_a_otro", f"{rel_221} and selected(${{victima_22_1_a}}, '{slugify_name('Otro')}')")
-
-    _set_relevant_force("victima_22_1_b", rel_221)
-    _set_relevant_force("victima_22_1_b_otro", f"{rel_221} and selected(${{victima_22_1_b}}, '{slugify_name('Otro')}')")
-
-    _set_relevant_force("victima_22_1_c", rel_221)
-    _set_relevant_force("victima_22_1_c_otro", f"{rel_221} and selected(${{victima_22_1_c}}, '{slugify_name('Otro')}')")
-
-    _set_relevant_force("victima_22_1_d", rel_221)
-    _set_relevant_force("victima_22_1_d_otro", f"{rel_221} and selected(${{victima_22_1_d}}, '{slugify_name('Otro')}')")
-
-    _set_relevant_force("motivo_no_denuncia", rel_222)
-    _set_relevant_force("motivo_no_denuncia_otro", f"{rel_222} and selected(${{motivo_no_denuncia}}, '{slugify_name('Otro')}')")
-
-    _set_relevant_force("horario_hecho_delictivo", rel_223)
-
-    _set_relevant_force("modo_ocurrio_hecho", rel_23)
-    _set_relevant_force("modo_ocurrio_hecho_otro", f"{rel_23} and selected(${{modo_ocurrio_hecho}}, '{slugify_name('Otro')}')")
-
-    _set_relevant_force("incidentes_operacion_comercio", rel_231)
-    _set_relevant_force("incidentes_operacion_comercio_otro", f"{rel_231} and selected(${{incidentes_operacion_comercio}}, '{slugify_name('Otro')}')")
-
     # P8 Propuestas
     add_page(
         "p8_propuestas_comercio",
@@ -1916,43 +1883,28 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
         group_relevant=rel_si
     )
 
-    # --------------------------------------------------------------------------------------
-    # Encapsular matriz 9 en table-list
-    # --------------------------------------------------------------------------------------
-    def _postprocesar_matriz_table_list(df_survey: pd.DataFrame) -> pd.DataFrame:
-        matriz_names = [
-            "seg_afuera_comercio",
-            "seg_pasillos_aceras",
-            "seg_parqueos",
-            "seg_paradas_bus",
-            "seg_calles_cercanas",
-        ]
-        idxs = df_survey.index[df_survey["name"].isin(matriz_names)].tolist()
-        if not idxs:
-            return df_survey
-
-        start = min(idxs)
-        end = max(idxs)
-
-        matriz_label = st.session_state.textos_fijos.get(
-            "matriz_9_label_comercio",
-            "9. En términos de seguridad, indique qué tan seguros percibe los siguientes espacios alrededor de su comercio."
+    # P11+ Preguntas agregadas desde el constructor que no pertenecen a ninguna página fija
+    # (antes quedaban fuera del XLSForm sin aviso)
+    asignadas = {"consentimiento"}.union(
+        p_demograficos, p_percepcion, p_riesgos, p_delitos, p_victimizacion,
+        p_propuestas, p_confianza, p_info_adicional
+    )
+    # Preguntas fuera de las páginas fijas: agrupadas por su página de origen (XLSForm
+    # importado) o, si no la tienen, en "Preguntas adicionales"
+    paginas_extra = {}
+    for qq in preguntas:
+        if qq["name"] not in asignadas:
+            paginas_extra.setdefault(qq.get("pagina") or "Preguntas adicionales", set()).add(qq["name"])
+    for n_pag, (pag_label, pag_names) in enumerate(paginas_extra.items()):
+        add_page(
+            "p11_preguntas_adicionales" if pag_label == "Preguntas adicionales"
+            else f"p{11 + n_pag}_{slugify_name(pag_label)[:40]}",
+            pag_label,
+            pag_names,
+            group_appearance="field-list",
+            group_relevant=rel_si
         )
 
-        begin_row = {
-            "type": "begin_group",
-            "name": "matriz_seguridad_9_comercio",
-            "label": matriz_label,
-            "appearance": "table-list",
-        }
-        end_row = {"type": "end_group", "name": "matriz_seguridad_9_comercio_end"}
-
-        top = df_survey.iloc[:start].copy()
-        mid = df_survey.iloc[start:end + 1].copy()
-        bot = df_survey.iloc[end + 1:].copy()
-
-        return pd.concat([top, pd.DataFrame([begin_row]), mid, pd.DataFrame([end_row]), bot], ignore_index=True)
-
     # --------------------------------------------------------------------------------------
     # Choices del catálogo Cantón/Distrito
     # --------------------------------------------------------------------------------------
@@ -1974,8 +1926,9 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
         if k not in survey_cols:
             survey_cols.append(k)
 
+    t_df = instrumentacion.fase_ini(_reg)
     df_survey = pd.DataFrame(survey_rows, columns=survey_cols)
-    df_survey = _postprocesar_matriz_table_list(df_survey)
+    instrumentacion.fase_fin(_reg, "construir_xlsform/dataframes", t_df)
 
     choices_cols_all = set()
     for r in choices_rows:
@@ -1984,7 +1937,9 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
     for extra in sorted(choices_cols_all):
         if extra not in base_choice_cols:
             base_choice_cols.append(extra)
+    t_df = instrumentacion.fase_ini(_reg)
     df_choices = pd.DataFrame(choices_rows, columns=base_choice_cols) if choices_rows else pd.DataFrame(columns=base_choice_cols)
+    instrumentacion.fase_fin(_reg, "construir_xlsform/dataframes", t_df)
 
     df_settings = pd.DataFrame([{
         "form_title": form_title,
@@ -2001,9 +1956,8 @@ def construir_xlsform(preguntas, form_title: str, idioma: str, version: str,
 # ✅ CONTINUACIÓN EXACTA de tu código (NO CAMBIO nada de lo ya hecho).
 # Esta parte agrega ÚNICAMENTE lo que falta para que TODO funcione:
 # 1) Helper faltante: _get_logo_media_name()
-# 2) ✅ Asegurar que existan las preguntas 32–34 (y 32.1) en el SEED si aún no están
-# 3) Exportar XLSForm (survey/choices/settings) a Excel + botón de descarga
-# 4) Previsualización (dataframes) antes de exportar
+# 2) Exportar XLSForm (survey/choices/settings) a Excel + botón de descarga
+# 3) Previsualización (dataframes) antes de exportar
 # ==========================================================================================
 
 # ------------------------------------------------------------------------------------------
@@ -2019,112 +1973,437 @@ def _get_logo_media_name():
     except Exception:
         return "001.png"
 
+
 # ------------------------------------------------------------------------------------------
-# ✅ Asegurar SEED de la ÚLTIMA PÁGINA: Información Adicional y Contacto Voluntario (32–34)
-# (No rompe nada: solo agrega si NO existe)
+# Exportar a XLSForm (Excel) + Vista previa
 # ------------------------------------------------------------------------------------------
-def _add_if_missing_final(q: Dict):
-    nm = q.get("name")
-    if not nm:
-        return
-    exists = any(qq.get("name") == nm for qq in st.session_state.preguntas)
-    if not exists:
-        st.session_state.preguntas.append(ensure_qid(q))
-
-if "seed_info_adicional_v1" not in st.session_state:
-    SLUG_SI = slugify_name("Sí")
-    SLUG_NO = slugify_name("No")
-
-    # 32
-    _add_if_missing_final({
-        "tipo_ui": "Selección única",
-        "label": "32. ¿Usted tiene información de alguna persona o grupo que se dedique a realizar algún delito en su comercio? (Recuerde, su información es confidencial.)",
-        "name": "info_persona_grupo_delito",
-        "required": True,
-        "opciones": ["Sí", "No"],
-        "appearance": "horizontal",
-        "choice_filter": None,
-        "relevant": None
-    })
+st.markdown("---")
+st.subheader("📤 Exportar XLSForm (Survey123)")
 
-    # 32.1 (solo si 32 = Sí)
-    _add_if_missing_final({
-        "tipo_ui": "Párrafo (texto largo)",
-        "label": "32.1. Si su respuesta es \"SI\", describa aquellas características que pueda aportar tales como nombre de estructura o banda criminal... (nombre de personas, alias, domicilio, vehículos, etc.)",
-        "name": "info_persona_grupo_delito_detalle",
-        "required": True,
-        "opciones": [],
-        "appearance": "multiline",
-        "choice_filter": None,
-        "relevant": f"${{info_persona_grupo_delito}}='{SLUG_SI}'"
-    })
+# Generar Excel en memoria
+FECHA_FIJA_XLSX = "2000-01-01T00:00:00Z"
+_RE_FECHA_CORE = re.compile(r"(<dcterms:(created|modified)[^>]*>)[^<]*(</dcterms:\2>)")
 
-    # 33
-    _add_if_missing_final({
-        "tipo_ui": "Párrafo (texto largo)",
-        "label": "33. En el siguiente espacio de forma voluntaria podrá anotar su nombre, teléfono o correo electrónico en el cual desee ser contactado y continuar colaborando de forma confidencial con Fuerza Pública.",
-        "name": "contacto_voluntario",
-        "required": False,
-        "opciones": [],
-        "appearance": "multiline",
-        "choice_filter": None,
-        "relevant": None
-    })
+def _normalizar_xlsx(data: bytes) -> bytes:
+    """
+    Hace el .xlsx reproducible: mismas entradas, fecha fija en cada entrada del ZIP y en
+    docProps/core.xml (created/modified). Mismo contenido ⇒ mismos bytes.
+    """
+    src = zipfile.ZipFile(BytesIO(data))
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            contenido = src.read(info.filename)
+            if info.filename == "docProps/core.xml":
+                contenido = _RE_FECHA_CORE.sub(
+                    lambda m: f"{m.group(1)}{FECHA_FIJA_XLSX}{m.group(3)}", contenido.decode("utf-8")
+                ).encode("utf-8")
+            zi = zipfile.ZipInfo(info.filename, date_time=(1980, 1, 1, 0, 0, 0))
+            zi.compress_type = zipfile.ZIP_DEFLATED
+            zi.external_attr = info.external_attr
+            dst.writestr(zi, contenido)
+    return out.getvalue()
+
+EXCEL_ENGINES = ["openpyxl", "xlsxwriter"]
+
+def _to_excel_bytes(df_survey: pd.DataFrame, df_choices: pd.DataFrame, df_settings: pd.DataFrame,
+                    engine: str = "openpyxl") -> bytes:
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine=engine) as writer:
+        df_survey.to_excel(writer, sheet_name="survey", index=False)
+        df_choices.to_excel(writer, sheet_name="choices", index=False)
+        df_settings.to_excel(writer, sheet_name="settings", index=False)
+    output.seek(0)
+    return _normalizar_xlsx(output.getvalue())
 
-    # 34
-    _add_if_missing_final({
-        "tipo_ui": "Párrafo (texto largo)",
-        "label": "34. En el siguiente espacio podrá registrar alguna otra información que estime pertinente.",
-        "name": "info_adicional",
-        "required": False,
-        "opciones": [],
-        "appearance": "multiline",
-        "choice_filter": None,
-        "relevant": None
-    })
+# ------------------------------------------------------------------------------------------
+# Caché de XLSForm compilados (compartida entre sesiones, direccionada por contenido)
+# ------------------------------------------------------------------------------------------
+CACHE_XLSFORM_MAX_BYTES = 64 * 1024 * 1024
+
+@st.cache_resource(show_spinner=False)
+def _cache_xlsform() -> cache_compartido.CacheLRUBytes:
+    return cache_compartido.CacheLRUBytes(CACHE_XLSFORM_MAX_BYTES)
+
+def _hash_compilacion(**entradas) -> str:
+    """Hash canónico de TODO lo que afecta a construir_xlsform + _to_excel_bytes."""
+    canon = json.dumps(entradas, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=_json_default)
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+def _hash_contenido(df_survey: pd.DataFrame, df_choices: pd.DataFrame) -> str:
+    """Hash estable de lo que se publica (survey + choices), independiente de settings."""
+    h = hashlib.sha256()
+    for df in (df_survey, df_choices):
+        h.update(df.to_csv(index=False).encode("utf-8"))
+    return h.hexdigest()
+
+def _compilar_con_cache(preguntas, form_title: str, idioma: str, reglas_vis, reglas_fin,
+                        paginado: Optional[Dict[str, int]] = None, indice: Optional[Dict] = None):
+    """
+    Compila survey/choices (sin settings.version) o los toma de la caché.
+    Devuelve (df_survey, df_choices, hash_contenido). `indice` se deriva de las reglas y no
+    entra en la clave; preguntas y catálogo entran por su hash de contenido (ya calculado
+    salvo que hayan cambiado), no serializados en cada rerun.
+    """
+    clave = "c:" + _hash_compilacion(
+        preguntas=_hash_preguntas(preguntas), form_title=form_title, idioma=idioma,
+        reglas_vis=reglas_vis, reglas_fin=reglas_fin, paginado=paginado,
+        catalogo=_hash_catalogo(),
+        textos_fijos=st.session_state.textos_fijos,
+        logo=_get_logo_media_name(),
+    )
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is not None:
+        return _copia_compilado(hit)
+
+    t0 = _fase_ini()
+    df_s, df_c, _ = construir_xlsform(
+        preguntas=list(preguntas),
+        form_title=form_title,
+        idioma=idioma,
+        version="",
+        reglas_vis=reglas_vis,
+        reglas_fin=reglas_fin,
+        paginado=paginado,
+        indice=indice,
+    )
+    if t0 is not None:
+        _fase_fin("construir_xlsform", t0, filas_survey=len(df_s), filas_choices=len(df_c),
+                  chars_expresiones=_chars_expresiones(df_s))
+    valor = (df_s, df_c, _hash_contenido(df_s, df_c))
+    cache.put(clave, valor, sum(int(df.memory_usage(deep=True).sum()) for df in (df_s, df_c)))
+    return _copia_compilado(valor)
+
+def _copia_compilado(valor):
+    """
+    (df_survey, df_choices, hash) para una sesión: los DataFrame guardados en la caché son de
+    todas las sesiones y no se entregan; cada rerun recibe su copia.
+    """
+    df_s, df_c, *resto = valor
+    return (df_s.copy(), df_c.copy(), *resto)
 
-    st.session_state.seed_info_adicional_v1 = True
+def _chars_expresiones(df_s: pd.DataFrame) -> int:
+    cols = [c for c in ("relevant", "constraint", "choice_filter", "calculation") if c in df_s.columns]
+    return int(sum(df_s[c].dropna().astype(str).str.len().sum() for c in cols))
+
+def _settings_df(form_title: str, version: str, idioma: str) -> pd.DataFrame:
+    return pd.DataFrame([{
+        "form_title": form_title,
+        "version": version,
+        "default_language": idioma,
+        "style": "pages",
+    }], columns=["form_title", "version", "default_language", "style"])
 
-# Asegurar qid en todo
-st.session_state.preguntas = [ensure_qid(q) for q in st.session_state.preguntas]
+def _xlsx_con_cache(df_survey: pd.DataFrame, df_choices: pd.DataFrame, df_settings: pd.DataFrame,
+                    hash_contenido: str) -> bytes:
+    clave = "x:" + _hash_compilacion(contenido=hash_contenido, settings=df_settings.to_dict(orient="records"))
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is not None:
+        return hit
+    t0 = _fase_ini()
+    xbytes = _to_excel_bytes(df_survey, df_choices, df_settings)
+    _fase_fin("_to_excel_bytes", t0, bytes_xlsx=len(xbytes))
+    cache.put(clave, xbytes, len(xbytes))
+    return xbytes
 
 # ------------------------------------------------------------------------------------------
-# Exportar a XLSForm (Excel) + Vista previa
+# Idiomas: columnas label::<idioma> sobre el compilado en español
 # ------------------------------------------------------------------------------------------
-st.markdown("---")
-st.subheader("📤 Exportar XLSForm (Survey123)")
+# La compilación es una sola (en español); cada idioma es un mapeo de sus textos únicos con
+# la memoria de traducción, cacheado por (contenido, idioma, memoria). Cambiar una
+# traducción solo recalcula ese idioma; cambiar una pregunta, solo los textos nuevos.
+def _columnas_idioma_con_cache(df_s: pd.DataFrame, df_c: pd.DataFrame, hash_contenido: str, idioma: str,
+                               memoria: Dict, hash_memoria: str):
+    clave = "t:" + _hash_compilacion(contenido=hash_contenido, idioma=idioma, memoria=hash_memoria)
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is not None:
+        return hit
+    t0 = _fase_ini()
+    valor = traducciones.columnas_idioma(df_s, df_c, memoria)
+    if t0 is not None:
+        _fase_fin(f"traducir/{idioma}", t0, sin_traducir=valor[2])
+    cache.put(clave, valor, sum(int(x.memory_usage(deep=True)) for d in valor[:2] for x in d.values()))
+    return valor
+
+def _con_idiomas_con_cache(df_s: pd.DataFrame, df_c: pd.DataFrame, hash_contenido: str, idiomas: List[str]):
+    """
+    (df_survey, df_choices, hash, {idioma: textos sin traducir}) con columnas por idioma.
+    Sin idiomas adicionales devuelve el compilado tal cual (mismo hash, mismo .xlsx).
+    """
+    if not idiomas:
+        return df_s, df_c, hash_contenido, {}
+    memorias = {i: _memoria(i) for i in idiomas}
+    hashes = {i: traducciones.hash_memoria(m) for i, m in memorias.items()}
+    cols = {i: _columnas_idioma_con_cache(df_s, df_c, hash_contenido, i, memorias[i], hashes[i]) for i in idiomas}
+    faltantes = {i: v[2] for i, v in cols.items()}
+    clave = "l:" + _hash_compilacion(contenido=hash_contenido, idiomas=[[i, hashes[i]] for i in idiomas])
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is None:
+        s_x = traducciones.con_idiomas(df_s, {i: v[0] for i, v in cols.items()})
+        c_x = traducciones.con_idiomas(df_c, {i: v[1] for i, v in cols.items()})
+        hit = (s_x, c_x, _hash_contenido(s_x, c_x))
+        cache.put(clave, hit, sum(int(df.memory_usage(deep=True).sum()) for df in (s_x, c_x)))
+    return (*_copia_compilado(hit), faltantes)
 
-# Construir dataframes
-df_survey, df_choices, df_settings = construir_xlsform(
+# ------------------------------------------------------------------------------------------
+# Complejidad: presupuestos para Survey123 en dispositivos de campo
+# ------------------------------------------------------------------------------------------
+# Base: complejidad.PRESUPUESTOS, ajustable por despliegue con ENCUESTA_PRESUPUESTOS (JSON,
+# p. ej. '{"preguntas_pagina": 20}'); encima, los del proyecto
+def _presupuestos_base() -> Dict[str, int]:
+    try:
+        entorno = json.loads(os.environ.get("ENCUESTA_PRESUPUESTOS") or "{}")
+    except ValueError:
+        entorno = {}
+    return complejidad.presupuestos(entorno if isinstance(entorno, dict) else {})
+
+def _presupuestos() -> Dict[str, int]:
+    return complejidad.presupuestos({**_presupuestos_base(), **st.session_state.presupuestos})
+
+def _complejidad_con_cache(df_s: pd.DataFrame, df_c: pd.DataFrame, hash_contenido: str, limites: Dict[str, int]):
+    clave = "k:" + _hash_compilacion(contenido=hash_contenido, presupuestos=limites)
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is not None:
+        return hit
+    t0 = _fase_ini()
+    valor = complejidad.analizar(df_s, df_c, limites)
+    if t0 is not None:
+        _fase_fin("complejidad", t0, avisos=len(valor["avisos"]))
+    cache.put(clave, valor, sum(int(valor[k].memory_usage(deep=True).sum()) for k in ("preguntas", "paginas")))
+    return valor
+
+# Diccionario de datos (codebook) del mismo compilado, versionado por su hash
+def _diccionario_con_cache(df_s: pd.DataFrame, df_c: pd.DataFrame, hash_contenido: str):
+    """(codebook, CSV, Parquet o None) del compilado."""
+    clave = "d:" + _hash_compilacion(contenido=hash_contenido)
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is not None:
+        return hit
+    t0 = _fase_ini()
+    df = diccionario_datos.generar(df_s, df_c, hash_contenido[:12])
+    valor = (df, diccionario_datos.a_csv(df), diccionario_datos.a_parquet(df))
+    if t0 is not None:
+        _fase_fin("diccionario_datos", t0, filas=len(df))
+    cache.put(clave, valor, int(df.memory_usage(deep=True).sum()) + len(valor[1]) + len(valor[2] or b""))
+    return valor
+
+# Construir dataframes + Excel (o reutilizar el compilado idéntico de cualquier sesión)
+limites_complejidad = _presupuestos()
+df_survey, df_choices, hash_contenido = _compilar_con_cache(
     preguntas=st.session_state.preguntas,
     form_title=titulo_compuesto,
     idioma=idioma,
-    version=version,
     reglas_vis=st.session_state.reglas_visibilidad,
-    reglas_fin=st.session_state.reglas_finalizar
+    reglas_fin=st.session_state.reglas_finalizar,
+    paginado=limites_complejidad if st.session_state.dividir_paginas else None,
+    indice=indice_reglas,
 )
+with st.expander("🌐 Idiomas y traducciones", expanded=False):
+    st.caption("Memoria de traducción: cada texto en español se traduce una vez y se reutiliza en todas las "
+               "preguntas, opciones, notas y plantillas. Vacío = traducción de la memoria compartida o, "
+               "si no hay, el texto en español.")
+    _textos_es = traducciones.textos_fuente(df_survey, df_choices)
+    _otros = [i for i in traducciones.IDIOMAS if i != traducciones.IDIOMA_FUENTE]
+    _lang = st.selectbox("Idioma", options=_otros, format_func=traducciones.nombre_idioma,
+                         index=_otros.index(idiomas_extra[0]) if idiomas_extra else 0, key="sel_idioma_trad")
+    _compartida = _memoria_por_firma(_lang, traducciones.firma(_lang))
+    _propia = dict(st.session_state.traducciones.get(_lang) or {})
+    _claves = [traducciones.clave(t) for t in _textos_es]
+    _tabla = pd.DataFrame({
+        "es": _textos_es,
+        "traduccion": [_propia.get(k) or _compartida.get(k) or "" for k in _claves],
+        "origen": ["proyecto" if k in _propia else ("compartida" if k in _compartida else "—") for k in _claves],
+    })
+    _editada = st.data_editor(
+        _tabla, key=f"ed_trad_{_lang}_{hash_contenido[:8]}", use_container_width=True, hide_index=True, height=300,
+        disabled=["es", "origen"],
+        column_config={"traduccion": st.column_config.TextColumn(traducciones.nombre_idioma(_lang))},
+    )
+    # Solo lo que difiere de la memoria compartida es del proyecto; se conservan las
+    # traducciones propias de textos que hoy no están en el formulario
+    _nueva = {k: v for k, v in _propia.items() if k not in set(_claves)}
+    for k, v in zip(_claves, _editada["traduccion"].fillna("").astype(str).str.strip()):
+        if v and v != _compartida.get(k):
+            _nueva[k] = v
+    if _nueva != _propia:
+        st.session_state.traducciones = {**st.session_state.traducciones, _lang: _nueva}
+
+    _idiomas_csv = idiomas_extra or [_lang]
+    st.download_button(
+        "⬇️ Textos para traducir (CSV)",
+        data=traducciones.a_csv(_textos_es, {i: _memoria(i) for i in _idiomas_csv}),
+        file_name=f"traducciones_{'_'.join(_idiomas_csv)}.csv", mime="text/csv",
+        use_container_width=True, key="btn_trad_csv",
+    )
+    up_trad = st.file_uploader("Importar traducciones (CSV: es, en, ...)", type=["csv"], key="uploader_trad")
+    if up_trad is not None and st.session_state.get("_trad_file_id") != up_trad.file_id:
+        try:
+            _importadas = traducciones.desde_csv(up_trad.getvalue())
+            _trad = dict(st.session_state.traducciones)
+            for _i, _m in _importadas.items():
+                _trad[_i] = {**(_trad.get(_i) or {}), **_m}
+            st.session_state.traducciones = _trad
+            st.session_state["_trad_file_id"] = up_trad.file_id
+            for _k in [k for k in st.session_state if str(k).startswith("ed_trad_")]:
+                st.session_state.pop(_k, None)
+            _rerun()
+        except ValueError as e:
+            st.error(f"No se pudo importar el CSV: {e}")
+
+# Hojas a publicar (con columnas por idioma si hay idiomas adicionales)
+df_survey_x, df_choices_x, hash_export, faltantes_idioma = _con_idiomas_con_cache(
+    df_survey, df_choices, hash_contenido, idiomas_extra)
+version = _resolver_version(modo_version, hash_export, version)
+st.session_state["_version_resuelta"] = version
+
+# Exportar / guardar el proyecto (lugares reservados en el sidebar) con la versión ya resuelta
+with _sb_exportar:
+    if st.button("Exportar proyecto (JSON)", use_container_width=True, key="btn_export_json"):
+        proj = _proyecto_actual(idioma, version)
+        jbuf = BytesIO(json.dumps(proj, ensure_ascii=False, indent=2, default=_json_default).encode("utf-8"))
+        st.download_button(
+            "Descargar JSON",
+            data=jbuf,
+            file_name="proyecto_encuesta_comercio.json",
+            mime="application/json",
+            use_container_width=True
+        )
+
+    if st.button("Exportar compacto (.ecproj)", use_container_width=True, key="btn_export_ecproj",
+                 help="Formato binario versionado y comprimido (catálogo en columnas). Ideal para catálogos nacionales."):
+        st.download_button(
+            "Descargar .ecproj",
+            data=formato_proyecto.escribir_proyecto(_proyecto_actual(idioma, version)),
+            file_name=f"proyecto_encuesta_comercio.{formato_proyecto.EXTENSION}",
+            mime="application/octet-stream",
+            use_container_width=True
+        )
+
+with _sb_guardar:
+    col_g1, col_g2 = st.columns(2)
+    if col_g1.button("Guardar", use_container_width=True, key="btn_db_guardar"):
+        if not proy_nombre.strip():
+            st.error("Indica un nombre de proyecto.")
+        else:
+            pid = almacen_proyectos.obtener_o_crear_proyecto(_conn, proy_nombre.strip())
+            if pid != st.session_state.get("_proy_id"):
+                st.session_state["_proy_hashes"] = None
+            st.session_state["_proy_id"] = pid
+            st.session_state["_proy_nombre"] = proy_nombre.strip()
+            hashes, n = almacen_proyectos.guardar_cambios(
+                _conn, pid, _proyecto_actual(idioma, version), st.session_state.get("_proy_hashes")
+            )
+            st.session_state["_proy_hashes"] = hashes
+            # Se redibuja para que el historial de versiones (más arriba) ya vea el proyecto
+            st.session_state["_avisos_db"] = [f"Proyecto guardado ({n} filas escritas)."]
+            _rerun()
+
+    if col_g2.button("Guardar versión", use_container_width=True, key="btn_db_version",
+                     disabled=not st.session_state.get("_proy_id")):
+        num = almacen_proyectos.crear_version(_conn, st.session_state["_proy_id"], _proyecto_actual(idioma, version))
+        if num is None:
+            st.info("Sin cambios desde la última versión.")
+        else:
+            st.session_state["_avisos_db"] = [f"Versión {num} guardada."]
+            _rerun()
+
+# Con idiomas adicionales, default_language nombra una columna de etiquetas: un idioma sin
+# columna (p. ej. "en" con solo "fr" agregado) cae al español de las columnas base
+idioma_defecto = (idioma if not idiomas_extra or idioma in (traducciones.IDIOMA_FUENTE, *idiomas_extra)
+                  else traducciones.IDIOMA_FUENTE)
+df_settings = _settings_df(titulo_compuesto, version,
+                           traducciones.nombre_idioma(idioma_defecto) if idiomas_extra else idioma)
+xls_bytes = _xlsx_con_cache(df_survey_x, df_choices_x, df_settings, hash_export)
+analisis = _complejidad_con_cache(df_survey, df_choices, hash_contenido, limites_complejidad)
+
+with st.sidebar:
+    _cs = _cache_xlsform().stats()
+    st.markdown("---")
+    st.caption(f"🏷️ settings.version = `{version}` · contenido `{hash_export[:10]}`"
+               + (" · el contador se fija al descargar el XLSForm"
+                  if modo_version == "Contador + hash"
+                  and st.session_state.version_contador.get("hash") != hash_export else ""))
+    if idioma_defecto != idioma:
+        st.caption(f"🌐 default_language: {traducciones.nombre_idioma(idioma)} no está entre los idiomas "
+                   f"adicionales; se usa {traducciones.nombre_idioma(idioma_defecto)}")
+    for _i, _n in faltantes_idioma.items():
+        if _n:
+            st.caption(f"🌐 {traducciones.nombre_idioma(_i)}: {_n} textos sin traducir (quedan en español)")
+    if analisis["avisos"]:
+        st.caption(f"📏 Complejidad: {len(analisis['avisos'])} avisos (ver «Complejidad y rendimiento en campo»)")
+    st.caption(
+        f"🧮 Caché XLSForm: {_cs['aciertos']} aciertos · {_cs['fallos']} fallos · "
+        f"{_cs['entradas']} entradas · {_cs['bytes'] / 1_048_576:.1f}/{_cs['max_bytes'] / 1_048_576:.0f} MB"
+    )
 
 # Vista previa
 with st.expander("👀 Vista previa (survey / choices / settings)", expanded=False):
     st.caption("Estas son las hojas que se exportarán al XLSForm.")
     st.markdown("**survey**")
-    st.dataframe(df_survey, use_container_width=True, hide_index=True, height=260)
+    st.dataframe(df_survey_x, use_container_width=True, hide_index=True, height=260)
     st.markdown("**choices**")
-    st.dataframe(df_choices, use_container_width=True, hide_index=True, height=260)
+    st.dataframe(df_choices_x, use_container_width=True, hide_index=True, height=260)
     st.markdown("**settings**")
     st.dataframe(df_settings, use_container_width=True, hide_index=True, height=120)
 
-# Generar Excel en memoria
-def _to_excel_bytes(df_survey: pd.DataFrame, df_choices: pd.DataFrame, df_settings: pd.DataFrame) -> bytes:
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df_survey.to_excel(writer, sheet_name="survey", index=False)
-        df_choices.to_excel(writer, sheet_name="choices", index=False)
-        df_settings.to_excel(writer, sheet_name="settings", index=False)
-    output.seek(0)
-    return output.getvalue()
+# Complejidad
+with st.expander("📏 Complejidad y rendimiento en campo", expanded=False):
+    st.caption("Survey123 se vuelve lento en tabletas Android viejas con expresiones largas o profundas, "
+               "páginas grandes y listas con muchas opciones. Se mide sobre el formulario compilado.")
+    if analisis["avisos"]:
+        for _a in analisis["avisos"]:
+            _donde = f"**{_a['pagina']}**" + (f" · `{_a['name']}`" if _a["name"] else "")
+            st.warning(f"{_donde}: {_a['mensaje']}")
+    else:
+        st.success("Dentro de los presupuestos.")
+    st.markdown("**Por página**")
+    st.dataframe(analisis["paginas"], use_container_width=True, hide_index=True)
+    st.markdown("**Por pregunta**")
+    st.dataframe(analisis["preguntas"], use_container_width=True, hide_index=True, height=260)
+
+    st.markdown("**Presupuestos**")
+    _dividir = st.checkbox(
+        "Dividir automáticamente las páginas que se pasan (sub-páginas con el mismo relevant; "
+        "una pregunta no se separa de su «Otro» ni se parte una matriz)",
+        value=st.session_state.dividir_paginas, key="chk_dividir_paginas",
+    )
+    if _dividir != st.session_state.dividir_paginas:
+        st.session_state.dividir_paginas = _dividir
+        _rerun()
+    _cols_pres = st.columns(3)
+    _nuevos = {}
+    for _i, (_k, _etq) in enumerate(complejidad.ETIQUETAS.items()):
+        _nuevos[_k] = int(_cols_pres[_i % 3].number_input(_etq, min_value=1, step=1,
+                                                          value=int(limites_complejidad[_k]), key=f"pres_{_k}"))
+    # Solo se guarda en el proyecto lo que difiere de la base (código + entorno)
+    _base_pres = _presupuestos_base()
+    _propios = {k: v for k, v in _nuevos.items() if v != _base_pres[k]}
+    if _propios != st.session_state.presupuestos:
+        st.session_state.presupuestos = _propios
+        _rerun()
 
-xls_bytes = _to_excel_bytes(df_survey, df_choices, df_settings)
+# Diccionario de datos
+with st.expander("📖 Diccionario de datos (codebook)", expanded=False):
+    st.caption("Una fila por campo, por opción de cada lista y por columna 0/1 de análisis de cada "
+               "selección múltiple (Survey123 la guarda como texto con los slugs separados por coma). "
+               f"Versión = hash del contenido: `{hash_contenido[:12]}`.")
+    df_codebook, _codebook_csv, _codebook_parquet = _diccionario_con_cache(df_survey, df_choices, hash_contenido)
+    st.dataframe(df_codebook, use_container_width=True, hide_index=True, height=260)
+    _c_csv, _c_pq = st.columns(2)
+    _base_codebook = f"codebook_{slugify_name(delegacion or 'comercio')}_{hash_contenido[:10]}"
+    _c_csv.download_button("⬇️ Codebook (CSV)", data=_codebook_csv, file_name=f"{_base_codebook}.csv",
+                           mime="text/csv", use_container_width=True, key="btn_codebook_csv")
+    if _codebook_parquet is not None:
+        _c_pq.download_button("⬇️ Codebook (Parquet)", data=_codebook_parquet, file_name=f"{_base_codebook}.parquet",
+                              mime="application/octet-stream", use_container_width=True, key="btn_codebook_parquet")
+    else:
+        _c_pq.caption("Parquet no disponible: instala pyarrow.")
 
 # Nombre de archivo sugerido
 safe_deleg = slugify_name(delegacion or "comercio")
@@ -2135,14 +2414,393 @@ st.download_button(
     data=xls_bytes,
     file_name=file_name,
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    use_container_width=True
+    use_container_width=True,
+    on_click=_confirmar_version,
+    args=(modo_version, hash_export),
+)
+
+# Carpeta de Survey123 Connect (XLSForm + media/), lista para abrir
+def _zip_connect_con_cache(xls_bytes: bytes, carpeta: str) -> bytes:
+    logo = st.session_state.get("_logo_bytes")
+    media = {_get_logo_media_name(): logo} if logo else {}
+    clave = "z:" + _hash_compilacion(
+        carpeta=carpeta, xlsx=hashlib.sha256(xls_bytes).hexdigest(),
+        media={k: hashlib.sha256(v).hexdigest() for k, v in media.items()},
+    )
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is None:
+        hit = medios.paquete_connect(carpeta, xls_bytes, media)
+        cache.put(clave, hit, len(hit))
+    return hit
+
+_carpeta_connect = file_name[:-len(".xlsx")]
+st.download_button(
+    "📦 Descargar proyecto Survey123 Connect (ZIP: XLSForm + media/)",
+    data=_zip_connect_con_cache(xls_bytes, _carpeta_connect),
+    file_name=f"{_carpeta_connect}.zip",
+    mime="application/zip",
+    use_container_width=True,
+    key="btn_zip_connect",
+    on_click=_confirmar_version,
+    args=(modo_version, hash_export),
 )
 
+# ------------------------------------------------------------------------------------------
+# Comparar con otra versión (antes de volver a publicar)
+# ------------------------------------------------------------------------------------------
+def _forma_actual_xlsform() -> Dict:
+    return diferencias.forma_xlsform(df_survey.to_dict(orient="records"), df_choices.to_dict(orient="records"))
+
+def _cambios_contra(referencia) -> List[Dict]:
+    """
+    `referencia`: proyecto (dict) → comparación por qid; (survey, choices) de un XLSForm →
+    comparación por name contra el XLSForm compilado actual.
+    """
+    t0 = _fase_ini()
+    actual_xls = _forma_actual_xlsform()
+    if isinstance(referencia, dict):
+        paginas = {c["name"]: c["pagina"] for c in actual_xls["campos"].values()}
+        antes = diferencias.forma_proyecto(referencia, map_tipo_to_xlsform, slugify_name, paginas)
+        despues = diferencias.forma_proyecto(_proyecto_actual(idioma, version), map_tipo_to_xlsform,
+                                             slugify_name, paginas)
+    else:
+        antes = diferencias.forma_xlsform(*referencia)
+        despues = actual_xls
+    cambios = diferencias.comparar(antes, despues)
+    _fase_fin("diferencias", t0, campos=len(despues["campos"]), opciones=len(despues["opciones"]),
+              cambios=len(cambios))
+    return cambios
+
+with st.expander("🔀 Comparar con otra versión", expanded=False):
+    st.caption("Cambios del proyecto actual respecto de una versión guardada, un proyecto (JSON / .ecproj) "
+               "o un XLSForm publicado. ⚠️ marca lo que parte los datos del feature service.")
+    _fuentes = ["Archivo (JSON / .ecproj / XLSForm)"]
+    if st.session_state.get("_proy_id"):
+        _fuentes.insert(0, "Versión guardada (SQLite)")
+    fuente_cmp = st.radio("Comparar contra", _fuentes, horizontal=True, key="cmp_fuente")
+    referencia = None
+    if fuente_cmp == "Versión guardada (SQLite)":
+        _vers_cmp = [v["numero"] for v in almacen_proyectos.listar_versiones(_db_conn(), st.session_state["_proy_id"])]
+        if _vers_cmp:
+            sel_cmp = st.selectbox("Versión", _vers_cmp, format_func=lambda n: f"v{n}", key="cmp_version")
+            if st.button("Comparar", use_container_width=True, key="btn_cmp"):
+                referencia = almacen_proyectos.reconstruir_version(_db_conn(), st.session_state["_proy_id"], sel_cmp)
+        else:
+            st.info("Este proyecto aún no tiene versiones guardadas.")
+    else:
+        up_cmp = st.file_uploader("Versión de referencia", type=["json", formato_proyecto.EXTENSION, "xlsx"],
+                                  key="uploader_cmp")
+        if up_cmp is not None and st.button("Comparar", use_container_width=True, key="btn_cmp"):
+            try:
+                if up_cmp.name.lower().endswith(".xlsx"):
+                    referencia = importar_xlsform.leer_hojas(up_cmp)[:2]
+                else:
+                    referencia = formato_proyecto.leer_proyecto(up_cmp)
+            except Exception as e:
+                st.error(f"No se pudo leer la versión de referencia: {e}")
+
+    if referencia is not None:
+        cambios_cmp = _cambios_contra(referencia)
+        res_cmp = diferencias.resumen(cambios_cmp)
+        if not cambios_cmp:
+            st.success("Sin cambios estructurales.")
+        else:
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Campos con cambios", res_cmp["campos"])
+            c2.metric("Opciones con cambios", res_cmp["opciones"])
+            c3.metric("Rompen el esquema", res_cmp["rompen"])
+            if res_cmp["rompen"]:
+                st.warning("Hay cambios que rompen el esquema: al republicar, los datos ya enviados quedarán "
+                           "en columnas o valores que el formulario nuevo no usa.")
+            for pag_cmp, cambios_pag in diferencias.por_pagina(cambios_cmp):
+                n_rompe = sum(c["rompe"] for c in cambios_pag)
+                st.markdown(f"**{pag_cmp}** · {len(cambios_pag)} cambio{'s' if len(cambios_pag) != 1 else ''}" + (f" · ⚠️ {n_rompe}" if n_rompe else ""))
+                st.dataframe(pd.DataFrame(diferencias.filas_tabla(cambios_pag)), use_container_width=True,
+                             hide_index=True)
+
+# ------------------------------------------------------------------------------------------
+# Migrar respuestas de una versión anterior a la actual (continuidad de qid)
+# ------------------------------------------------------------------------------------------
+def _mapa_migracion(referencia: Dict) -> Dict:
+    antes = diferencias.forma_proyecto(referencia, map_tipo_to_xlsform, slugify_name)
+    despues = diferencias.forma_proyecto(_proyecto_actual(idioma, version), map_tipo_to_xlsform, slugify_name)
+    return migracion_respuestas.derivar(antes, despues)
+
+def _leer_respuestas(up) -> pd.DataFrame:
+    # Todo como texto: los slugs y códigos no deben volverse números ni NaN
+    return pd.read_csv(up, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+with st.expander("🧬 Migrar respuestas entre versiones", expanded=False):
+    st.caption("Lleva las respuestas exportadas (CSV) de una versión anterior a las columnas y valores del "
+               "proyecto actual: renombres de campos y de opciones se siguen por qid. Si se agregan las "
+               "respuestas de la versión actual, sale un solo conjunto con la columna "
+               f"`{migracion_respuestas.COLUMNA_VERSION}`.")
+    _fuentes_mig = ["Archivo (JSON / .ecproj)"]
+    if st.session_state.get("_proy_id"):
+        _fuentes_mig.insert(0, "Versión guardada (SQLite)")
+    fuente_mig = st.radio("Versión anterior", _fuentes_mig, horizontal=True, key="mig_fuente")
+    ref_mig = None
+    etiqueta_mig = "anterior"
+    if fuente_mig == "Versión guardada (SQLite)":
+        _vers_mig = [v["numero"] for v in almacen_proyectos.listar_versiones(_db_conn(), st.session_state["_proy_id"])]
+        if _vers_mig:
+            sel_mig = st.selectbox("Versión", _vers_mig, format_func=lambda n: f"v{n}", key="mig_version")
+            ref_mig = almacen_proyectos.reconstruir_version(_db_conn(), st.session_state["_proy_id"], sel_mig)
+            etiqueta_mig = f"v{sel_mig}"
+        else:
+            st.info("Este proyecto aún no tiene versiones guardadas.")
+    else:
+        up_mig = st.file_uploader("Proyecto de la versión anterior", type=["json", formato_proyecto.EXTENSION],
+                                  key="uploader_mig_proyecto")
+        if up_mig is not None:
+            try:
+                ref_mig = formato_proyecto.leer_proyecto(up_mig)
+                etiqueta_mig = str(ref_mig.get("version") or "anterior")
+            except Exception as e:
+                st.error(f"No se pudo leer el proyecto: {e}")
+
+    if ref_mig is not None:
+        mapa_mig = _mapa_migracion(ref_mig)
+        for aviso in mapa_mig["avisos"]:
+            st.caption(f"⚠️ {aviso}")
+        filas_cols, filas_vals = migracion_respuestas.filas_mapa(mapa_mig)
+        st.markdown("**Columnas que cambian** (editable: el mismo destino en dos filas las fusiona)")
+        ed_cols = st.data_editor(pd.DataFrame(filas_cols, columns=["antes", "despues"]), disabled=["antes"],
+                                 hide_index=True, use_container_width=True, key="mig_editor_columnas")
+        st.markdown("**Valores que cambian**")
+        st.caption("Las opciones «sin par» conservan su valor salvo que indiques la opción actual que les corresponde.")
+        ed_vals = st.data_editor(pd.DataFrame(filas_vals, columns=["campo", "antes", "despues", "estado"]),
+                                 disabled=["campo", "antes", "estado"], hide_index=True, use_container_width=True,
+                                 key="mig_editor_valores")
+        mapa_mig = migracion_respuestas.con_ediciones(mapa_mig, ed_cols.to_dict(orient="records"),
+                                                      ed_vals.to_dict(orient="records"))
+
+        up_resp_antes = st.file_uploader("Respuestas de la versión anterior (CSV)", type=["csv"],
+                                         key="uploader_mig_antes")
+        up_resp_actual = st.file_uploader("Respuestas de la versión actual (CSV, opcional)", type=["csv"],
+                                          key="uploader_mig_actual")
+        # El resultado queda en la sesión (solo los archivos y una vista previa): descargar un
+        # formato provoca un rerun y el otro debe seguir disponible sin armonizar de nuevo
+        clave_mig = json.dumps([etiqueta_mig, version, [getattr(u, "file_id", None) or (u.name, u.size) if u else None
+                                                         for u in (up_resp_antes, up_resp_actual)],
+                                mapa_mig["campos"], mapa_mig["valores"]], ensure_ascii=False, sort_keys=True)
+        if (st.session_state.get("_mig_resultado") or {}).get("clave") != clave_mig:
+            st.session_state.pop("_mig_resultado", None)
+        if st.button("Armonizar", use_container_width=True, key="btn_mig", disabled=up_resp_antes is None):
+            t0 = _fase_ini()
+            try:
+                partes_mig = [(etiqueta_mig, _leer_respuestas(up_resp_antes), mapa_mig)]
+                if up_resp_actual is not None:
+                    partes_mig.append((version, _leer_respuestas(up_resp_actual), None))
+                df_mig = migracion_respuestas.armonizar(partes_mig)
+            except Exception as e:
+                st.error(f"No se pudieron leer las respuestas: {e}")
+            else:
+                st.session_state["_mig_resultado"] = {
+                    "clave": clave_mig, "filas": len(df_mig), "columnas": len(df_mig.columns),
+                    "vista": df_mig.head(200), "csv": diccionario_datos.a_csv(df_mig),
+                    "parquet": diccionario_datos.a_parquet(df_mig),
+                }
+                if t0 is not None:
+                    _fase_fin("migracion_respuestas", t0, filas=len(df_mig), columnas=len(df_mig.columns))
+        res_mig = st.session_state.get("_mig_resultado")
+        if res_mig:
+            st.success(f"{res_mig['filas']:,} respuestas · {res_mig['columnas']} columnas.")
+            st.dataframe(res_mig["vista"], use_container_width=True, hide_index=True)
+            _base_mig = f"respuestas_armonizadas_{slugify_name(delegacion or 'comercio')}_{version}"
+            _m_csv, _m_pq = st.columns(2)
+            _m_csv.download_button("⬇️ Respuestas armonizadas (CSV)", data=res_mig["csv"],
+                                   file_name=f"{_base_mig}.csv", mime="text/csv",
+                                   use_container_width=True, key="btn_mig_csv")
+            if res_mig["parquet"] is not None:
+                _m_pq.download_button("⬇️ Respuestas armonizadas (Parquet)", data=res_mig["parquet"],
+                                      file_name=f"{_base_mig}.parquet", mime="application/octet-stream",
+                                      use_container_width=True, key="btn_mig_parquet")
+
+# ------------------------------------------------------------------------------------------
+# Cuestionario en papel (Word) desde el XLSForm compilado
+# ------------------------------------------------------------------------------------------
+def _titulo_delegacion(d: str) -> str:
+    return f"Encuesta comercio – {d.strip()}" if d.strip() else "Encuesta comercio"
+
+def _bloques_papel(form_title: str):
+    df_s, df_c, h = _compilar_con_cache(
+        preguntas=st.session_state.preguntas,
+        form_title=form_title,
+        idioma=idioma,
+        reglas_vis=st.session_state.reglas_visibilidad,
+        reglas_fin=st.session_state.reglas_finalizar,
+        indice=indice_reglas,
+    )
+    return cuestionario_papel.bloques(df_s, df_c, omitir_relevant=f"${{consentimiento}}='{CONSENT_SI}'"), h
+
+def _word_con_cache(form_title: str) -> bytes:
+    bloques, h = _bloques_papel(form_title)
+    clave = "w:" + _hash_compilacion(contenido=h, titulo=form_title, logo=st.session_state.get("_logo_hash"))
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is None:
+        t0 = _fase_ini()
+        hit = exportar_word.documento_word(bloques, form_title, st.session_state.get("_logo_bytes"))
+        _fase_fin("exportar_word", t0, bloques=len(bloques), bytes_docx=len(hit))
+        cache.put(clave, hit, len(hit))
+    return hit
+
+with st.expander("📝 Cuestionario en Word (versión en papel)", expanded=False):
+    st.caption("Páginas como títulos, opciones como casillas, matriz como tabla y pistas de salto según las condicionales.")
+    if st.button("Generar Word", use_container_width=True, key="btn_word"):
+        st.download_button(
+            "⬇️ Descargar Word (.docx)",
+            data=_word_con_cache(titulo_compuesto),
+            file_name=file_name.replace("xlsform_", "cuestionario_")[:-len(".xlsx")] + ".docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            use_container_width=True,
+            key="btn_word_descargar",
+        )
+    st.markdown("**Lote por delegación**")
+    lote_deleg = st.text_area("Delegaciones (una por línea)", key="word_lote_delegaciones", height=100)
+    if st.button("Generar lote (ZIP de .docx)", use_container_width=True, key="btn_word_lote",
+                 disabled=not lote_deleg.strip()):
+        st.download_button(
+            "⬇️ Descargar lote Word (ZIP)",
+            data=exportar_word.lote_por_delegacion(
+                lote_deleg.splitlines(), lambda d: _word_con_cache(_titulo_delegacion(d)),
+                lambda d: f"cuestionario_encuesta_comercio_{slugify_name(d)}.docx",
+            ),
+            file_name="cuestionarios_word_por_delegacion.zip",
+            mime="application/zip",
+            use_container_width=True,
+            key="btn_word_lote_descargar",
+        )
+
+# ------------------------------------------------------------------------------------------
+# Cuestionario imprimible (PDF); por delegación solo cambian título, logo y Cantón/Distrito
+# ------------------------------------------------------------------------------------------
+def _pdf_con_cache(delegaciones: List[str]) -> bytes:
+    """Un PDF (lista de una delegación) o un ZIP con un PDF por delegación."""
+    bloques, h = _bloques_papel(titulo_compuesto)
+    clave = "p:" + _hash_compilacion(contenido=h, delegaciones=delegaciones, logo=st.session_state.get("_logo_hash"),
+                                     catalogo=_hash_catalogo())
+    cache = _cache_xlsform()
+    hit = cache.get(clave)
+    if hit is not None:
+        return hit
+    t0 = _fase_ini()
+    logo = st.session_state.get("_logo_bytes")
+    trabajos = [(
+        f"cuestionario_encuesta_comercio_{slugify_name(d)}.pdf",
+        _titulo_delegacion(d),
+        exportar_pdf.opciones_delegacion(st.session_state.choices_ext_rows, d, slugify_name),
+    ) for d in delegaciones]
+    if len(trabajos) == 1:
+        hit = exportar_pdf.documento_pdf(bloques, trabajos[0][1], logo, trabajos[0][2])
+    else:
+        hit = exportar_pdf.lote_por_delegacion(bloques, trabajos, logo)
+    _fase_fin("exportar_pdf", t0, delegaciones=len(trabajos), bytes_pdf=len(hit))
+    cache.put(clave, hit, len(hit))
+    return hit
+
+with st.expander("🖨️ Cuestionario imprimible (PDF)", expanded=False):
+    st.caption(
+        "Si un cantón del catálogo coincide con la delegación, el PDF imprime solo ese cantón y sus distritos."
+    )
+    if st.button("Generar PDF", use_container_width=True, key="btn_pdf"):
+        st.download_button(
+            "⬇️ Descargar PDF",
+            data=_pdf_con_cache([delegacion]),
+            file_name=f"cuestionario_encuesta_comercio_{safe_deleg}.pdf",
+            mime="application/pdf",
+            use_container_width=True,
+            key="btn_pdf_descargar",
+        )
+    st.markdown("**Lote por delegación**")
+    pdf_deleg = st.text_area("Delegaciones (una por línea)", key="pdf_lote_delegaciones", height=100)
+    _pdf_lista = list(dict.fromkeys(d.strip() for d in pdf_deleg.splitlines() if d.strip()))
+    if st.button(f"Generar lote (ZIP de {len(_pdf_lista)} PDF)", use_container_width=True, key="btn_pdf_lote",
+                 disabled=not _pdf_lista):
+        with st.spinner("Generando PDF por delegación…"):
+            _zip_pdf = _pdf_con_cache(_pdf_lista) if len(_pdf_lista) > 1 else medios.zip_archivos(
+                {f"cuestionario_encuesta_comercio_{slugify_name(_pdf_lista[0])}.pdf": _pdf_con_cache(_pdf_lista)})
+        st.download_button(
+            "⬇️ Descargar lote PDF (ZIP)",
+            data=_zip_pdf,
+            file_name="cuestionarios_pdf_por_delegacion.zip",
+            mime="application/zip",
+            use_container_width=True,
+            key="btn_pdf_lote_descargar",
+        )
+
 st.info(
-    "📌 Recordatorio Survey123: coloca el archivo del logo (por ejemplo, "
-    f"**{_get_logo_media_name()}**) dentro de la carpeta **media/** del proyecto en Survey123 Connect."
+    "📌 Recordatorio Survey123: el ZIP ya incluye el logo "
+    f"(**{_get_logo_media_name()}**) en **media/**. Si descargas solo el Excel, copia el logo "
+    "dentro de la carpeta **media/** del proyecto en Survey123 Connect."
 )
 
+# ------------------------------------------------------------------------------------------
+# Fin del rerun: historial de deshacer + autoguardado (SQLite), con el estado ya editado
+# ------------------------------------------------------------------------------------------
+st.session_state["_proy_meta_fin"] = (idioma, version)
+_proy_fin = _proyecto_actual(idioma, version)
+_filas_fin = _filas_estado(_proy_fin)
+_registrar_historial(_filas_fin)
+
+if (st.session_state.get("_proy_id") and st.session_state.get("sb_autosave", True)
+        and st.session_state.get("_filas_guardadas") is not _filas_fin):
+    try:
+        st.session_state["_proy_hashes"], _n_autosave = almacen_proyectos.guardar_cambios(
+            _db_conn(), st.session_state["_proy_id"], _proy_fin,
+            st.session_state.get("_proy_hashes"), filas=_filas_fin
+        )
+        st.session_state["_filas_guardadas"] = _filas_fin
+        if _n_autosave:
+            st.caption(f"💾 Autoguardado: {_n_autosave} filas actualizadas.")
+    except Exception as e:
+        st.warning(f"No se pudo autoguardar el proyecto: {e}")
+
+# ------------------------------------------------------------------------------------------
+# Limpieza de estado obsoleto (widgets de preguntas eliminadas, ediciones cerradas, reglas
+# borradas): al final del rerun, cuando los widgets ya se procesaron
+# ------------------------------------------------------------------------------------------
+_qids_vivos = {q.get("qid") for q in st.session_state.preguntas}
+_obsoletas = estado_sesion.claves_obsoletas(st.session_state, _qids_vivos, st.session_state.get("edit_qid"))
+for _k in _obsoletas:
+    st.session_state.pop(_k, None)
+st.session_state["_estado_liberadas"] = st.session_state.get("_estado_liberadas", 0) + len(_obsoletas)
+
+# ------------------------------------------------------------------------------------------
+# Panel de depuración: tiempos y memoria por fase (opcional) + log local
+# ------------------------------------------------------------------------------------------
+with st.sidebar:
+    with st.expander("🐞 Depuración: tiempos y memoria", expanded=False):
+        st.checkbox("Medir fases en cada rerun", key="_perf_activo")
+        st.checkbox("Medir memoria (tracemalloc, más lento)", key="_perf_memoria", disabled=not _perf_activo())
+        _reg_fin = _perf_registro()
+        if _reg_fin is not None:
+            _reg_fin["total_script"] = {"ms": (time.perf_counter() - _T0_RERUN) * 1000.0, "n": 1}
+            st.dataframe(pd.DataFrame(instrumentacion.filas_tabla(_reg_fin)), use_container_width=True, hide_index=True)
+            _log_perf = os.environ.get("ENCUESTA_PERF_LOG", instrumentacion.LOG_PATH_DEFAULT)
+            instrumentacion.escribir_log(
+                _reg_fin, _log_perf,
+                sesion=_perf_sesion,
+                preguntas=len(st.session_state.preguntas),
+            )
+            st.caption(f"Cada rerun medido se agrega a `{_log_perf}` (JSON Lines).")
+        else:
+            st.caption("Apagado: sin costo en los reruns.")
+
+        st.checkbox("Analizar memoria de la sesión", key="_estado_analizar")
+        if st.session_state.get("_estado_analizar"):
+            _huella = estado_sesion.huella(st.session_state, _qids_vivos)
+            _total_kb = sum(f["bytes"] for f in _huella) / 1024.0
+            st.caption(
+                f"Sesión: {_total_kb:,.1f} KB propios en {len(_huella)} claves · "
+                f"{st.session_state['_estado_liberadas']} claves obsoletas liberadas en esta sesión."
+            )
+            st.dataframe(pd.DataFrame(estado_sesion.resumen_por_categoria(_huella)),
+                         use_container_width=True, hide_index=True)
+            st.dataframe(pd.DataFrame(_huella[:15]), use_container_width=True, hide_index=True)
+
 # ============================ FIN PARTE 5 / 5 ============================================
 
 
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Benchmarks: compilación XLSForm y exportación (sin navegador, Linux simple)
+#
+# Uso:
+#   python benchmarks/bench_xlsform.py                      # todos los casos
+#   python benchmarks/bench_xlsform.py --rapido             # escalas reducidas
+#   python benchmarks/bench_xlsform.py --solo compile       # filtrar por prefijo
+#   python benchmarks/bench_xlsform.py --salida base.json
+#   python benchmarks/bench_xlsform.py --comparar base.json --umbral 1.25
+#
+# Casos:
+#   compile/preguntas=N          construir_xlsform con 35, 500 y 5000 preguntas
+#   compile/reglas=V+F           500 preguntas con V reglas de visibilidad y F de finalización
+#   compile/catalogo=N           catálogo Cantón→Distrito de 10 a 50000 filas
+#   excel/<engine>/...           _to_excel_bytes por backend (openpyxl, xlsxwriter)
+#   slugify/N                    slugify_name sobre N etiquetas
+#   proyecto/json|ecproj/...     exportar / importar proyecto
+#
+# Resultado: JSON con min / mediana / p95 (ms) por caso, comparable entre versiones.
+# ==========================================================================================
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from entorno import cargar_app, RAIZ  # noqa: E402
+import generadores  # noqa: E402
+
+
+def _medir(fn, min_reps: int = 3, max_reps: int = 50, presupuesto_s: float = 1.0):
+    tiempos = []
+    t_total = time.perf_counter()
+    while len(tiempos) < max_reps:
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+        if len(tiempos) >= min_reps and time.perf_counter() - t_total > presupuesto_s:
+            break
+    tiempos.sort()
+    p95 = tiempos[min(len(tiempos) - 1, int(round(0.95 * (len(tiempos) - 1))))]
+    return {
+        "reps": len(tiempos),
+        "min_ms": round(tiempos[0], 3),
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "p95_ms": round(p95, 3),
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+
+def _compilador(app, proyecto):
+    st = app["st"]
+
+    def _run():
+        st.session_state.choices_ext_rows = proyecto["choices_ext_rows"]
+        return app["construir_xlsform"](
+            preguntas=list(proyecto["preguntas"]),
+            form_title="Benchmark",
+            idioma="es",
+            version="bench",
+            reglas_vis=proyecto["reglas_visibilidad"],
+            reglas_fin=proyecto["reglas_finalizar"],
+        )
+    return _run
+
+
+def casos(app, rapido: bool = False):
+    """
+    (nombre, preparar) por caso: preparar() genera el proyecto y devuelve la función a medir.
+    Así --solo no genera ni compila proyectos de casos que no se van a correr.
+    """
+    escalas_q = [35, 500] if rapido else [35, 500, 5000]
+    escalas_cat = [10, 1000, 10000] if rapido else [10, 1000, 10000, 50000]
+    escalas_reglas = [(0, 0), (50, 5)] if rapido else [(0, 0), (50, 5), (500, 20), (2000, 50)]
+
+    for n in escalas_q:
+        yield (f"compile/preguntas={n}",
+               lambda n=n: _compilador(app, generadores.proyecto_sintetico(app, n_preguntas=n)))
+
+    for v, f in escalas_reglas:
+        yield (f"compile/reglas={v}+{f}",
+               lambda v=v, f=f: _compilador(app, generadores.proyecto_sintetico(app, n_preguntas=500,
+                                                                                n_vis=v, n_fin=f)))
+
+    for n in escalas_cat:
+        yield (f"compile/catalogo={n}",
+               lambda n=n: _compilador(app, generadores.proyecto_sintetico(app, n_catalogo=n)))
+
+    def _excel(n_q, n_cat, engine):
+        dfs = _compilador(app, generadores.proyecto_sintetico(app, n_preguntas=n_q, n_catalogo=n_cat))()
+        return lambda: app["_to_excel_bytes"](*dfs, engine=engine)
+
+    for engine in app["EXCEL_ENGINES"]:
+        for n_q, n_cat in ([(35, 10), (500, 10000)] if rapido else [(35, 10), (500, 10000), (5000, 50000)]):
+            yield (f"excel/{engine}/preguntas={n_q},catalogo={n_cat}",
+                   lambda n_q=n_q, n_cat=n_cat, engine=engine: _excel(n_q, n_cat, engine))
+
+    def _slugify(n):
+        labels = [q["label"] for q in generadores.preguntas_sinteticas(app, max(35, n // 10))] * 10
+        labels = labels[:n]
+        slug = app["slugify_name"]
+        return lambda: [slug(t) for t in labels]
+
+    for n in ([1000] if rapido else [1000, 100000]):
+        yield f"slugify/{n}", lambda n=n: _slugify(n)
+
+    formato = app["formato_proyecto"]
+
+    def _proyecto(n_cat, formato_archivo, accion):
+        proy = generadores.proyecto_sintetico(app, n_preguntas=35, n_catalogo=n_cat)
+        if formato_archivo == "json":
+            if accion == "exportar":
+                return lambda: json.dumps(proy, ensure_ascii=False, indent=2).encode("utf-8")
+            b = json.dumps(proy, ensure_ascii=False, indent=2).encode("utf-8")
+        else:
+            if accion == "exportar":
+                return lambda: formato.escribir_proyecto(proy)
+            b = formato.escribir_proyecto(proy)
+        return lambda: formato.leer_proyecto(io.BytesIO(b))
+
+    for n_cat in ([10, 10000] if rapido else [10, 10000, 50000]):
+        for formato_archivo in ("json", "ecproj"):
+            for accion in ("exportar", "importar"):
+                yield (f"proyecto/{formato_archivo}/{accion}/catalogo={n_cat}",
+                       lambda n_cat=n_cat, fa=formato_archivo, ac=accion: _proyecto(n_cat, fa, ac))
+
+
+def comparar(actual: dict, base: dict, umbral: float) -> list:
+    base_por_caso = {r["caso"]: r for r in base.get("resultados", [])}
+    regresiones = []
+    for r in actual["resultados"]:
+        b = base_por_caso.get(r["caso"])
+        if not b or not b.get("mediana_ms"):
+            continue
+        ratio = r["mediana_ms"] / b["mediana_ms"]
+        r["vs_base"] = round(ratio, 3)
+        if ratio > umbral:
+            regresiones.append((r["caso"], b["mediana_ms"], r["mediana_ms"], ratio))
+    return regresiones
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarks de compilación/exportación XLSForm.")
+    ap.add_argument("--rapido", action="store_true", help="Escalas reducidas (CI / verificación rápida).")
+    ap.add_argument("--solo", default="", help="Ejecutar solo casos cuyo nombre empiece por este prefijo.")
+    ap.add_argument("--salida", default="", help="Ruta del JSON de resultados (por defecto, stdout).")
+    ap.add_argument("--comparar", default="", help="JSON de una corrida anterior para detectar regresiones.")
+    ap.add_argument("--umbral", type=float, default=1.25, help="Razón mediana actual/base considerada regresión.")
+    args = ap.parse_args(argv)
+
+    app = cargar_app()
+    resultados = []
+    for nombre, preparar in casos(app, rapido=args.rapido):
+        if args.solo and not nombre.startswith(args.solo):
+            continue
+        r = {"caso": nombre, **_medir(preparar())}
+        resultados.append(r)
+        print(f"{nombre:<55} mediana {r['mediana_ms']:>10.2f} ms  p95 {r['p95_ms']:>10.2f} ms  (n={r['reps']})",
+              file=sys.stderr)
+
+    salida = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "pandas": app["pd"].__version__,
+            "rapido": args.rapido,
+        },
+        "resultados": resultados,
+    }
+
+    codigo = 0
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            regresiones = comparar(salida, json.load(fh), args.umbral)
+        for caso, b, a, ratio in regresiones:
+            print(f"REGRESIÓN {caso}: {b:.2f} → {a:.2f} ms (x{ratio:.2f})", file=sys.stderr)
+        codigo = 1 if regresiones else 0
+
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto)
+    else:
+        print(texto)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Carga de app.py en modo "bare" (sin servidor Streamlit) para benchmarks
+# - Ejecuta el script una vez en un directorio temporal (no deja SQLite en el repo)
+# - Silencia los avisos de Streamlit y devuelve el namespace del script
+# ==========================================================================================
+
+import os
+import io
+import sys
+import runpy
+import logging
+import tempfile
+import contextlib
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(RAIZ, "app.py")
+
+
+def cargar_app() -> dict:
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    logging.disable(logging.CRITICAL)
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix="bench_encuesta_")
+    try:
+        os.chdir(tmp)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            ns = runpy.run_path(APP_PATH, run_name="__bench__")
+    finally:
+        os.chdir(cwd)
+    return ns
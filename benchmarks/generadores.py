@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Generadores de proyectos sintéticos (deterministas por semilla) para benchmarks
+# - Parte de la plantilla real de Comercio y agrega preguntas hasta N (con "Otro" → texto)
+# - Reglas de visibilidad / finalización válidas contra las opciones de la fuente
+# - Catálogo Cantón → Distrito de tamaño arbitrario (≈ 1 cantón por cada 20 filas)
+# ==========================================================================================
+
+import random
+from typing import Dict, List
+
+_TIPOS_SINTETICOS = [
+    ("Selección única", 0.35),
+    ("Selección múltiple", 0.25),
+    ("Texto (corto)", 0.15),
+    ("Párrafo (texto largo)", 0.1),
+    ("Número", 0.1),
+    ("Fecha", 0.05),
+]
+
+_PALABRAS = (
+    "seguridad comercio zona barrio delito robo asalto policía municipalidad calle parque noche "
+    "mañana tarde patrullaje drogas alumbrado aceras transporte denuncia confianza vecinos "
+    "cámaras vigilancia extorsión estafa prevención convivencia riesgo horario local"
+).split()
+
+
+def _texto(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_PALABRAS) for _ in range(n)).capitalize()
+
+
+def preguntas_sinteticas(app: Dict, n: int, seed: int = 1) -> List[Dict]:
+    """Plantilla real de Comercio + preguntas sintéticas hasta llegar a `n` (nunca menos que la plantilla)."""
+    rng = random.Random(seed)
+    slug = app["slugify_name"]
+    base = [dict(q) for q in app["_plantilla"](app["plantillas"].PLANTILLA_DEFAULT)["preguntas"]]
+    preguntas = base[:n] if n < len(base) else base
+    usados = {q["name"] for q in preguntas}
+
+    tipos, pesos = zip(*_TIPOS_SINTETICOS)
+    i = 0
+    while len(preguntas) < n:
+        i += 1
+        tipo = rng.choices(tipos, weights=pesos)[0]
+        label = f"{i}. {_texto(rng, rng.randint(6, 18))}?"
+        name = app["asegurar_nombre_unico"](slug(label)[:40], usados)
+        usados.add(name)
+        q = {
+            "qid": f"sint-{seed}-{i}",
+            "tipo_ui": tipo,
+            "label": label,
+            "name": name,
+            "required": rng.random() < 0.7,
+            "opciones": [],
+            "appearance": None,
+            "choice_filter": None,
+            "relevant": None,
+        }
+        if tipo in ("Selección única", "Selección múltiple"):
+            opts = list(dict.fromkeys(_texto(rng, rng.randint(1, 4)) for _ in range(rng.randint(3, 10))))
+            if rng.random() < 0.4:
+                opts.append("Otro")
+            q["opciones"] = opts
+        preguntas.append(q)
+
+        if "Otro" in q["opciones"] and len(preguntas) < n:
+            otro = f"{name}_otro"
+            usados.add(otro)
+            op = "selected" if tipo == "Selección múltiple" else "="
+            rel = (f"selected(${{{name}}}, 'otro')" if op == "selected" else f"${{{name}}}='otro'")
+            preguntas.append({
+                "qid": f"sint-{seed}-{i}-otro", "tipo_ui": "Texto (corto)",
+                "label": "Indique cuál es ese otro:", "name": otro, "required": True,
+                "opciones": [], "appearance": None, "choice_filter": None, "relevant": rel,
+            })
+    return preguntas
+
+
+def reglas_sinteticas(app: Dict, preguntas: List[Dict], n_vis: int, n_fin: int, seed: int = 2):
+    rng = random.Random(seed)
+    slug = app["slugify_name"]
+    fuentes = [(i, q) for i, q in enumerate(preguntas) if q.get("opciones")]
+    if not fuentes:
+        return [], []
+    nombres = [q["name"] for q in preguntas]
+
+    vis = []
+    for _ in range(n_vis):
+        i_src, src = rng.choice(fuentes)
+        target = rng.choice(nombres)
+        if target == src["name"]:
+            continue
+        vals = [slug(v) for v in rng.sample(list(src["opciones"]), k=min(len(src["opciones"]), rng.randint(1, 3)))]
+        op = "selected" if src["tipo_ui"] == "Selección múltiple" else "="
+        vis.append({"target": target, "src": src["name"], "op": op, "values": vals})
+
+    fin = []
+    for _ in range(n_fin):
+        i_src, src = rng.choice(fuentes)
+        vals = [slug(rng.choice(list(src["opciones"])))]
+        op = "selected" if src["tipo_ui"] == "Selección múltiple" else "="
+        fin.append({"src": src["name"], "op": op, "values": vals, "index_src": i_src})
+    return vis, fin
+
+
+def catalogo_sintetico(n_filas: int, seed: int = 3) -> List[Dict]:
+    rng = random.Random(seed)
+    rows = [
+        {"list_name": "list_canton", "name": "__pick_canton__", "label": "— escoja un cantón —"},
+        {"list_name": "list_distrito", "name": "__pick_distrito__", "label": "— escoja un cantón —", "any": "1"},
+    ]
+    c = 0
+    while len(rows) < n_filas:
+        c += 1
+        canton = f"canton_{c}"
+        rows.append({"list_name": "list_canton", "name": canton, "label": f"Cantón {c} {_texto(rng, 1)}"})
+        for d in range(1, 20):
+            if len(rows) >= n_filas:
+                break
+            rows.append({"list_name": "list_distrito", "name": f"distrito_{c}_{d}",
+                         "label": f"Distrito {d} {_texto(rng, 2)}", "canton_key": canton})
+    return rows[:max(n_filas, 2)]
+
+
+def proyecto_sintetico(app: Dict, n_preguntas: int = 35, n_vis: int = 0, n_fin: int = 0,
+                       n_catalogo: int = 10, seed: int = 1) -> Dict:
+    preguntas = preguntas_sinteticas(app, n_preguntas, seed)
+    vis, fin = reglas_sinteticas(app, preguntas, n_vis, n_fin, seed + 1)
+    return {
+        "idioma": "es",
+        "version": "bench",
+        "preguntas": preguntas,
+        "reglas_visibilidad": vis,
+        "reglas_finalizar": fin,
+        "choices_ext_rows": catalogo_sintetico(n_catalogo, seed + 2),
+        "choices_extra_cols": ["any", "canton_key"],
+        "textos_fijos": {},
+    }
+
+
+if __name__ == "__main__":
+    # Genera un proyecto sintético en JSON (stdout): se usa desde procesos que no deben
+    # ejecutar app.py en modo bare (p. ej. el harness de AppTest).
+    import sys
+    import json
+    import argparse
+    from entorno import cargar_app
+
+    ap = argparse.ArgumentParser(description="Proyecto sintético (JSON) para benchmarks.")
+    ap.add_argument("--preguntas", type=int, default=35)
+    ap.add_argument("--reglas-vis", type=int, default=0)
+    ap.add_argument("--reglas-fin", type=int, default=0)
+    ap.add_argument("--catalogo", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+    proy = proyecto_sintetico(cargar_app(), a.preguntas, a.reglas_vis, a.reglas_fin, a.catalogo, a.seed)
+    sys.stdout.write(json.dumps(proy, ensure_ascii=False))
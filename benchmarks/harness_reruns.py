@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Latencia de reruns de la UI (Streamlit AppTest, sin navegador)
+#
+# Uso:
+#   python benchmarks/harness_reruns.py                     # 5 repeticiones por escenario
+#   python benchmarks/harness_reruns.py --reps 20 --catalogo 10000
+#   python benchmarks/harness_reruns.py --con-cache         # reutiliza la caché de compilados
+#   python benchmarks/harness_reruns.py --salida reruns.json
+#
+# Escenarios: carga inicial, rerun sin cambios, agregar lote, editar pregunta, subir pregunta,
+# agregar regla de visibilidad e importar proyecto JSON.
+#
+# Por rerun se registra el tiempo total del script y las fases que app.py mide cuando
+# `_perf_activo` está encendido: catalogo_render, lista_preguntas, condiciones,
+# construir_xlsform y _to_excel_bytes. La salida es una tabla de percentiles (p50/p90/p99).
+#
+# Por defecto se vacía la caché compartida de compilados antes de cada rerun: construir_xlsform
+# y _to_excel_bytes se miden siempre. Con --con-cache, un rerun que los toma de la caché no los
+# registra; esas muestras se cuentan como aciertos ("cache") y no entran en los percentiles.
+# ==========================================================================================
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from entorno import APP_PATH  # noqa: E402
+
+FASES = ["total_script", "catalogo_render", "lista_preguntas", "condiciones", "construir_xlsform", "_to_excel_bytes"]
+# Fases que app.py solo mide cuando no hay acierto en la caché de compilados
+FASES_CACHEADAS = ("construir_xlsform", "_to_excel_bytes")
+
+
+def _nueva_sesion(timeout: int):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state["_perf_activo"] = True
+    return at
+
+
+def _keys(at, prefijo: str):
+    return [b.key for b in at.button if b.key and b.key.startswith(prefijo)]
+
+
+# ------------------------------------------------------------------------------------------
+# Escenarios: cada uno recibe una sesión ya cargada y devuelve la lista de acciones a medir
+# (cada acción modifica widgets; el harness ejecuta at.run() y mide)
+# ------------------------------------------------------------------------------------------
+def esc_rerun_sin_cambios(at, ctx):
+    return [lambda: None]
+
+
+def esc_agregar_lote(at, ctx):
+    def _accion():
+        at.text_input(key="canton_lote").input(f"Cantón {ctx['i']}")
+        at.text_area(key="distritos_lote").input("\n".join(f"Distrito {d}" for d in range(12)))
+        at.button(key="btn_add_lote").click()
+    return [_accion]
+
+
+def esc_editar_pregunta(at, ctx):
+    qid = _keys(at, "edit_")[5][len("edit_"):]
+
+    def _abrir():
+        at.button(key=f"edit_{qid}").click()
+
+    def _guardar():
+        at.text_input(key=f"e_label_{qid}").input(f"Etiqueta editada {ctx['i']}")
+        at.button(key=f"e_save_{qid}").click()
+    return [_abrir, _guardar]
+
+
+def esc_subir_pregunta(at, ctx):
+    key = _keys(at, "up_")[10]
+    return [lambda: at.button(key=key).click()]
+
+
+def esc_agregar_regla(at, ctx):
+    def _accion():
+        at.selectbox(key="vis_target").select("motivo_cambio_12m_comercio")
+        at.selectbox(key="vis_src").select("percep_seg_local")
+    def _valores():
+        at.multiselect(key="vis_vals").select("Inseguro")
+        at.button(key="btn_add_vis").click()
+    return [_accion, _valores]
+
+
+def esc_importar_json(at, ctx):
+    def _accion():
+        at.sidebar.file_uploader[0].set_value(("proyecto.json", ctx["json_proyecto"], "application/json"))
+    return [_accion]
+
+
+ESCENARIOS = {
+    "carga_inicial": None,
+    "rerun_sin_cambios": esc_rerun_sin_cambios,
+    "agregar_lote": esc_agregar_lote,
+    "editar_pregunta": esc_editar_pregunta,
+    "subir_pregunta": esc_subir_pregunta,
+    "agregar_regla_visibilidad": esc_agregar_regla,
+    "importar_json": esc_importar_json,
+}
+
+
+def _percentil(valores, p: float) -> float:
+    if not valores:
+        return 0.0
+    v = sorted(valores)
+    k = (len(v) - 1) * p
+    lo, hi = int(k), min(int(k) + 1, len(v) - 1)
+    return v[lo] + (v[hi] - v[lo]) * (k - lo)
+
+
+def _medir_run(at, muestras, aciertos, con_cache: bool):
+    import streamlit as st
+    if not con_cache:
+        st.cache_resource.clear()
+    t0 = time.perf_counter()
+    at.run()
+    wall = (time.perf_counter() - t0) * 1000.0
+    if at.exception:
+        raise RuntimeError(f"La app lanzó una excepción: {at.exception[0].value}")
+    fases = dict(at.session_state["_perf_fases"]) if "_perf_fases" in at.session_state else {}
+    muestras["wall"].append(wall)
+    for f in FASES:
+        if f not in fases and f in FASES_CACHEADAS:
+            aciertos[f] += 1
+            continue
+        muestras[f].append(fases.get(f, {}).get("ms", 0.0))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Latencia de reruns de app.py con Streamlit AppTest.")
+    ap.add_argument("--reps", type=int, default=5)
+    ap.add_argument("--catalogo", type=int, default=10, help="Filas del catálogo del proyecto importado.")
+    ap.add_argument("--solo", default="", help="Escenarios separados por coma.")
+    ap.add_argument("--con-cache", action="store_true",
+                    help="No vaciar la caché de compilados (los aciertos se informan aparte).")
+    ap.add_argument("--timeout", type=int, default=300)
+    ap.add_argument("--salida", default="")
+    args = ap.parse_args(argv)
+
+    # El proyecto se genera en otro proceso: ejecutar app.py en modo bare deja estado
+    # global de Streamlit que interfiere con AppTest en este mismo proceso.
+    json_proyecto = subprocess.check_output([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "generadores.py"),
+        "--preguntas", "35", "--catalogo", str(args.catalogo),
+    ])
+    ctx = {"json_proyecto": json_proyecto}
+    logging.disable(logging.CRITICAL)
+
+    elegidos = [e for e in ESCENARIOS if not args.solo or e in args.solo.split(",")]
+    resultados = {}
+    for nombre in elegidos:
+        muestras = {k: [] for k in ["wall"] + FASES}
+        aciertos = {k: 0 for k in FASES_CACHEADAS}
+        for i in range(args.reps):
+            ctx["i"] = i
+            at = _nueva_sesion(args.timeout)
+            if nombre == "carga_inicial":
+                _medir_run(at, muestras, aciertos, args.con_cache)
+                continue
+            at.run()
+            for accion in ESCENARIOS[nombre](at, ctx):
+                accion()
+                _medir_run(at, muestras, aciertos, args.con_cache)
+        resultados[nombre] = {
+            k: {"p50": round(_percentil(v, 0.5), 2), "p90": round(_percentil(v, 0.9), 2),
+                "p99": round(_percentil(v, 0.99), 2), "media": round(statistics.fmean(v), 2) if v else 0.0,
+                "n": len(v)}
+            for k, v in muestras.items()
+        }
+        for k, n in aciertos.items():
+            resultados[nombre][k]["cache"] = n
+
+    cols = ["wall"] + FASES
+    print(f"{'escenario':<28}" + "".join(f"{c[:16]:>18}" for c in cols), file=sys.stderr)
+    for nombre, r in resultados.items():
+        print(f"{nombre:<28}" + "".join(
+            f"{'caché':>17} " if not r[c]["n"] and r[c].get("cache") else f"{r[c]['p50']:>8.1f}/{r[c]['p90']:>8.1f}"
+            for c in cols), file=sys.stderr)
+    print("(ms, p50/p90 por rerun; \"caché\" = todas las muestras fueron aciertos de caché)", file=sys.stderr)
+    if args.con_cache:
+        for nombre, r in resultados.items():
+            hits = {c: r[c]["cache"] for c in FASES_CACHEADAS if r[c].get("cache")}
+            if hits:
+                print(f"  {nombre}: aciertos de caché " + ", ".join(f"{c}={n}" for c, n in hits.items()),
+                      file=sys.stderr)
+
+    salida = {"parametros": vars(args), "resultados": resultados}
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            fh.write(texto)
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
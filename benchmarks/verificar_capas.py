@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Verificación de ida y vuelta de capas por delegación (capas.derivar → capas.componer)
+#
+# Uso:
+#   python benchmarks/verificar_capas.py [--n 2000] [--seed 7] [--plantilla comercio]
+#
+# Cada caso muta al azar una copia de la plantilla (etiquetas, obligatoria, opciones agregadas /
+# quitadas / renombradas / reordenadas, preguntas nuevas, eliminadas, movidas o renombradas y
+# textos fijos), deriva la capa mínima contra la base y la vuelve a componer: el resultado
+# debe ser el proyecto mutado, pregunta por pregunta y en el mismo orden. Además la capa,
+# pasada a JSON, tiene que leerse con capas.leer_capa.
+# Termina con código 1 si algún caso no se reproduce.
+# ==========================================================================================
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capas  # noqa: E402
+import plantillas  # noqa: E402
+
+_PALABRAS = ["local", "venta", "robo", "horario", "cliente", "zona", "seguridad", "patrulla", "aviso", "barrio"]
+
+
+def _texto(rng: random.Random) -> str:
+    return " ".join(rng.choice(_PALABRAS) for _ in range(rng.randint(1, 4))).capitalize()
+
+
+def _mutar(rng: random.Random, base, textos_base, n_cambios: int):
+    preguntas = [dict(q, opciones=list(q["opciones"])) for q in base]
+    textos = dict(textos_base)
+    nuevas = 0
+    for _ in range(n_cambios):
+        accion = rng.choice(["label", "required", "opcion_mas", "opcion_menos", "opcion_renombre",
+                             "opciones_orden", "agregar", "eliminar", "mover", "renombrar", "texto"])
+        if not preguntas:
+            accion = "agregar"
+        i = rng.randrange(len(preguntas)) if preguntas else 0
+        q = preguntas[i] if preguntas else None
+        if accion == "label":
+            q["label"] = _texto(rng)
+        elif accion == "required":
+            q["required"] = not q.get("required")
+        elif accion == "opcion_mas":
+            nueva = f"{_texto(rng)} {rng.randrange(10 ** 6)}"
+            q["opciones"].insert(rng.randint(0, len(q["opciones"])), nueva)
+        elif accion == "opcion_menos" and q["opciones"]:
+            q["opciones"].pop(rng.randrange(len(q["opciones"])))
+        elif accion == "opcion_renombre" and q["opciones"]:
+            q["opciones"][rng.randrange(len(q["opciones"]))] = f"{_texto(rng)} {rng.randrange(10 ** 6)}"
+        elif accion == "opciones_orden" and len(q["opciones"]) > 1:
+            rng.shuffle(q["opciones"])
+        elif accion == "agregar":
+            nuevas += 1
+            tipo = rng.choice(["Texto (corto)", "Selección única", "Número"])
+            preguntas.insert(rng.randint(0, len(preguntas)), {
+                **plantillas.DEFECTOS_PREGUNTA,
+                "tipo_ui": tipo, "label": _texto(rng), "name": f"nueva_{nuevas}_{rng.randrange(10 ** 6)}",
+                "required": rng.random() < 0.5,
+                "opciones": [_texto(rng) + f" {k}" for k in range(rng.randint(2, 5))] if tipo == "Selección única" else [],
+                "qid": f"qid-nueva-{nuevas}-{rng.randrange(10 ** 9)}",
+            })
+        elif accion == "eliminar":
+            preguntas.pop(i)
+        elif accion == "mover":
+            preguntas.insert(rng.randint(0, len(preguntas) - 1), preguntas.pop(i))
+        elif accion == "renombrar":
+            q["name"] = f"{q['name']}_r{rng.randrange(10 ** 6)}"
+        elif accion == "texto":
+            clave = rng.choice(list(textos) + ["texto_extra"]) if textos else "texto_extra"
+            if rng.random() < 0.2:
+                textos.pop(clave, None)
+            else:
+                textos[clave] = _texto(rng)
+    return preguntas, textos
+
+
+def _normal(q) -> dict:
+    """Pregunta comparable: todos los campos del constructor, sin qid (la composición no lo trae)."""
+    out = {**plantillas.DEFECTOS_PREGUNTA, **{k: v for k, v in dict(q).items() if k != "qid"}}
+    out["opciones"] = list(out["opciones"] or [])
+    return out
+
+
+def verificar(n: int, seed: int, plantilla_id: str) -> list:
+    base_pl = plantillas.leer(plantilla_id)
+    base, textos_base = base_pl["preguntas"], base_pl["textos_fijos"]
+    rng = random.Random(seed)
+    fallas = []
+    for caso in range(n):
+        preguntas, textos = _mutar(rng, base, textos_base, rng.randint(1, 12))
+        capa = {"tipo": capas.TIPO_CAPA, "nombre": f"caso {caso}",
+                "base": {"id": plantilla_id, "version": base_pl["version"]},
+                "operaciones": capas.derivar(base, textos_base, preguntas, textos)}
+        leida = capas.leer_capa(json.dumps(capa, ensure_ascii=False).encode("utf-8"))
+        if leida != capa:
+            fallas.append(f"caso {caso}: la capa no se lee igual desde JSON")
+            continue
+        compuestas, textos_c, avisos = capas.componer(base, textos_base, leida)
+        if avisos:
+            fallas.append(f"caso {caso}: avisos al componer: {avisos[:2]}")
+        if [_normal(q) for q in compuestas] != [_normal(q) for q in preguntas]:
+            fallas.append(f"caso {caso}: las preguntas compuestas no son las del proyecto")
+        if textos_c != textos:
+            fallas.append(f"caso {caso}: los textos fijos compuestos no son los del proyecto")
+    return fallas
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Ida y vuelta de capas (derivar → componer) sobre proyectos mutados.")
+    ap.add_argument("--n", type=int, default=2000, help="Proyectos mutados a verificar.")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--plantilla", default=plantillas.PLANTILLA_DEFAULT)
+    args = ap.parse_args()
+    fallas = verificar(args.n, args.seed, args.plantilla)
+    for f in fallas[:20]:
+        print(f"FALLA  {f}")
+    print(f"OK ({args.n} proyectos)" if not fallas else f"{len(fallas)} fallas de {args.n}")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
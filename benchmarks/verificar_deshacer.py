@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Verificación de Deshacer / Rehacer en la UI (Streamlit AppTest, sin navegador)
+#
+# Uso:
+#   python benchmarks/verificar_deshacer.py
+#
+# Cada acción (borrar, subir, editar una pregunta) termina en un rerun; justo después, sin
+# ningún rerun intermedio, "↩️ Deshacer" debe estar habilitado y restaurar el estado previo,
+# y "↪️ Rehacer" volver a aplicarlo. Un rerun sin cambios no debe apilar pasos.
+# Termina con código 1 si alguna comprobación falla.
+# ==========================================================================================
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from entorno import APP_PATH  # noqa: E402
+
+
+def _sesion():
+    from streamlit.testing.v1 import AppTest
+    return AppTest.from_file(APP_PATH, default_timeout=120).run()
+
+
+def _names(at):
+    return [q["name"] for q in at.session_state["preguntas"]]
+
+
+def _qid(at, i: int) -> str:
+    return at.session_state["preguntas"][i]["qid"]
+
+
+def _accion_borrar(at):
+    at.button(key=f"del_{_qid(at, 3)}").click().run()
+
+
+def _accion_subir(at):
+    at.button(key=f"up_{_qid(at, 6)}").click().run()
+
+
+def _accion_editar(at):
+    qid = _qid(at, 4)
+    at.button(key=f"edit_{qid}").click().run()
+    at.text_input(key=f"e_label_{qid}").input("Etiqueta editada").run()
+    at.button(key=f"e_save_{qid}").click().run()
+
+
+def _etiquetas(at):
+    return [q["label"] for q in at.session_state["preguntas"]]
+
+
+def verificar() -> list:
+    fallas = []
+    for nombre, accion in (("borrar", _accion_borrar), ("subir", _accion_subir), ("editar", _accion_editar)):
+        at = _sesion()
+        at.run()
+        antes = (_names(at), _etiquetas(at))
+        if not at.button(key="btn_undo").disabled:
+            fallas.append(f"{nombre}: Deshacer habilitado sin cambios")
+        accion(at)
+        despues = (_names(at), _etiquetas(at))
+        if despues == antes:
+            fallas.append(f"{nombre}: la acción no cambió el proyecto")
+            continue
+        if at.button(key="btn_undo").disabled:
+            fallas.append(f"{nombre}: Deshacer deshabilitado justo después de la acción")
+            continue
+        at.button(key="btn_undo").click().run()
+        if (_names(at), _etiquetas(at)) != antes:
+            fallas.append(f"{nombre}: Deshacer no restauró el estado previo")
+        if at.button(key="btn_redo").disabled:
+            fallas.append(f"{nombre}: Rehacer deshabilitado después de deshacer")
+            continue
+        at.button(key="btn_redo").click().run()
+        if (_names(at), _etiquetas(at)) != despues:
+            fallas.append(f"{nombre}: Rehacer no volvió a aplicar la acción")
+        pasos = len(at.session_state["_historial"]["undo"])
+        at.run()
+        if len(at.session_state["_historial"]["undo"]) != pasos:
+            fallas.append(f"{nombre}: un rerun sin cambios apiló un paso")
+    return fallas
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="verif_deshacer_"))  # la app crea su SQLite en el cwd
+    fallas = verificar()
+    for f in fallas:
+        print(f"FALLA  {f}")
+    print("OK" if not fallas else f"{len(fallas)} fallas")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
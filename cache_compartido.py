@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Caché LRU por tamaño (bytes), segura entre hilos, para compartir entre sesiones
+# - Clave: hash de contenido (direccionamiento por contenido)
+# - Expulsión por tamaño total y, opcionalmente, por antigüedad (TTL)
+# - Contadores de aciertos / fallos / expulsiones para mostrarlos en la UI
+# ==========================================================================================
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class CacheLRUBytes:
+    def __init__(self, max_bytes: int, ttl_s: Optional[float] = None):
+        self.max_bytes = int(max_bytes)
+        self.ttl_s = ttl_s
+        self._datos = OrderedDict()  # clave -> (valor, tamaño, creado)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def get(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is not None and self.ttl_s is not None and time.time() - item[2] > self.ttl_s:
+                self._quitar(clave)
+                item = None
+            if item is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return item[0]
+
+    def put(self, clave: str, valor: Any, tamano: int):
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (valor, int(tamano), time.time())
+            self._bytes += int(tamano)
+            while self._bytes > self.max_bytes and self._datos:
+                viejo = next(iter(self._datos))
+                self._quitar(viejo)
+                self.expulsiones += 1
+
+    def _quitar(self, clave: str):
+        _, tam, _ = self._datos.pop(clave)
+        self._bytes -= tam
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+            }
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Capas por delegación sobre una plantilla base (herencia: base + parches)
+# - Una capa guarda solo sus diferencias: operaciones agregar / reemplazar / eliminar sobre
+#   preguntas (por qid o name), opciones de una pregunta y textos fijos
+# - componer(): aplica la capa en un recorrido; las preguntas que la capa no toca siguen
+#   siendo los MISMOS objetos de la base (compartidos), solo lo modificado es nuevo
+# - derivar(): capa mínima a partir de un proyecto editado y su plantilla (exportar variante)
+# - leer_capa(): capa desde el archivo subido, validada y tal cual (no pasa por las
+#   migraciones de proyecto de formato_proyecto)
+# ==========================================================================================
+
+import bisect
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+from plantillas import DEFECTOS_PREGUNTA
+
+TIPO_CAPA = "capa"
+OPERACIONES = ("agregar", "reemplazar", "eliminar")
+
+# Campos de pregunta que una capa puede reemplazar (qid y name identifican la pregunta)
+CAMPOS_REEMPLAZABLES = ("tipo_ui", "label", "required", "opciones", "appearance", "choice_filter",
+                        "relevant", "list_override", "matriz", "pagina")
+
+
+def es_capa(data: Dict) -> bool:
+    return isinstance(data, dict) and data.get("tipo") == TIPO_CAPA
+
+
+def hash_capa(capa: Dict) -> str:
+    canon = json.dumps(capa, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+def _objetivo(op: Dict) -> Tuple[str, str]:
+    """(clase, clave) de la operación: ("pregunta", name|qid) / ("opcion", etiqueta) / ("texto", clave)."""
+    for clase in ("pregunta", "opcion", "texto"):
+        if clase in op:
+            v = op[clase]
+            return clase, (v.get("name") if isinstance(v, dict) else v)
+    raise ValueError(f"Operación sin objetivo (pregunta / opcion / texto): {op}")
+
+
+def leer_capa(contenido: bytes) -> Optional[Dict]:
+    """
+    Capa desde los bytes de un archivo subido; None si no es una capa (proyecto JSON o
+    .ecproj). ValueError si es una capa con operaciones que no se pueden aplicar.
+    """
+    try:
+        data = json.loads(contenido.decode("utf-8"))
+    except ValueError:
+        return None
+    if not es_capa(data):
+        return None
+    if not isinstance(data.get("base") or {}, dict):
+        raise ValueError("La capa debe indicar su plantilla base como objeto ({\"id\", \"version\"}).")
+    if not isinstance(data.get("operaciones", []), list):
+        raise ValueError("Las operaciones de la capa deben ser una lista.")
+    for n, op in enumerate(data.get("operaciones", []), start=1):
+        if not isinstance(op, dict) or op.get("op") not in OPERACIONES:
+            raise ValueError(f"Operación #{n} inválida: {op}")
+        clase, clave = _objetivo(op)
+        if not clave:
+            raise ValueError(f"Operación #{n} sin objetivo: {op}")
+        if clase == "pregunta" and op["op"] == "agregar" and not isinstance(op["pregunta"], dict):
+            raise ValueError(f"Operación #{n}: la pregunta a agregar debe ser un objeto con name.")
+        if clase == "pregunta" and op["op"] == "reemplazar" and not isinstance(op.get("campos", {}), dict):
+            raise ValueError(f"Operación #{n}: 'campos' debe ser un objeto.")
+        if clase == "opcion" and not op.get("en"):
+            raise ValueError(f"Operación #{n}: falta la pregunta de la opción ('en').")
+    for k in ("reglas_visibilidad", "reglas_finalizar"):
+        if not isinstance(data.get(k, []), list):
+            raise ValueError(f"'{k}' de la capa debe ser una lista.")
+    return data
+
+
+def componer(base_preguntas, base_textos: Dict, capa: Dict) -> Tuple[List, Dict, List[str]]:
+    """
+    Devuelve (preguntas, textos_fijos, avisos). Operaciones (en orden):
+      {"op": "agregar", "pregunta": {...}, "despues_de": name}       (sin despues_de: al final;
+                                                                       "al_inicio": true: al inicio)
+      {"op": "reemplazar", "pregunta": name|qid, "campos": {...}}
+      {"op": "eliminar", "pregunta": name|qid}
+      {"op": "agregar", "opcion": etiqueta, "en": name|qid, "antes_de": etiqueta}  (sin antes_de: al final)
+      {"op": "reemplazar", "opcion": etiqueta, "en": name|qid, "valor": etiqueta nueva}
+      {"op": "eliminar", "opcion": etiqueta, "en": name|qid}
+      {"op": "reemplazar", "texto": clave, "valor": "..."}  /  {"op": "eliminar", "texto": clave}
+    Un objetivo inexistente no detiene la composición: se informa en `avisos`.
+    """
+    preguntas = list(base_preguntas)
+    textos = dict(base_textos or {})
+    avisos = []
+    indice = {}
+    for i, q in enumerate(preguntas):
+        indice[q.get("name")] = i
+        if q.get("qid"):
+            indice[q["qid"]] = i
+    agregadas: Dict[int, List] = {}  # índice ancla → preguntas nuevas (en orden)
+    propias = set()                  # índices ya copiados (se pueden modificar)
+
+    def _propia(i: int) -> Dict:
+        if i not in propias:
+            preguntas[i] = dict(preguntas[i])
+            preguntas[i]["opciones"] = list(preguntas[i].get("opciones") or [])
+            propias.add(i)
+        return preguntas[i]
+
+    for n, op in enumerate(capa.get("operaciones", []), start=1):
+        accion = op.get("op")
+        clase, clave = _objetivo(op)
+
+        if clase == "texto":
+            if accion == "eliminar":
+                textos.pop(clave, None)
+            else:
+                textos[clave] = op.get("valor", "")
+            continue
+
+        if clase == "pregunta" and accion == "agregar":
+            q = {**DEFECTOS_PREGUNTA, **op["pregunta"]}
+            q["opciones"] = list(q["opciones"] or [])
+            previa = indice.get(q.get("name"))
+            # Se puede volver a agregar una pregunta eliminada antes (p. ej. para moverla)
+            if previa is not None and not (isinstance(previa, int) and preguntas[previa] is None):
+                avisos.append(f"#{n}: la pregunta '{q.get('name')}' ya existe; no se agrega.")
+                continue
+            ancla = -1 if op.get("al_inicio") else indice.get(op.get("despues_de"), len(base_preguntas) - 1)
+            if op.get("despues_de") and op["despues_de"] not in indice:
+                avisos.append(f"#{n}: '{op['despues_de']}' no existe; '{q.get('name')}' se agrega al final.")
+            if isinstance(ancla, tuple):
+                # Después de otra agregada: misma ancla, justo detrás de ella
+                lista = agregadas[ancla[1]]
+                lista.insert(next(j for j, x in enumerate(lista) if x is ancla[2]) + 1, q)
+                ancla = ancla[1]
+            else:
+                agregadas.setdefault(ancla, []).append(q)
+            # Las agregadas pueden ser objetivo de operaciones siguientes
+            indice[q.get("name")] = ("agregada", ancla, q)
+            continue
+
+        destino = op.get("en") if clase == "opcion" else clave
+        pos = indice.get(destino)
+        if pos is None:
+            avisos.append(f"#{n}: la pregunta '{destino}' no existe; operación omitida.")
+            continue
+        if isinstance(pos, tuple):
+            q = pos[2]
+            q["opciones"] = list(q.get("opciones") or [])
+        elif preguntas[pos] is None:
+            avisos.append(f"#{n}: la pregunta '{destino}' fue eliminada antes; operación omitida.")
+            continue
+        elif accion == "eliminar" and clase == "pregunta":
+            preguntas[pos] = None
+            continue
+        else:
+            q = _propia(pos)
+
+        if clase == "pregunta":
+            if accion == "eliminar":
+                lista = agregadas[pos[1]]
+                lista[next(j for j, x in enumerate(lista) if x is q)] = None
+                del indice[destino]
+            else:
+                q.update({k: v for k, v in op.get("campos", {}).items() if k in CAMPOS_REEMPLAZABLES})
+            continue
+
+        # Opciones de una pregunta (por etiqueta)
+        ops = q["opciones"]
+        if accion == "agregar":
+            if clave in ops:
+                continue
+            antes = op.get("antes_de")
+            ops.insert(ops.index(antes) if antes in ops else len(ops), clave)
+        elif clave not in ops:
+            avisos.append(f"#{n}: '{destino}' no tiene la opción '{clave}'.")
+        elif accion == "eliminar":
+            ops.remove(clave)
+        else:
+            ops[ops.index(clave)] = op.get("valor", clave)
+
+    out = list(agregadas.get(-1, []))
+    for i, q in enumerate(preguntas):
+        if q is not None:
+            out.append(q)
+        out.extend(agregadas.get(i, []))
+    return [q for q in out if q is not None], textos, avisos
+
+
+def derivar(base_preguntas, base_textos: Dict, preguntas, textos: Dict) -> List[Dict]:
+    """
+    Operaciones mínimas para obtener `preguntas` / `textos` desde la base (preguntas por qid).
+    Una pregunta de la base que cambió de orden se expresa como eliminar + agregar.
+    """
+    base_pos = {q.get("qid"): i for i, q in enumerate(base_preguntas)}
+    actuales = {q.get("qid") for q in preguntas}
+    ops = []
+
+    # Eliminadas / movidas: quedan en su sitio las de la subsecuencia creciente más larga
+    # (por posición en la base); las demás cambiaron de orden
+    movidas = {q.get("qid") for q in preguntas if q.get("qid") in base_pos} - _en_orden(base_pos, preguntas)
+    for q in base_preguntas:
+        if q.get("qid") not in actuales or q.get("qid") in movidas:
+            ops.append({"op": "eliminar", "pregunta": q["name"]})
+
+    anterior = None
+    for q in preguntas:
+        i = base_pos.get(q.get("qid"))
+        if i is None or q.get("qid") in movidas:
+            ops.append({"op": "agregar", "pregunta": _compacta(q),
+                        **({"despues_de": anterior} if anterior else {"al_inicio": True})})
+        else:
+            ops.extend(_ops_pregunta(base_preguntas[i], q))
+        anterior = q["name"]
+
+    for k, v in (textos or {}).items():
+        if (base_textos or {}).get(k) != v:
+            ops.append({"op": "reemplazar", "texto": k, "valor": v})
+    for k in (base_textos or {}):
+        if k not in (textos or {}):
+            ops.append({"op": "eliminar", "texto": k})
+    return ops
+
+
+def _compacta(q: Dict) -> Dict:
+    """Pregunta sin qid ni campos con su valor por defecto (componer los vuelve a poner)."""
+    out = {}
+    for k, v in dict(q).items():
+        if isinstance(v, tuple):
+            v = list(v)
+        if k != "qid" and (k == "name" or v != DEFECTOS_PREGUNTA.get(k, None)):
+            out[k] = v
+    return out
+
+
+def _en_orden(base_pos: Dict[str, int], preguntas) -> set:
+    """qids de la subsecuencia creciente más larga de posiciones en la base (O(n log n))."""
+    colas, cola_idx, previo, qids = [], [], [], []
+    for q in preguntas:
+        i = base_pos.get(q.get("qid"))
+        if i is None:
+            continue
+        k = bisect.bisect_left(colas, i)
+        if k == len(colas):
+            colas.append(i)
+            cola_idx.append(len(qids))
+        else:
+            colas[k] = i
+            cola_idx[k] = len(qids)
+        previo.append(cola_idx[k - 1] if k else -1)
+        qids.append(q.get("qid"))
+    out = set()
+    j = cola_idx[-1] if cola_idx else -1
+    while j >= 0:
+        out.add(qids[j])
+        j = previo[j]
+    return out
+
+
+def _ops_pregunta(base: Dict, q: Dict) -> List[Dict]:
+    ops = []
+    nombre = base["name"]
+    campos = {}
+    for k in CAMPOS_REEMPLAZABLES:
+        a, b = base.get(k), q.get(k)
+        if k == "opciones":
+            a, b = list(a or []), list(b or [])
+        if a != b and not (a in (None, "") and b in (None, "")):
+            campos[k] = b
+    if q.get("name") != nombre:
+        campos["name"] = q["name"]
+
+    if "opciones" in campos:
+        a, b = list(base.get("opciones") or []), campos["opciones"]
+        quitadas = [o for o in a if o not in b]
+        resto = [o for o in a if o in b]
+        # Solo agregados (en cualquier posición) y quitados: operaciones de opción
+        if resto == [o for o in b if o in a] and len(set(b)) == len(b):
+            del campos["opciones"]
+            ops += [{"op": "eliminar", "opcion": o, "en": nombre} for o in quitadas]
+            for j, o in enumerate(b):
+                if o not in a:
+                    sig = next((x for x in b[j + 1:] if x in a), None)
+                    op = {"op": "agregar", "opcion": o, "en": nombre}
+                    if sig is not None:
+                        op["antes_de"] = sig
+                    ops.append(op)
+    if "name" in campos:
+        # Renombrar una pregunta de la base cambia su columna: va como eliminar + agregar
+        return [{"op": "eliminar", "pregunta": nombre},
+                {"op": "agregar", "pregunta": _compacta(q), "despues_de": nombre}]
+    if campos:
+        ops.insert(0, {"op": "reemplazar", "pregunta": nombre, "campos": campos})
+    return ops
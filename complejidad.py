@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Presupuesto de complejidad del formulario (rendimiento de Survey123 en tabletas viejas)
+# - Sobre el survey / choices ya compilados: por pregunta, largo de relevant / constraint /
+#   calculation / choice_filter, profundidad (niveles del árbol de motor_reglas.parsear; lo
+#   que no descompone cuenta por sus paréntesis), dependencias ${} distintas y cantidad de opciones de su lista; por página, totales y máximos
+# - Avisos contra presupuestos configurables (PRESUPUESTOS, sobrescribibles) y sugerencia de
+#   en cuántas páginas dividir las que se pasan
+# - Un recorrido lineal del survey; las métricas de cada expresión se memorizan por texto
+# - repartir(): división de una página en sub-páginas por bloques indivisibles (la usa
+#   construir_xlsform cuando la división automática está activa)
+# ==========================================================================================
+
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import motor_reglas
+
+COLUMNAS_EXPRESION = ("relevant", "constraint", "calculation", "choice_filter")
+
+PRESUPUESTOS = {
+    "largo_expresion": 1500,     # caracteres de una expresión
+    "profundidad": 10,           # niveles and / or / not anidados
+    "dependencias": 25,          # ${} distintos en las expresiones de una pregunta
+    "opciones_lista": 400,       # opciones de la lista de un select
+    "preguntas_pagina": 25,      # filas visibles en una página (preguntas y notas)
+    "largo_pagina": 15000,       # caracteres de expresiones sumados en la página
+}
+
+ETIQUETAS = {
+    "largo_expresion": "Largo máx. de una expresión (caracteres)",
+    "profundidad": "Profundidad máx. de una expresión",
+    "dependencias": "Dependencias ${} máx. por pregunta",
+    "opciones_lista": "Opciones máx. por lista",
+    "preguntas_pagina": "Preguntas máx. por página",
+    "largo_pagina": "Caracteres de expresiones máx. por página",
+}
+
+SIN_PAGINA = "(sin página)"
+
+_RE_DEP = re.compile(r"\$\{([^}]+)\}")
+_RE_COMILLAS = re.compile(r"'[^']*'|\"[^\"]*\"")
+_RE_PARENTESIS = re.compile(r"[()]")
+_TIPOS_SIN_FILA = ("begin_group", "end_group", "begin_repeat", "end_repeat", "calculate", "hidden",
+                   "start", "end", "today", "deviceid")
+
+
+def presupuestos(sobrescritos: Optional[Dict] = None) -> Dict[str, int]:
+    """PRESUPUESTOS con los valores válidos de `sobrescritos` (enteros positivos)."""
+    out = dict(PRESUPUESTOS)
+    for k, v in (sobrescritos or {}).items():
+        if k in out and isinstance(v, (int, float)) and not isinstance(v, bool) and v > 0:
+            out[k] = int(v)
+    return out
+
+
+def _profundidad_parentesis(texto: str) -> int:
+    """Paréntesis anidados + 1, sin contar los que van dentro de literales."""
+    nivel = maximo = 0
+    for ch in _RE_PARENTESIS.findall(_RE_COMILLAS.sub("''", texto)):
+        if ch == "(":
+            nivel += 1
+            maximo = max(maximo, nivel)
+        elif ch == ")":
+            nivel -= 1
+    return maximo + 1
+
+
+def _profundidad(nodo) -> int:
+    """Niveles de un nodo de motor_reglas: un término vale 1 y cada y / o / not agrega uno."""
+    tipo = nodo[0]
+    if tipo in ("y", "o"):
+        return 1 + max(_profundidad(h) for h in nodo[1])
+    if tipo == "no":
+        return 1 + _profundidad(nodo[1])
+    if tipo == "txt":
+        return _profundidad_parentesis(nodo[1])
+    return 1
+
+
+@lru_cache(maxsize=8192)
+def metricas_expresion(texto: str) -> Tuple[int, int, Tuple[str, ...]]:
+    """
+    (largo, profundidad, dependencias) de una expresión XLSForm. La profundidad sale del árbol
+    de motor_reglas.parsear, así `A and B or C` cuenta el and dentro del or aunque no lleve
+    paréntesis; los términos que el parser deja opacos (o la expresión entera, si no la
+    entiende) cuentan por su anidamiento de paréntesis.
+    """
+    try:
+        profundidad = _profundidad(motor_reglas.parsear(texto))
+    except RecursionError:
+        profundidad = _profundidad_parentesis(texto)
+    sin_literales = _RE_COMILLAS.sub("''", texto)
+    return len(texto), profundidad, tuple(dict.fromkeys(_RE_DEP.findall(sin_literales)))
+
+
+def _columna(df: pd.DataFrame, c: str) -> List[str]:
+    """Valores de una columna como textos ("" si falta o es nulo)."""
+    if c not in df.columns:
+        return [""] * len(df)
+    return ["" if v is None or v != v else str(v).strip() for v in df[c].tolist()]
+
+
+def analizar(df_survey: pd.DataFrame, df_choices: pd.DataFrame,
+             limites: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    {"preguntas": DataFrame, "paginas": DataFrame, "avisos": [{"nivel", "pagina", "name", "mensaje"}]}.
+    La página de una fila es el grupo más externo que la contiene (los table-list van dentro).
+    """
+    limites = presupuestos(limites)
+    opciones_por_lista = df_choices["list_name"].value_counts().to_dict() if "list_name" in df_choices else {}
+    expresiones = {c: _columna(df_survey, c) for c in COLUMNAS_EXPRESION}
+
+    filas = []
+    paginas: Dict[str, Dict] = {}
+    pila: List[str] = []
+    for i, (tipo, name) in enumerate(zip(_columna(df_survey, "type"), _columna(df_survey, "name"))):
+        if tipo == "end_group":
+            if pila:
+                pila.pop()
+            continue
+        if tipo == "begin_group":
+            pila.append(name)
+        pagina = pila[0] if pila else SIN_PAGINA
+
+        largos = {}
+        profundidad = 0
+        deps: Dict[str, None] = {}
+        for c, valores in expresiones.items():
+            t = valores[i]
+            if t:
+                largos[c], prof, d = metricas_expresion(t)
+                profundidad = max(profundidad, prof)
+                deps.update(dict.fromkeys(d))
+        partes = tipo.split()
+        lista = partes[1] if len(partes) > 1 and partes[0].startswith("select_") else ""
+        fila = (pagina, name, tipo, *(largos.get(c, 0) for c in COLUMNAS_EXPRESION),
+                profundidad, len(deps), int(opciones_por_lista.get(lista, 0)))
+        filas.append(fila)
+
+        p = paginas.get(pagina)
+        if p is None:
+            p = paginas[pagina] = {"pagina": pagina, "preguntas": 0, "largo_expresiones": 0,
+                                   "profundidad_max": 0, "dependencias": {}, "opciones": 0}
+        if partes and partes[0] not in _TIPOS_SIN_FILA:
+            p["preguntas"] += 1
+        p["largo_expresiones"] += sum(largos.values())
+        p["profundidad_max"] = max(p["profundidad_max"], profundidad)
+        p["dependencias"].update(deps)
+        p["opciones"] += fila[-1]
+
+    for p in paginas.values():
+        p["dependencias"] = len(p["dependencias"])
+
+    df_p = pd.DataFrame(filas, columns=["pagina", "name", "type"] + [f"largo_{c}" for c in COLUMNAS_EXPRESION]
+                        + ["profundidad", "dependencias", "opciones"])
+    df_pag = pd.DataFrame(list(paginas.values()),
+                          columns=["pagina", "preguntas", "largo_expresiones", "profundidad_max",
+                                   "dependencias", "opciones"])
+    return {"preguntas": df_p, "paginas": df_pag, "avisos": _avisos(filas, paginas.values(), limites)}
+
+
+def costo_filas(filas: List[Dict]) -> Tuple[int, int]:
+    """(preguntas, caracteres de expresiones) de filas del survey, contadas como en analizar()."""
+    preguntas = caracteres = 0
+    for r in filas:
+        tipo = str(r.get("type") or "").split(" ")[0]
+        if tipo and tipo not in _TIPOS_SIN_FILA:
+            preguntas += 1
+        for c in COLUMNAS_EXPRESION:
+            t = r.get(c)
+            if t:
+                caracteres += len(str(t).strip())
+    return preguntas, caracteres
+
+
+def repartir(costos: List[Tuple[int, int]], limites: Optional[Dict[str, int]] = None) -> List[List[int]]:
+    """
+    Reparte bloques consecutivos ((preguntas, caracteres) de cada uno) en páginas que no pasen
+    de preguntas_pagina / largo_pagina, con tamaños parecidos. Un bloque que ya se pasa solo
+    va en su propia página. Devuelve los índices de bloque de cada página.
+    """
+    lim = presupuestos(limites)
+
+    def carga(q: int, c: int) -> float:
+        return max(q / lim["preguntas_pagina"], c / lim["largo_pagina"])
+
+    total = carga(sum(q for q, _ in costos), sum(c for _, c in costos))
+    n = max(1, math.ceil(total))
+    if n == 1:
+        return [list(range(len(costos)))]
+    objetivo = total / n
+    paginas = [[]]
+    q = c = 0
+    for i, (bq, bc) in enumerate(costos):
+        if paginas[-1] and (carga(q + bq, c + bc) > 1 or carga(q, c) >= objetivo):
+            paginas.append([])
+            q = c = 0
+        paginas[-1].append(i)
+        q += bq
+        c += bc
+    return paginas
+
+
+def _avisos(filas: List[Tuple], paginas, lim: Dict[str, int]) -> List[Dict]:
+    avisos = []
+
+    def _aviso(nivel, pagina, name, mensaje):
+        avisos.append({"nivel": nivel, "pagina": pagina, "name": name, "mensaje": mensaje})
+
+    for p in paginas:
+        exceso = max(p["preguntas"] / lim["preguntas_pagina"], p["largo_expresiones"] / lim["largo_pagina"])
+        if exceso > 1:
+            _aviso("página", p["pagina"], "",
+                   f"{p['preguntas']} preguntas y {p['largo_expresiones']:,} caracteres de expresiones "
+                   f"(presupuesto {lim['preguntas_pagina']} / {lim['largo_pagina']:,}): "
+                   f"dividir en {math.ceil(exceso)} páginas")
+
+    n = len(COLUMNAS_EXPRESION)
+    for pagina, name, _tipo, *resto in filas:
+        largo, profundidad, dependencias, opciones = max(resto[:n]), *resto[n:]
+        if largo > lim["largo_expresion"]:
+            _aviso("pregunta", pagina, name,
+                   f"expresión de {largo:,} caracteres (presupuesto {lim['largo_expresion']:,})")
+        if profundidad > lim["profundidad"]:
+            _aviso("pregunta", pagina, name,
+                   f"profundidad {profundidad} (presupuesto {lim['profundidad']})")
+        if dependencias > lim["dependencias"]:
+            _aviso("pregunta", pagina, name,
+                   f"depende de {dependencias} preguntas (presupuesto {lim['dependencias']})")
+        if opciones > lim["opciones_lista"]:
+            _aviso("pregunta", pagina, name,
+                   f"lista de {opciones:,} opciones (presupuesto {lim['opciones_lista']:,}): "
+                   f"usar cascada (choice_filter) o autocomplete")
+    return avisos
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Versión en papel del cuestionario, a partir del XLSForm compilado (survey / choices)
+# - Recorre df_survey una sola vez y produce bloques neutros (página, nota, imagen,
+#   pregunta, matriz) que luego dibujan los exportadores (Word, PDF)
+# - Pistas de salto legibles a partir de `relevant` (nombres → etiquetas)
+# ==========================================================================================
+
+import re
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Con más opciones que esto, se imprimen en línea (catálogos Cantón/Distrito completos)
+LIMITE_OPCIONES_EN_LISTA = 30
+_LARGO_ETIQUETA_PISTA = 60
+
+_RE_SELECTED = re.compile(r"selected\(\s*\$\{([^}]+)\}\s*,\s*'([^']*)'\s*\)")
+_RE_COMPARA = re.compile(r"\$\{([^}]+)\}\s*(!=|=)\s*'([^']*)'")
+_RE_VAR = re.compile(r"\$\{([^}]+)\}")
+
+
+def _txt(v) -> str:
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return ""
+    return str(v)
+
+
+def _corto(s: str) -> str:
+    s = " ".join(s.split())
+    return s if len(s) <= _LARGO_ETIQUETA_PISTA else s[:_LARGO_ETIQUETA_PISTA - 1] + "…"
+
+
+def opciones_por_lista(df_choices: pd.DataFrame) -> Dict[str, List[Dict]]:
+    out = {}
+    if df_choices is None or df_choices.empty:
+        return out
+    for r in df_choices.to_dict(orient="records"):
+        nombre = _txt(r.get("name"))
+        if nombre.startswith("__pick_"):
+            continue
+        out.setdefault(_txt(r.get("list_name")), []).append({"name": nombre, "label": _txt(r.get("label"))})
+    return out
+
+
+def pista_relevant(expr: str, etiquetas: Dict[str, str], listas_por_pregunta: Dict[str, str],
+                   opciones: Dict[str, List[Dict]]) -> str:
+    """Convierte `relevant` en una indicación para el encuestador."""
+    if not expr:
+        return ""
+
+    def _lbl_q(n):
+        return f"«{_corto(etiquetas.get(n, n))}»"
+
+    def _lbl_v(n, v):
+        for o in opciones.get(listas_por_pregunta.get(n, ""), ()):
+            if o["name"] == v:
+                return f"«{_corto(o['label'])}»"
+        return f"«{v}»"
+
+    s = _RE_SELECTED.sub(lambda m: f"{_lbl_q(m.group(1))} incluye {_lbl_v(m.group(1), m.group(2))}", expr)
+    s = _RE_COMPARA.sub(
+        lambda m: f"{_lbl_q(m.group(1))} {'=' if m.group(2) == '=' else '≠'} {_lbl_v(m.group(1), m.group(3))}", s)
+    s = _RE_VAR.sub(lambda m: _lbl_q(m.group(1)), s)
+    s = re.sub(r"\bnot\s*\(", "no (", s)
+    s = re.sub(r"\band\b", "y", s)
+    s = re.sub(r"\bor\b", "o", s)
+    return s
+
+
+def bloques(df_survey: pd.DataFrame, df_choices: pd.DataFrame,
+            omitir_relevant: Optional[str] = None) -> List[Dict]:
+    """
+    Bloques en orden:
+      {"tipo": "pagina", "titulo", "pista"}
+      {"tipo": "nota", "texto", "pista"} / {"tipo": "imagen", "archivo", "texto"}
+      {"tipo": "pregunta", "name", "etiqueta", "clase", "opciones", "lista", "requerida", "pista", "multilinea"}
+        (clase: "una" | "varias" | "texto" | "numero" | "fecha" | "hora" | "gps")
+      {"tipo": "matriz", "titulo", "columnas": [labels], "filas": [{"name", "etiqueta"}], "clase", "pista"}
+    `omitir_relevant` (p. ej. la condición de consentimiento) no se repite como pista en cada pregunta.
+    """
+    filas = df_survey.to_dict(orient="records")
+    opciones = opciones_por_lista(df_choices)
+    etiquetas = {_txt(r.get("name")): _txt(r.get("label")) for r in filas}
+    listas_por_pregunta = {}
+    for r in filas:
+        partes = _txt(r.get("type")).split()
+        if len(partes) == 2 and partes[0] in ("select_one", "select_multiple"):
+            listas_por_pregunta[_txt(r.get("name"))] = partes[1]
+
+    def _pista(expr: str, heredada: str) -> str:
+        if not expr or expr == heredada or expr == omitir_relevant:
+            return ""
+        return pista_relevant(expr, etiquetas, listas_por_pregunta, opciones)
+
+    out = []
+    pila_relevant = [""]
+    matriz = None
+    for r in filas:
+        tipo = _txt(r.get("type"))
+        nombre = _txt(r.get("name"))
+        etiqueta = _txt(r.get("label"))
+        rel = _txt(r.get("relevant"))
+        heredada = pila_relevant[-1]
+
+        if tipo == "begin_group":
+            if _txt(r.get("appearance")) == "table-list":
+                matriz = {"tipo": "matriz", "titulo": etiqueta, "columnas": [], "filas": [],
+                          "clase": "una", "pista": _pista(rel, heredada)}
+            else:
+                out.append({"tipo": "pagina", "titulo": etiqueta, "pista": _pista(rel, "")})
+            pila_relevant.append(rel or heredada)
+            continue
+        if tipo == "end_group":
+            if len(pila_relevant) > 1:
+                pila_relevant.pop()
+            if matriz is not None:
+                out.append(matriz)
+                matriz = None
+            continue
+
+        partes = tipo.split()
+        if matriz is not None and partes and partes[0] in ("select_one", "select_multiple"):
+            if not matriz["columnas"]:
+                matriz["columnas"] = [o["label"] for o in opciones.get(partes[1], [])]
+                matriz["clase"] = "una" if partes[0] == "select_one" else "varias"
+            matriz["filas"].append({"name": nombre, "etiqueta": etiqueta})
+            continue
+
+        if tipo == "note":
+            imagen = _txt(r.get("media::image"))
+            if imagen:
+                out.append({"tipo": "imagen", "archivo": imagen, "texto": etiqueta})
+            else:
+                out.append({"tipo": "nota", "texto": etiqueta, "pista": _pista(rel, heredada)})
+            continue
+
+        clase = {"text": "texto", "integer": "numero", "decimal": "numero", "date": "fecha",
+                 "time": "hora", "geopoint": "gps"}.get(partes[0] if partes else "", "texto")
+        ops, lista = [], ""
+        if partes and partes[0] in ("select_one", "select_multiple"):
+            clase = "una" if partes[0] == "select_one" else "varias"
+            lista = partes[1] if len(partes) > 1 else ""
+            ops = [o["label"] for o in opciones.get(lista, [])]
+        out.append({
+            "tipo": "pregunta", "name": nombre, "etiqueta": etiqueta, "clase": clase, "opciones": ops, "lista": lista,
+            "requerida": _txt(r.get("required")).lower() in ("yes", "true", "1"),
+            "multilinea": _txt(r.get("appearance")) == "multiline",
+            "pista": _pista(rel, heredada),
+        })
+    return out
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Diccionario de datos (codebook) del formulario compilado, en CSV y Parquet
+# - Sale de la misma "forma" del XLSForm que usa la comparación de versiones
+#   (diferencias.forma_xlsform sobre el survey / choices compilados): un solo recorrido
+# - Una fila por campo (name, label, type, página, relevant, required, constraint, columna
+#   del feature service), una por opción (lista, slug, label; cada lista una vez, tras el
+#   primer campo que la usa) y, por cada select_multiple, sus columnas 0/1 de análisis
+#   (<name>__<slug>): Survey123 guarda el campo como texto con los slugs separados por coma
+# - Versionado por hash de contenido: columna "version" y nombre de archivo
+# ==========================================================================================
+
+import io
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+import diferencias
+
+COLUMNAS = ["version", "registro", "name", "label", "type", "pagina", "relevant", "required", "constraint",
+            "list_name", "slug", "columna", "tipo_columna"]
+
+SEP_COLUMNA = "__"  # los slugs no tienen "__": <name>__<slug> no choca con otros campos
+
+
+def columna_opcion(name: str, slug: str) -> str:
+    """Columna 0/1 de una opción de select_multiple."""
+    return f"{name}{SEP_COLUMNA}{slug}"
+
+
+def generar(df_survey: pd.DataFrame, df_choices: pd.DataFrame, version: str) -> pd.DataFrame:
+    """Codebook (COLUMNAS) del survey / choices compilados; "registro" = campo | opcion | columna."""
+    forma = diferencias.forma_xlsform(df_survey.to_dict(orient="records"), df_choices.to_dict(orient="records"))
+    por_lista: Dict[str, List] = {}
+    for (ln, slug), label in forma["opciones"].items():
+        por_lista.setdefault(ln, []).append((slug, label))
+
+    filas = []
+    listas_vistas = set()
+    for c in forma["campos"].values():
+        tipo = c["type"]
+        partes = tipo.split()
+        lista = partes[1] if len(partes) > 1 and partes[0] in ("select_one", "select_multiple") else ""
+        filas.append({
+            "registro": "campo", "name": c["name"], "label": c["label"], "type": tipo, "pagina": c["pagina"],
+            "relevant": c["relevant"], "required": c["required"] == "yes", "constraint": c["constraint"],
+            "list_name": lista, "columna": c["name"], "tipo_columna": diferencias.tipo_columna(tipo),
+        })
+        if not lista:
+            continue
+        if lista not in listas_vistas:
+            listas_vistas.add(lista)
+            filas.extend({"registro": "opcion", "list_name": lista, "slug": slug, "label": label}
+                         for slug, label in por_lista.get(lista, []))
+        if partes[0] == "select_multiple":
+            filas.extend({"registro": "columna", "name": c["name"], "label": f"{c['label']}: {label}",
+                          "pagina": c["pagina"], "list_name": lista, "slug": slug,
+                          "columna": columna_opcion(c["name"], slug), "tipo_columna": "entero (0/1)"}
+                         for slug, label in por_lista.get(lista, []))
+
+    df = pd.DataFrame(filas, columns=COLUMNAS)
+    df["version"] = version
+    text_cols = [k for k in COLUMNAS if k != "required"]
+    df[text_cols] = df[text_cols].fillna("")
+    df["required"] = df["required"].astype("boolean")
+    return df
+
+
+def a_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+def a_parquet(df: pd.DataFrame) -> Optional[bytes]:
+    """Parquet (pyarrow); None si no hay motor de Parquet instalado."""
+    buf = io.BytesIO()
+    try:
+        df.to_parquet(buf, index=False)
+    except ImportError:
+        return None
+    return buf.getvalue()
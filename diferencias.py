@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Diferencias estructurales entre dos versiones (proyecto ↔ proyecto o XLSForm ↔ XLSForm)
+# - Ambas versiones se reducen a una "forma": campos por clave (qid en proyectos, name en
+#   XLSForm) y opciones por (list_name, name); la comparación es un recorrido lineal por dict
+# - Cambios agrupados por página (grupo de survey / página de origen de la pregunta)
+# - Cambios que rompen el esquema del feature service (datos partidos entre columnas):
+#   campo eliminado o renombrado, cambio de tipo de columna, opción eliminada o renombrada
+# ==========================================================================================
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import motor_reglas
+
+# Atributos de survey que se comparan (en ese orden)
+ATRIBUTOS_CAMPO = ("type", "label", "required", "appearance", "choice_filter", "relevant",
+                   "constraint", "reglas")
+
+# Tipo de columna que Survey123 crea en el feature service por tipo XLSForm
+_COLUMNA = {
+    "text": "texto", "select_one": "texto", "select_multiple": "texto", "time": "texto",
+    "integer": "entero", "decimal": "decimal", "date": "fecha", "geopoint": "geometría",
+}
+_SIN_COLUMNA = {"note", "begin_group", "end_group", "begin", "end"}
+
+PAGINA_SIN_GRUPO = "(sin página)"
+PAGINA_LISTAS = "Listas de opciones sin pregunta"
+
+
+def _txt(v) -> str:
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    return str(v).strip()
+
+
+def _base(tipo: str) -> str:
+    partes = tipo.split()
+    return partes[0] if partes else ""
+
+
+def _lista(tipo: str) -> str:
+    partes = tipo.split()
+    return partes[1] if len(partes) > 1 and partes[0] in ("select_one", "select_multiple") else ""
+
+
+# ------------------------------------------------------------------------------------------
+# Formas
+# ------------------------------------------------------------------------------------------
+def forma_xlsform(survey: Iterable[Dict], choices: Iterable[Dict]) -> Dict:
+    """
+    Forma de un XLSForm (filas de survey / choices como dicts; p. ej. df.to_dict("records")).
+    Clave de campo: name. Solo entran filas que crean columna (no notas ni grupos).
+    """
+    campos = {}
+    pila = []
+    for r in survey:
+        tipo = _txt(r.get("type"))
+        base = _base(tipo)
+        if base in ("begin_group", "begin"):
+            pila.append((_txt(r.get("label")) or _txt(r.get("name")), _txt(r.get("appearance")) == "table-list"))
+            continue
+        if base in ("end_group", "end"):
+            if pila:
+                pila.pop()
+            continue
+        nombre = _txt(r.get("name"))
+        if not nombre or base in _SIN_COLUMNA:
+            continue
+        paginas = [g for g, tabla in pila if not tabla]
+        campos[nombre] = {
+            "name": nombre,
+            "pagina": paginas[-1] if paginas else PAGINA_SIN_GRUPO,
+            **{a: _txt(r.get(a)) for a in ATRIBUTOS_CAMPO if a != "reglas"},
+        }
+    opciones = {}
+    for r in choices:
+        ln, n = _txt(r.get("list_name")), _txt(r.get("name"))
+        if ln and n and not n.startswith("__pick_"):
+            opciones[(ln, n)] = _txt(r.get("label"))
+    return {"clave": "name", "campos": campos, "opciones": opciones}
+
+
+def forma_proyecto(proyecto: Dict, tipo_xlsform: Callable[[str, str], tuple],
+                   slugify: Callable[[str], str], paginas: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Forma de un proyecto del constructor. Clave de campo: qid (detecta renombres de `name`).
+    `tipo_xlsform(tipo_ui, name)` → (type, appearance, list_name), como en la compilación.
+    `paginas` (name → página) completa la página de las preguntas que no traen "pagina".
+    Las opciones usan los mismos name que genera la compilación (slug + sufijo si se repite).
+    """
+    paginas = paginas or {}
+    reglas = {}
+    for r in proyecto.get("reglas_visibilidad", []):
+        reglas.setdefault(r.get("target"), []).append(motor_reglas.describir(r))
+
+    campos = {}
+    opciones = {}
+    for q in proyecto.get("preguntas", []):
+        nombre = q.get("name", "")
+        tipo, app_defecto, lista = tipo_xlsform(q.get("tipo_ui", ""), nombre)
+        if lista and q.get("list_override"):
+            lista = q["list_override"]
+            tipo = f"{_base(tipo)} {lista}"
+        campos[q.get("qid") or nombre] = {
+            "name": nombre,
+            "pagina": q.get("pagina") or paginas.get(nombre) or PAGINA_SIN_GRUPO,
+            "type": tipo,
+            "label": _txt(q.get("label")),
+            "required": "yes" if q.get("required") else "",
+            "appearance": _txt(q.get("appearance") or app_defecto),
+            "choice_filter": _txt(q.get("choice_filter")),
+            "relevant": _txt(q.get("relevant")),
+            "constraint": "",
+            "reglas": " | ".join(sorted(reglas.get(nombre, []))),
+        }
+        if lista and nombre not in ("canton", "distrito"):
+            usados = set()
+            for etiqueta in q.get("opciones") or []:
+                base = slugify(etiqueta)
+                n, i = base, 2
+                while n in usados:
+                    n, i = f"{base}_{i}", i + 1
+                usados.add(n)
+                opciones.setdefault((lista, n), str(etiqueta))
+    for r in proyecto.get("choices_ext_rows", []):
+        ln, n = _txt(r.get("list_name")), _txt(r.get("name"))
+        if ln and n and not n.startswith("__pick_"):
+            opciones[(ln, n)] = _txt(r.get("label"))
+    return {"clave": "qid", "campos": campos, "opciones": opciones}
+
+
+# ------------------------------------------------------------------------------------------
+# Comparación
+# ------------------------------------------------------------------------------------------
+def _cambio(elemento, accion, pagina, clave, nombre, detalle=None, rompe=False, motivo="") -> Dict:
+    return {"elemento": elemento, "accion": accion, "pagina": pagina, "clave": clave, "name": nombre,
+            "detalle": detalle or [], "rompe": rompe, "motivo": motivo}
+
+
+def tipo_columna(tipo: str) -> Optional[str]:
+    """Tipo de columna del feature service para un type XLSForm."""
+    return _COLUMNA.get(_base(tipo), "texto")
+
+
+def comparar(antes: Dict, despues: Dict) -> List[Dict]:
+    """
+    Cambios de `antes` → `despues` (formas del mismo tipo). Cada cambio:
+      {"elemento": "campo"|"opcion", "accion": "agregado"|"eliminado"|"modificado"|"renombrado",
+       "pagina", "clave", "name", "detalle": [(atributo, antes, despues)], "rompe", "motivo"}
+    Orden: el de `despues`, y luego lo eliminado en el orden de `antes`.
+    """
+    ca, cb = antes["campos"], despues["campos"]
+    cambios: List[Dict] = []
+    agregados = []
+    pares = []  # (campo antes, campo después) emparejados por clave o por renombre
+
+    for k, b in cb.items():
+        a = ca.get(k)
+        if a is None:
+            agregados.append(k)
+            continue
+        pares.append((a, b))
+        detalle = [(at, a.get(at, ""), b.get(at, "")) for at in ATRIBUTOS_CAMPO if a.get(at, "") != b.get(at, "")]
+        if a["name"] != b["name"]:
+            cambios.append(_cambio("campo", "renombrado", b["pagina"], k, b["name"],
+                                   [("name", a["name"], b["name"])] + detalle, True,
+                                   f"La columna '{a['name']}' pasa a '{b['name']}': los datos ya enviados "
+                                   f"quedan en la columna anterior."))
+            continue
+        if not detalle:
+            continue
+        rompe, motivo = False, ""
+        if tipo_columna(a["type"]) != tipo_columna(b["type"]):
+            rompe = True
+            motivo = f"Cambia el tipo de columna ({tipo_columna(a['type'])} → {tipo_columna(b['type'])})."
+        cambios.append(_cambio("campo", "modificado", b["pagina"], k, b["name"], detalle, rompe, motivo))
+
+    eliminados = [k for k in ca if k not in cb]
+
+    # Sin qid (XLSForm), un renombre aparece como eliminado + agregado con la misma etiqueta y tipo
+    por_firma = {}
+    if antes.get("clave") == "name":
+        for k in eliminados:
+            por_firma.setdefault((ca[k]["label"], ca[k]["type"]), []).append(k)
+    emparejados = set()
+    for k in agregados:
+        b = cb[k]
+        candidatos = por_firma.get((b["label"], b["type"]))
+        if candidatos:
+            viejo = candidatos.pop(0)
+            emparejados.add(viejo)
+            pares.append((ca[viejo], b))
+            cambios.append(_cambio("campo", "renombrado", b["pagina"], k, b["name"],
+                                   [("name", ca[viejo]["name"], b["name"])], True,
+                                   f"Posible renombre de '{ca[viejo]['name']}' (misma etiqueta y tipo): "
+                                   f"los datos ya enviados quedan en la columna anterior."))
+        else:
+            cambios.append(_cambio("campo", "agregado", b["pagina"], k, b["name"]))
+    for k in eliminados:
+        if k not in emparejados:
+            a = ca[k]
+            cambios.append(_cambio("campo", "eliminado", a["pagina"], k, a["name"], rompe=True,
+                                   motivo=f"La columna '{a['name']}' deja de recibir datos."))
+
+    # Lista implícita (list_<name>) que cambia con el campo: sus opciones se comparan como una sola
+    en_uso = _pagina_por_lista(despues)
+    listas_renombradas = {}
+    for a, b in pares:
+        la, lb = _lista(a["type"]), _lista(b["type"])
+        if la and lb and la != lb and la not in en_uso:
+            listas_renombradas[la] = lb
+    cambios.extend(_comparar_opciones(antes, despues, listas_renombradas))
+    return cambios
+
+
+def _pagina_por_lista(*formas: Dict) -> Dict[str, str]:
+    out = {}
+    for f in formas:
+        for c in f["campos"].values():
+            ln = _lista(c["type"])
+            if ln:
+                out.setdefault(ln, c["pagina"])
+    return out
+
+
+def _comparar_opciones(antes: Dict, despues: Dict, listas_renombradas: Dict[str, str]) -> List[Dict]:
+    oa, ob = antes["opciones"], despues["opciones"]
+    if listas_renombradas:
+        oa = {(listas_renombradas.get(ln, ln), n): lbl for (ln, n), lbl in oa.items()}
+    pagina = _pagina_por_lista(despues, antes)
+    # Solo rompe si la lista sigue en uso: si desaparece con su pregunta, ya se informa el campo
+    usadas = set(_pagina_por_lista(despues))
+    cambios = []
+
+    agregadas = []
+    for k, lbl in ob.items():
+        if k not in oa:
+            agregadas.append(k)
+        elif oa[k] != lbl:
+            cambios.append(_cambio("opcion", "modificado", pagina.get(k[0], PAGINA_LISTAS), k, k[1],
+                                   [("label", oa[k], lbl)]))
+
+    # Opción eliminada con otra agregada en la misma lista y misma etiqueta → renombre
+    por_etiqueta = {}
+    for k, lbl in oa.items():
+        if k not in ob:
+            por_etiqueta.setdefault((k[0], lbl), []).append(k)
+    for k in agregadas:
+        candidatos = por_etiqueta.get((k[0], ob[k]))
+        pag = pagina.get(k[0], PAGINA_LISTAS)
+        if candidatos:
+            viejo = candidatos.pop(0)
+            cambios.append(_cambio("opcion", "renombrado", pag, k, k[1], [("name", viejo[1], k[1])],
+                                   k[0] in usadas,
+                                   f"Las respuestas guardadas como '{viejo[1]}' no coinciden con '{k[1]}'."))
+        else:
+            cambios.append(_cambio("opcion", "agregado", pag, k, k[1]))
+    for restantes in por_etiqueta.values():
+        for k in restantes:
+            cambios.append(_cambio("opcion", "eliminado", pagina.get(k[0], PAGINA_LISTAS), k, k[1],
+                                   rompe=k[0] in usadas,
+                                   motivo=f"Las respuestas con '{k[1]}' quedan fuera del dominio de la lista."))
+    return cambios
+
+
+# ------------------------------------------------------------------------------------------
+# Presentación
+# ------------------------------------------------------------------------------------------
+def por_pagina(cambios: List[Dict]) -> List[Tuple[str, List[Dict]]]:
+    """[(página, cambios)] en el orden en que aparece cada página."""
+    grupos: Dict[str, List[Dict]] = {}
+    for c in cambios:
+        grupos.setdefault(c["pagina"], []).append(c)
+    return list(grupos.items())
+
+
+def resumen(cambios: List[Dict]) -> Dict[str, int]:
+    out = {"campos": 0, "opciones": 0, "rompen": 0}
+    for c in cambios:
+        out["campos" if c["elemento"] == "campo" else "opciones"] += 1
+        out["rompen"] += int(c["rompe"])
+    return out
+
+
+def filas_tabla(cambios: List[Dict]) -> List[Dict]:
+    filas = []
+    for c in cambios:
+        filas.append({
+            "⚠️": "rompe" if c["rompe"] else "",
+            "elemento": "campo" if c["elemento"] == "campo" else f"opción ({c['clave'][0]})",
+            "name": c["name"],
+            "cambio": c["accion"],
+            "detalle": "; ".join(f"{at}: {a or '∅'} → {b or '∅'}" for at, a, b in c["detalle"]),
+            "motivo": c["motivo"],
+        })
+    return filas
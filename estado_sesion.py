@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Huella de memoria de st.session_state y limpieza de estado obsoleto
+# - Bytes por clave (tamaño profundo, cada objeto se cuenta una sola vez) y por categoría
+# - Lo compartido entre sesiones (MappingProxyType del seed / catálogo) se informa aparte:
+#   no crece con la sesión
+# - Limpieza: widgets de preguntas eliminadas (qid), formularios de edición cerrados,
+#   botones de reglas que ya no existen y artefactos sin dueño
+# ==========================================================================================
+
+import sys
+from collections import deque
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Optional, Set
+
+import reglas
+
+# Widgets creados por pregunta (key = prefijo + qid). Los "del_vis_"/"del_fin_" son de reglas
+# (por id de regla) y se revisan antes que "del_" para no confundirlos con un qid.
+PREFIJOS_EDICION = ("e_label_", "e_name_", "e_req_", "e_app_", "e_cf_", "e_rel_", "e_opts_",
+                    "e_save_", "e_cancel_")
+PREFIJOS_LISTA = ("up_", "down_", "edit_", "del_")
+# Widgets por regla: sufijo = id de la regla (reglas.id_regla), prefijo → tipo
+PREFIJOS_REGLAS = {"del_vis_": "vis", "del_fin_": "fin", "dup_vis_": "vis", "dup_fin_": "fin"}
+
+CATEGORIAS = {
+    "preguntas": "Preguntas",
+    "edit_qid": "Preguntas",
+    "seed_cargado": "Preguntas",
+    "plantilla": "Preguntas",
+    "_preguntas_hash": "Preguntas",
+    "choices_ext_rows": "Catálogo",
+    "choices_extra_cols": "Catálogo",
+    "_catalogo_hash": "Catálogo",
+    "_logo_bytes": "Logo",
+    "_logo_name": "Logo",
+    "_logo_hash": "Logo",
+    "_historial": "Historial (deshacer)",
+    "_filas_huella": "Historial (deshacer)",
+    "_filas_historial": "Historial (deshacer)",
+    "_filas_guardadas": "Proyecto (SQLite)",
+    "_mut": "Historial (deshacer)",
+    "_proy_meta_fin": "Historial (deshacer)",
+    "_db_conn": "Proyecto (SQLite)",
+    "_proy_hashes": "Proyecto (SQLite)",
+    "_proy_id": "Proyecto (SQLite)",
+    "_proy_nombre": "Proyecto (SQLite)",
+    "_import_file_id": "Proyecto (SQLite)",
+    "_perf_fases": "Instrumentación",
+    "reglas_visibilidad": "Reglas",
+    "reglas_finalizar": "Reglas",
+    "_indice_reglas": "Reglas",
+    "textos_fijos": "Textos",
+    "traducciones": "Textos",
+    "presupuestos": "Complejidad",
+    "dividir_paginas": "Complejidad",
+    "_mig_resultado": "Migración de respuestas",
+}
+
+# Artefactos que solo tienen sentido si existe su "dueño" en el estado
+_DEPENDIENTES = {
+    "_proy_hashes": "_proy_id",
+    "_proy_nombre": "_proy_id",
+}
+
+
+def _qid_de(clave: str) -> Optional[tuple]:
+    """(tipo, prefijo, sufijo) si la clave es un widget por pregunta o por regla."""
+    if clave in CATEGORIAS:
+        return None
+    for pref in PREFIJOS_REGLAS:
+        if clave.startswith(pref):
+            return ("regla", pref, clave[len(pref):])
+    for pref in PREFIJOS_EDICION:
+        if clave.startswith(pref):
+            return ("edicion", pref, clave[len(pref):])
+    for pref in PREFIJOS_LISTA:
+        if clave.startswith(pref):
+            return ("lista", pref, clave[len(pref):])
+    return None
+
+
+def categoria(clave: str, qids: Set[str]) -> str:
+    if clave in CATEGORIAS:
+        return CATEGORIAS[clave]
+    w = _qid_de(clave)
+    if w is not None:
+        if w[0] == "regla":
+            return "Widgets de reglas"
+        return "Widgets por pregunta" if w[2] in qids else "Widgets huérfanos"
+    if clave.startswith(("sb_", "btn_")):
+        return "Widgets de la barra lateral"
+    return "Otros"
+
+
+def tamano_profundo(obj, vistos: Set[int], compartido: Optional[List[int]] = None) -> int:
+    """Bytes propios de `obj` y lo que cuelga de él; lo ya visto no se vuelve a contar.
+
+    Los MappingProxyType (datos congelados y compartidos entre sesiones) se suman a
+    `compartido[0]` en lugar del total propio.
+    """
+    pila = [(obj, False)]
+    total = 0
+    while pila:
+        o, es_compartido = pila.pop()
+        if id(o) in vistos:
+            continue
+        vistos.add(id(o))
+        es_compartido = es_compartido or isinstance(o, MappingProxyType)
+        try:
+            n = sys.getsizeof(o)
+        except TypeError:
+            n = 0
+        if es_compartido and compartido is not None:
+            compartido[0] += n
+        else:
+            total += n
+        if isinstance(o, (dict, MappingProxyType)):
+            pila.extend((x, es_compartido) for kv in o.items() for x in kv)
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            pila.extend((x, es_compartido) for x in o)
+        elif hasattr(o, "__dict__") and not isinstance(o, type):
+            pila.append((vars(o), es_compartido))
+    return total
+
+
+def huella(estado, qids: Iterable[str]) -> List[Dict]:
+    """Filas {clave, categoria, bytes, compartido_bytes}, de mayor a menor."""
+    qids = set(qids)
+    vistos = set()
+    filas = []
+    for clave in list(estado.keys()):
+        compartido = [0]
+        try:
+            valor = estado[clave]
+        except KeyError:
+            continue
+        n = tamano_profundo(valor, vistos, compartido)
+        filas.append({"clave": clave, "categoria": categoria(clave, qids),
+                      "bytes": n, "compartido_bytes": compartido[0]})
+    filas.sort(key=lambda f: -f["bytes"])
+    return filas
+
+
+def resumen_por_categoria(filas: List[Dict]) -> List[Dict]:
+    por_cat = {}
+    for f in filas:
+        c = por_cat.setdefault(f["categoria"], {"categoria": f["categoria"], "claves": 0,
+                                                "bytes": 0, "compartido_bytes": 0})
+        c["claves"] += 1
+        c["bytes"] += f["bytes"]
+        c["compartido_bytes"] += f["compartido_bytes"]
+    return sorted(por_cat.values(), key=lambda c: -c["bytes"])
+
+
+def claves_obsoletas(estado, qids: Iterable[str], edit_qid: Optional[str] = None) -> List[str]:
+    """Claves que ya no corresponden a nada vivo en el estado (seguras de borrar al final
+    del rerun, cuando los widgets ya se procesaron)."""
+    qids = set(qids)
+    ids_reglas = {}
+    obsoletas = []
+    for clave in list(estado.keys()):
+        w = _qid_de(clave)
+        if w is not None:
+            tipo, pref, sufijo = w
+            if tipo == "regla":
+                t = PREFIJOS_REGLAS[pref]
+                if t not in ids_reglas:
+                    ids_reglas[t] = {reglas.id_regla(t, r) for r in estado.get(reglas.TIPOS[t]) or []}
+                if sufijo not in ids_reglas[t]:
+                    obsoletas.append(clave)
+            elif sufijo not in qids:
+                obsoletas.append(clave)
+            elif tipo == "edicion" and sufijo != edit_qid:
+                obsoletas.append(clave)
+        elif clave in _DEPENDIENTES and not estado.get(_DEPENDIENTES[clave]):
+            obsoletas.append(clave)
+    if "_logo_bytes" in estado and estado.get("_logo_bytes") is None:
+        obsoletas.append("_logo_bytes")
+    return obsoletas
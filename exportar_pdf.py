@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Cuestionario imprimible en PDF (reportlab), individual o en lote por delegación
+# - Fuente: bloques de cuestionario_papel (XLSForm compilado)
+# - Fuentes TTF registradas UNA vez por proceso (DejaVu si está en el sistema; si no, Vera
+#   que trae reportlab, con sustitutos para los símbolos que no tenga)
+# - Las páginas compartidas se convierten a flowables una sola vez por contenido y se
+#   reutilizan (copia superficial) en cada documento; por delegación solo cambian el
+#   título, el logo y las listas Cantón / Distrito
+# - Lote: varios procesos (spawn: no se bifurca el servidor de Streamlit) → un ZIP
+# ==========================================================================================
+
+import os
+import copy
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import reportlab
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Image, KeepTogether, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+import cuestionario_papel
+import medios
+
+# Listas que cambian por delegación (el resto del cuestionario es común)
+LISTAS_POR_DELEGACION = ("list_canton", "list_distrito")
+
+# Por debajo de esto no compensa arrancar procesos (spawn + importar reportlab)
+MIN_DELEGACIONES_PARALELO = 3
+
+_CANDIDATAS_TTF = [
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/TTF/DejaVuSans.ttf", "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf"),
+    (os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf"),
+     os.path.join(os.path.dirname(reportlab.__file__), "fonts", "VeraBd.ttf")),
+]
+
+_fuentes: Optional[Dict] = None
+_plan_cache: Dict[str, List] = {}
+
+
+def fuentes() -> Dict:
+    """Registra las fuentes una vez por proceso; devuelve nombres, estilos y símbolos."""
+    global _fuentes
+    if _fuentes is not None:
+        return _fuentes
+    normal, negrita = "Helvetica", "Helvetica-Bold"
+    glifos = set()
+    for ruta, ruta_b in _CANDIDATAS_TTF:
+        if os.path.exists(ruta) and os.path.exists(ruta_b):
+            f = TTFont("EC-Normal", ruta)
+            pdfmetrics.registerFont(f)
+            pdfmetrics.registerFont(TTFont("EC-Negrita", ruta_b))
+            pdfmetrics.registerFontFamily("EC", normal="EC-Normal", bold="EC-Negrita",
+                                          italic="EC-Normal", boldItalic="EC-Negrita")
+            normal, negrita = "EC-Normal", "EC-Negrita"
+            glifos = set(f.face.charToGlyph)
+            break
+
+    def _simbolo(preferido: str, sustituto: str) -> str:
+        return preferido if all(ord(c) in glifos for c in preferido) else sustituto
+
+    estilos = {
+        "titulo": ParagraphStyle("ec_titulo", fontName=negrita, fontSize=16, leading=20, spaceAfter=8),
+        "pagina": ParagraphStyle("ec_pagina", fontName=negrita, fontSize=12.5, leading=16,
+                                 spaceBefore=10, spaceAfter=4, textColor=colors.HexColor("#1F3864")),
+        "pregunta": ParagraphStyle("ec_pregunta", fontName=negrita, fontSize=10, leading=13, spaceBefore=7, spaceAfter=2),
+        "opcion": ParagraphStyle("ec_opcion", fontName=normal, fontSize=9.5, leading=12, leftIndent=14),
+        "pista": ParagraphStyle("ec_pista", fontName=normal, fontSize=8.5, leading=11,
+                                textColor=colors.HexColor("#595959"), spaceAfter=1),
+        "nota": ParagraphStyle("ec_nota", fontName=normal, fontSize=9.5, leading=12.5, spaceAfter=4),
+        "respuesta": ParagraphStyle("ec_respuesta", fontName=normal, fontSize=9.5, leading=16, leftIndent=14),
+        "celda": ParagraphStyle("ec_celda", fontName=normal, fontSize=8.5, leading=10.5),
+    }
+    _fuentes = {
+        "normal": normal, "negrita": negrita, "estilos": estilos,
+        "casilla": _simbolo("☐", "[  ]"), "flecha": _simbolo("→", "->"),
+    }
+    return _fuentes
+
+
+def _p(texto: str, estilo: str) -> Paragraph:
+    f = fuentes()
+    return Paragraph(escape(texto).replace("\n", "<br/>"), f["estilos"][estilo])
+
+
+def _hash_bloques(bloques: List[Dict]) -> str:
+    return hashlib.sha256(json.dumps(bloques, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _flowables_pregunta(b: Dict, opciones: Optional[List[str]] = None) -> List:
+    f = fuentes()
+    casilla, flecha = f["casilla"], f["flecha"]
+    out = [_p(b["etiqueta"] + (" *" if b.get("requerida") else ""), "pregunta")]
+    if b.get("pista"):
+        out.append(_p(f"{flecha} Responder solo si {b['pista']}", "pista"))
+    if b["clase"] in ("una", "varias"):
+        ops = b["opciones"] if opciones is None else opciones
+        out.append(_p("(Marque una opción)" if b["clase"] == "una" else "(Marque todas las que apliquen)", "pista"))
+        if len(ops) > cuestionario_papel.LIMITE_OPCIONES_EN_LISTA:
+            out.append(_p("   ".join(f"{casilla} {o}" for o in ops), "opcion"))
+        else:
+            out.extend(_p(f"{casilla} {o}", "opcion") for o in ops)
+    else:
+        linea = {"numero": "__________", "fecha": "____ / ____ / ________   (día / mes / año)",
+                 "hora": "____ : ____", "gps": "Latitud: ______________   Longitud: ______________"
+                 }.get(b["clase"], "_" * 80)
+        for _ in range(3 if b.get("multilinea") else 1):
+            out.append(_p(linea, "respuesta"))
+    # Una pregunta corta no se parte entre páginas; las listas largas sí pueden partirse
+    return [KeepTogether(out)] if len(out) <= 14 else out
+
+
+def _flowables_matriz(b: Dict) -> List:
+    f = fuentes()
+    out = [_p(b["titulo"], "pregunta")]
+    if b.get("pista"):
+        out.append(_p(f"{f['flecha']} Responder solo si {b['pista']}", "pista"))
+    cols = b["columnas"]
+    datos = [[""] + [_p(c, "celda") for c in cols]]
+    datos += [[_p(r["etiqueta"], "celda")] + [f["casilla"]] * len(cols) for r in b["filas"]]
+    ancho = A4[0] - 4 * cm
+    primera = ancho * 0.34
+    tabla = Table(datos, colWidths=[primera] + [(ancho - primera) / max(len(cols), 1)] * len(cols), repeatRows=1)
+    tabla.setStyle(TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.4, colors.grey),
+        ("FONTNAME", (0, 0), (-1, -1), f["normal"]),
+        ("ALIGN", (1, 1), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#EDEDED")),
+    ]))
+    out.append(tabla)
+    return [KeepTogether(out)]
+
+
+def plan_compartido(bloques: List[Dict]) -> List[Tuple]:
+    """
+    Flowables de todo lo común, construidos una vez por contenido y proceso:
+    ("fijo", [flowables]) | ("imagen", None) | ("lista", bloque) para las listas por delegación.
+    """
+    clave = _hash_bloques(bloques)
+    plan = _plan_cache.get(clave)
+    if plan is not None:
+        return plan
+    f = fuentes()
+    plan = []
+    for b in bloques:
+        t = b["tipo"]
+        if t == "pagina":
+            fl = [_p(b["titulo"], "pagina")]
+            if b.get("pista"):
+                fl.append(_p(f"{f['flecha']} Solo si {b['pista']}", "pista"))
+            plan.append(("fijo", fl))
+        elif t == "imagen":
+            plan.append(("imagen", None))
+        elif t == "nota":
+            fl = [_p(f"{f['flecha']} Solo si {b['pista']}", "pista")] if b.get("pista") else []
+            fl.append(_p(b["texto"], "nota"))
+            plan.append(("fijo", fl))
+        elif t == "pregunta" and b.get("lista") in LISTAS_POR_DELEGACION:
+            plan.append(("lista", b))
+        elif t == "pregunta":
+            plan.append(("fijo", _flowables_pregunta(b)))
+        elif t == "matriz":
+            plan.append(("fijo", _flowables_matriz(b)))
+    if len(_plan_cache) > 8:
+        _plan_cache.clear()
+    _plan_cache[clave] = plan
+    return plan
+
+
+def opciones_delegacion(catalogo: List[Dict], delegacion: str, slugify) -> Dict[str, List[str]]:
+    """
+    Listas Cantón / Distrito para una delegación: si un cantón del catálogo coincide con el
+    nombre de la delegación, solo ese cantón y sus distritos; si no, el catálogo completo.
+    """
+    cantones = [r for r in catalogo if r.get("list_name") == "list_canton" and not str(r.get("name", "")).startswith("__pick_")]
+    distritos = [r for r in catalogo if r.get("list_name") == "list_distrito" and not str(r.get("name", "")).startswith("__pick_")]
+    slug = slugify(delegacion)
+    propios = [c for c in cantones if c.get("name") == slug or slugify(str(c.get("label", ""))) == slug]
+    if propios:
+        claves = {c["name"] for c in propios}
+        cantones = propios
+        distritos = [d for d in distritos if d.get("canton_key") in claves]
+    return {"list_canton": [str(c.get("label", "")) for c in cantones],
+            "list_distrito": [str(d.get("label", "")) for d in distritos]}
+
+
+def documento_pdf(bloques: List[Dict], titulo: str, logo: Optional[bytes] = None,
+                  listas: Optional[Dict[str, List[str]]] = None) -> bytes:
+    """PDF A4 del cuestionario; `listas` reemplaza las opciones de LISTAS_POR_DELEGACION."""
+    listas = listas or {}
+    historia = [_p(titulo, "titulo")]
+    for tipo, contenido in plan_compartido(bloques):
+        if tipo == "fijo":
+            historia.extend(copy.copy(fl) for fl in contenido)
+        elif tipo == "imagen":
+            if logo:
+                try:
+                    ancho, alto = ImageReader(BytesIO(logo)).getSize()
+                    historia.append(Image(BytesIO(logo), width=3.5 * cm, height=3.5 * cm * alto / max(ancho, 1)))
+                    historia.append(Spacer(1, 6))
+                except Exception:
+                    pass
+        elif tipo == "lista":
+            historia.extend(_flowables_pregunta(contenido, listas.get(contenido["lista"])))
+
+    out = BytesIO()
+    doc = SimpleDocTemplate(out, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm,
+                            topMargin=1.8 * cm, bottomMargin=1.8 * cm, title=titulo)
+    doc.build(historia)
+    return out.getvalue()
+
+
+# ------------------------------------------------------------------------------------------
+# Lote en paralelo: cada proceso recibe los bloques / logo UNA vez (initializer) y luego
+# solo (título, listas) por delegación
+# ------------------------------------------------------------------------------------------
+_trabajo: Dict = {}
+
+
+def _iniciar_trabajador(bloques: List[Dict], logo: Optional[bytes]):
+    _trabajo["bloques"] = bloques
+    _trabajo["logo"] = logo
+    plan_compartido(bloques)
+
+
+def _render_trabajador(args: Tuple[str, Dict[str, List[str]]]) -> bytes:
+    titulo, listas = args
+    return documento_pdf(_trabajo["bloques"], titulo, _trabajo["logo"], listas)
+
+
+def lote_por_delegacion(bloques: List[Dict], trabajos: List[Tuple[str, str, Dict[str, List[str]]]],
+                        logo: Optional[bytes] = None, procesos: Optional[int] = None) -> bytes:
+    """
+    `trabajos`: [(nombre_archivo, titulo, listas)] → ZIP con un PDF por delegación.
+    Con pocas delegaciones se renderiza en este proceso.
+    """
+    procesos = procesos or min(len(trabajos), os.cpu_count() or 1, 8)
+    if procesos <= 1 or len(trabajos) < MIN_DELEGACIONES_PARALELO:
+        pdfs = [documento_pdf(bloques, titulo, logo, listas) for _, titulo, listas in trabajos]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_iniciar_trabajador, initargs=(bloques, logo)) as ex:
+            pdfs = list(ex.map(_render_trabajador, [(titulo, listas) for _, titulo, listas in trabajos]))
+    return medios.zip_archivos({nombre: pdf for (nombre, _, _), pdf in zip(trabajos, pdfs)})
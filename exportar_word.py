@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Exportar el cuestionario en papel a Word (.docx) con python-docx
+# - Fuente: bloques de cuestionario_papel (XLSForm compilado)
+# - Estilos propios (pregunta / opción / pista / nota) creados UNA vez en una plantilla
+#   en memoria; cada documento parte de esa plantilla y referencia los estilos por id
+#   (resolver un estilo por nombre en python-docx recorre todos los estilos en cada párrafo)
+# - Opciones como casillas (☐), matriz como tabla, pistas de salto a partir de `relevant`
+# - Lote por delegación: un .docx por delegación dentro de un ZIP
+# ==========================================================================================
+
+from io import BytesIO
+from typing import Callable, Dict, Iterable, List, Optional
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import Cm, Pt, RGBColor
+
+import cuestionario_papel
+import medios
+
+CASILLA = "☐"
+_INSTRUCCION = {"una": "(Marque una opción)", "varias": "(Marque todas las que apliquen)"}
+_LINEAS_RESPUESTA = {
+    "texto": ["_" * 70],
+    "numero": ["__________"],
+    "fecha": ["____ / ____ / ________   (día / mes / año)"],
+    "hora": ["____ : ____"],
+    "gps": ["Latitud: ______________   Longitud: ______________"],
+}
+
+_plantilla: Optional[bytes] = None
+
+
+def _plantilla_docx() -> bytes:
+    """Documento vacío con los estilos del cuestionario (se arma una vez por proceso)."""
+    global _plantilla
+    if _plantilla is None:
+        doc = Document()
+        estilos = doc.styles
+        base = estilos["Normal"]
+        base.font.name = "Calibri"
+        base.font.size = Pt(10.5)
+
+        def _estilo(nombre, tam, negrita=False, cursiva=False, color=None, antes=0, despues=2, sangria=None):
+            e = estilos.add_style(nombre, WD_STYLE_TYPE.PARAGRAPH)
+            e.base_style = base
+            e.font.size = Pt(tam)
+            e.font.bold = negrita
+            e.font.italic = cursiva
+            if color:
+                e.font.color.rgb = RGBColor(*color)
+            e.paragraph_format.space_before = Pt(antes)
+            e.paragraph_format.space_after = Pt(despues)
+            if sangria is not None:
+                e.paragraph_format.left_indent = Cm(sangria)
+
+        _estilo("EC Pregunta", 10.5, negrita=True, antes=8, despues=2)
+        _estilo("EC Opcion", 10, sangria=0.6, despues=0)
+        _estilo("EC Pista", 9, cursiva=True, color=(0x59, 0x59, 0x59), despues=2)
+        _estilo("EC Nota", 10, despues=4)
+        _estilo("EC Respuesta", 10, sangria=0.6, despues=2)
+
+        for sec in doc.sections:
+            sec.left_margin = sec.right_margin = Cm(2)
+            sec.top_margin = sec.bottom_margin = Cm(1.8)
+        out = BytesIO()
+        doc.save(out)
+        _plantilla = out.getvalue()
+    return _plantilla
+
+
+_ESTILOS = {"titulo": "Title", "pagina": "Heading 1", "pregunta": "EC Pregunta", "opcion": "EC Opcion",
+            "pista": "EC Pista", "nota": "EC Nota", "respuesta": "EC Respuesta"}
+
+
+class _Escritor:
+    """Agrega párrafos con el id de estilo ya resuelto (una búsqueda por estilo y documento)."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.ids = {k: doc.styles[nombre].style_id for k, nombre in _ESTILOS.items()}
+
+    def parrafo(self, texto: str, estilo: str):
+        p = self.doc.add_paragraph()
+        p._p.style = self.ids[estilo]
+        if texto:
+            p.add_run(texto)
+        return p
+
+
+def documento_word(bloques: List[Dict], titulo: str, logo: Optional[bytes] = None) -> bytes:
+    doc = Document(BytesIO(_plantilla_docx()))
+    w = _Escritor(doc)
+    w.parrafo(titulo, "titulo")
+
+    for b in bloques:
+        t = b["tipo"]
+        if t == "pagina":
+            w.parrafo(b["titulo"], "pagina")
+            if b.get("pista"):
+                w.parrafo(f"→ Solo si {b['pista']}", "pista")
+        elif t == "imagen":
+            if logo:
+                try:
+                    doc.add_picture(BytesIO(logo), width=Cm(4))
+                except Exception:
+                    pass
+        elif t == "nota":
+            if b.get("pista"):
+                w.parrafo(f"→ Solo si {b['pista']}", "pista")
+            w.parrafo(b["texto"], "nota")
+        elif t == "pregunta":
+            _pregunta(w, b)
+        elif t == "matriz":
+            _matriz(w, b)
+
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def _pregunta(w: _Escritor, b: Dict):
+    w.parrafo(b["etiqueta"] + (" *" if b.get("requerida") else ""), "pregunta")
+    if b.get("pista"):
+        w.parrafo(f"→ Responder solo si {b['pista']}", "pista")
+    if b["clase"] in _INSTRUCCION:
+        w.parrafo(_INSTRUCCION[b["clase"]], "pista")
+        ops = b["opciones"]
+        if len(ops) > cuestionario_papel.LIMITE_OPCIONES_EN_LISTA:
+            w.parrafo("   ".join(f"{CASILLA} {o}" for o in ops), "opcion")
+        else:
+            for o in ops:
+                w.parrafo(f"{CASILLA} {o}", "opcion")
+    else:
+        lineas = _LINEAS_RESPUESTA.get(b["clase"], _LINEAS_RESPUESTA["texto"])
+        if b.get("multilinea"):
+            lineas = lineas * 3
+        for linea in lineas:
+            w.parrafo(linea, "respuesta")
+
+
+def _matriz(w: _Escritor, b: Dict):
+    w.parrafo(b["titulo"], "pregunta")
+    if b.get("pista"):
+        w.parrafo(f"→ Responder solo si {b['pista']}", "pista")
+    cols = b["columnas"]
+    tabla = w.doc.add_table(rows=len(b["filas"]) + 1, cols=len(cols) + 1)
+    tabla.style = "Table Grid"
+    celdas = tabla.rows[0].cells
+    for j, c in enumerate(cols, start=1):
+        celdas[j].text = c
+    for i, f in enumerate(b["filas"], start=1):
+        celdas = tabla.rows[i].cells
+        celdas[0].text = f["etiqueta"]
+        for j in range(1, len(cols) + 1):
+            celdas[j].text = CASILLA
+
+
+def lote_por_delegacion(delegaciones: Iterable[str], generar: Callable[[str], bytes],
+                        nombre_archivo: Callable[[str], str]) -> bytes:
+    """ZIP con un documento por delegación (`generar(delegacion)` → bytes del .docx)."""
+    archivos = {}
+    for d in delegaciones:
+        d = d.strip()
+        if d:
+            archivos[nombre_archivo(d)] = generar(d)
+    return medios.zip_archivos(archivos)
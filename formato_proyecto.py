@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Formato binario compacto de proyecto (.ecproj)
+# - Cabecera: MAGIC + versión de esquema (uint16)
+# - Cuerpo comprimido (zlib) con REGISTROS enmarcados: [tipo:1][largo:4][json]
+#     H = cabecera, M = metadatos/reglas/textos, Q = una pregunta, C = bloque de catálogo
+#     (columnar + diccionario por columna), E = fin (conteos para verificar integridad)
+# - Importación en streaming: descomprime por trozos y valida cada registro al llegar
+# - Migraciones por versión de esquema; el JSON antiguo se trata como esquema 0 y solo se
+#   le exige la forma (las validaciones estrictas de preguntas son del .ecproj)
+# ==========================================================================================
+
+import json
+import zlib
+import struct
+import uuid
+from itertools import repeat
+from typing import Dict, List, Iterator, Tuple, BinaryIO
+
+import matrices
+
+MAGIC = b"ECPJ"
+SCHEMA_VERSION = 2
+EXTENSION = "ecproj"
+
+TAM_BLOQUE_CATALOGO = 5000
+TAM_LECTURA = 64 * 1024
+
+_CAMPOS_META = ("idioma", "version", "version_contador", "reglas_visibilidad", "reglas_finalizar",
+                "choices_extra_cols", "textos_fijos", "plantilla", "idiomas_extra", "traducciones", "presupuestos",
+                "dividir_paginas")
+
+
+class FormatoInvalido(ValueError):
+    pass
+
+
+# ------------------------------------------------------------------------------------------
+# Migraciones: cada función lleva el proyecto de la versión N a la N+1
+# ------------------------------------------------------------------------------------------
+def _migrar_0_a_1(proyecto: Dict) -> Dict:
+    """JSON original: choices_extra_cols puede venir ausente y los qid pueden faltar."""
+    proyecto.setdefault("choices_extra_cols", [])
+    proyecto.setdefault("textos_fijos", {})
+    for q in proyecto.get("preguntas", []):
+        if not q.get("qid"):
+            q["qid"] = str(uuid.uuid4())
+    return proyecto
+
+
+def _migrar_1_a_2(proyecto: Dict) -> Dict:
+    """Matriz como tipo: las filas de la Matriz 9 (antes reconocidas por name) llevan `matriz`."""
+    proyecto["preguntas"] = matrices.marcar_legadas(proyecto.get("preguntas", []))
+    return proyecto
+
+
+MIGRACIONES = {
+    0: _migrar_0_a_1,
+    1: _migrar_1_a_2,
+}
+
+
+def migrar(proyecto: Dict, desde: int) -> Dict:
+    if desde > SCHEMA_VERSION:
+        raise FormatoInvalido(f"Esquema {desde} es más nuevo que el soportado ({SCHEMA_VERSION}).")
+    v = desde
+    while v < SCHEMA_VERSION:
+        proyecto = MIGRACIONES[v](proyecto)
+        v += 1
+    return proyecto
+
+
+# ------------------------------------------------------------------------------------------
+# Validaciones por registro
+# ------------------------------------------------------------------------------------------
+def _validar_pregunta(q, pos: int, names: set, qids: set, estricto: bool = True):
+    """
+    `estricto` (.ecproj): tipo_ui / label / name no vacíos y name / qid sin repetir. El JSON
+    antiguo se carga como antes: solo se exige la forma (objeto, opciones en lista).
+    """
+    if not isinstance(q, dict):
+        raise FormatoInvalido(f"Pregunta #{pos}: se esperaba un objeto.")
+    if not estricto:
+        if not isinstance(q.get("opciones") or [], list):
+            raise FormatoInvalido(f"Pregunta #{pos}: 'opciones' debe ser una lista.")
+        return
+    for campo in ("tipo_ui", "label", "name"):
+        if not isinstance(q.get(campo), str) or not q.get(campo):
+            raise FormatoInvalido(f"Pregunta #{pos}: falta '{campo}'.")
+    if q["name"] in names:
+        raise FormatoInvalido(f"Pregunta #{pos}: name duplicado '{q['name']}'.")
+    names.add(q["name"])
+    qid = q.get("qid")
+    if qid:
+        if qid in qids:
+            raise FormatoInvalido(f"Pregunta #{pos}: qid duplicado '{qid}'.")
+        qids.add(qid)
+    if not isinstance(q.get("opciones", []), list):
+        raise FormatoInvalido(f"Pregunta #{pos}: 'opciones' debe ser una lista.")
+
+
+def _validar_meta(meta):
+    if not isinstance(meta, dict):
+        raise FormatoInvalido("Metadatos: se esperaba un objeto.")
+    for k in ("reglas_visibilidad", "reglas_finalizar", "choices_extra_cols", "idiomas_extra"):
+        if not isinstance(meta.get(k, []), list):
+            raise FormatoInvalido(f"Metadatos: '{k}' debe ser una lista.")
+    if not isinstance(meta.get("textos_fijos", {}), dict):
+        raise FormatoInvalido("Metadatos: 'textos_fijos' debe ser un objeto.")
+    for k in ("plantilla", "presupuestos"):
+        if not isinstance(meta.get(k) or {}, dict):
+            raise FormatoInvalido(f"Metadatos: '{k}' debe ser un objeto.")
+    trad = meta.get("traducciones") or {}
+    if not isinstance(trad, dict) or not all(isinstance(m, dict) for m in trad.values()):
+        raise FormatoInvalido("Metadatos: 'traducciones' debe ser un objeto {idioma: {texto: traducción}}.")
+
+
+# ------------------------------------------------------------------------------------------
+# Catálogo columnar
+# ------------------------------------------------------------------------------------------
+def _catalogo_a_columnas(rows: List[Dict]) -> Dict:
+    cols = []
+    for r in rows:
+        for k in r:
+            if k not in cols:
+                cols.append(k)
+    bloque = {"n": len(rows), "cols": {}}
+    for c in cols:
+        valores = [r.get(c) for r in rows]
+        distintos = list(dict.fromkeys(valores))
+        if len(distintos) * 2 <= len(valores):
+            pos = {v: i for i, v in enumerate(distintos)}
+            bloque["cols"][c] = {"dict": distintos, "idx": [pos[v] for v in valores]}
+        else:
+            bloque["cols"][c] = {"raw": valores}
+    return bloque
+
+
+def _columnas_a_catalogo(bloque: Dict) -> List[Dict]:
+    n = bloque.get("n")
+    cols = bloque.get("cols")
+    if not isinstance(n, int) or not isinstance(cols, dict):
+        raise FormatoInvalido("Bloque de catálogo mal formado.")
+    if "list_name" not in cols or "name" not in cols:
+        raise FormatoInvalido("Bloque de catálogo sin columnas list_name/name.")
+    expandidas = {}
+    for c, enc in cols.items():
+        if not isinstance(enc, dict):
+            raise FormatoInvalido(f"Columna '{c}' mal formada.")
+        if "dict" in enc:
+            d, idx = enc["dict"], enc.get("idx")
+            if not isinstance(d, list) or not isinstance(idx, list):
+                raise FormatoInvalido(f"Columna '{c}': diccionario o índices mal formados.")
+            # Índices en C (map / min): un índice negativo, grande o que no es entero no pasa
+            try:
+                if idx and min(idx) < 0:
+                    raise IndexError
+                valores = list(map(d.__getitem__, idx))
+            except (IndexError, TypeError):
+                raise FormatoInvalido(f"Columna '{c}': índice fuera del diccionario ({len(d)} valores).")
+        else:
+            valores = enc.get("raw", [])
+            if not isinstance(valores, list):
+                raise FormatoInvalido(f"Columna '{c}': valores mal formados.")
+        if len(valores) != n:
+            raise FormatoInvalido(f"Columna '{c}' con {len(valores)} valores (se esperaban {n}).")
+        expandidas[c] = valores
+    nombres = list(expandidas)
+    filas = list(map(dict, map(zip, repeat(nombres), zip(*expandidas.values()))))
+    # Celdas vacías (None): se quitan solo en las columnas que las tienen
+    for c, valores in expandidas.items():
+        if None in valores:
+            for fila, v in zip(filas, valores):
+                if v is None:
+                    del fila[c]
+    return filas
+
+
+# ------------------------------------------------------------------------------------------
+# Escritura
+# ------------------------------------------------------------------------------------------
+def _frame(tipo: bytes, obj) -> bytes:
+    payload = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return tipo + struct.pack(">I", len(payload)) + payload
+
+
+def escribir_proyecto(proyecto: Dict, nivel: int = 9) -> bytes:
+    comp = zlib.compressobj(nivel)
+    out = [MAGIC, struct.pack(">H", SCHEMA_VERSION)]
+
+    preguntas = list(proyecto.get("preguntas", []))
+    catalogo = list(proyecto.get("choices_ext_rows", []))
+    meta = {k: proyecto.get(k) for k in _CAMPOS_META if k in proyecto}
+    if "choices_extra_cols" in meta:
+        meta["choices_extra_cols"] = sorted(meta["choices_extra_cols"])
+
+    out.append(comp.compress(_frame(b"H", {"schema": SCHEMA_VERSION})))
+    out.append(comp.compress(_frame(b"M", meta)))
+    for q in preguntas:
+        out.append(comp.compress(_frame(b"Q", dict(q))))
+    for i in range(0, len(catalogo), TAM_BLOQUE_CATALOGO):
+        out.append(comp.compress(_frame(b"C", _catalogo_a_columnas(catalogo[i:i + TAM_BLOQUE_CATALOGO]))))
+    out.append(comp.compress(_frame(b"E", {"preguntas": len(preguntas), "catalogo": len(catalogo)})))
+    out.append(comp.flush())
+    return b"".join(out)
+
+
+# ------------------------------------------------------------------------------------------
+# Lectura en streaming
+# ------------------------------------------------------------------------------------------
+def _frames(fobj: BinaryIO, decomp) -> Iterator[Tuple[bytes, object]]:
+    buf = bytearray()
+    fin = False
+    while True:
+        while len(buf) >= 5:
+            (largo,) = struct.unpack(">I", bytes(buf[1:5]))
+            if len(buf) < 5 + largo:
+                break
+            tipo = bytes(buf[0:1])
+            try:
+                obj = json.loads(bytes(buf[5:5 + largo]).decode("utf-8"))
+            except ValueError as e:
+                raise FormatoInvalido(f"Registro '{tipo.decode()}' ilegible: {e}")
+            del buf[:5 + largo]
+            yield tipo, obj
+        if fin:
+            if buf:
+                raise FormatoInvalido("Archivo truncado (registro incompleto).")
+            return
+        chunk = fobj.read(TAM_LECTURA)
+        if not chunk:
+            buf += decomp.flush()
+            # Sin el final del flujo zlib (checksum) el archivo está cortado, aunque los
+            # registros que llegaron se lean bien
+            if not decomp.eof or decomp.unused_data:
+                raise FormatoInvalido("Archivo truncado o con datos después del contenido comprimido.")
+            fin = True
+            continue
+        try:
+            buf += decomp.decompress(chunk)
+        except zlib.error as e:
+            raise FormatoInvalido(f"Contenido comprimido dañado: {e}")
+
+
+def leer_proyecto(fobj: BinaryIO) -> Dict:
+    """
+    Lee un proyecto desde un archivo (binario .ecproj o JSON antiguo) validando en
+    streaming. Devuelve el proyecto ya migrado a SCHEMA_VERSION.
+    """
+    inicio = fobj.read(len(MAGIC))
+    if inicio != MAGIC:
+        resto = fobj.read()
+        try:
+            data = json.loads((inicio + resto).decode("utf-8"))
+        except ValueError as e:
+            raise FormatoInvalido(f"No es un proyecto válido (ni .{EXTENSION} ni JSON): {e}")
+        if not isinstance(data, dict):
+            raise FormatoInvalido("El JSON del proyecto debe ser un objeto.")
+        _validar_meta(data)
+        names, qids = set(), set()
+        for i, q in enumerate(data.get("preguntas", []), start=1):
+            _validar_pregunta(q, i, names, qids, estricto=False)
+        return migrar(data, int(data.get("schema", 0)))
+
+    cab = fobj.read(2)
+    if len(cab) != 2:
+        raise FormatoInvalido("Cabecera incompleta.")
+    (schema,) = struct.unpack(">H", cab)
+
+    proyecto = {"preguntas": [], "choices_ext_rows": []}
+    names, qids = set(), set()
+    visto_fin = False
+    for tipo, obj in _frames(fobj, zlib.decompressobj()):
+        if visto_fin:
+            raise FormatoInvalido("Datos después del registro de fin.")
+        if not isinstance(obj, dict):
+            raise FormatoInvalido(f"Registro '{tipo.decode('latin-1')}': se esperaba un objeto.")
+        if tipo == b"H":
+            if obj.get("schema") != schema:
+                raise FormatoInvalido("La cabecera no coincide con la versión de esquema.")
+        elif tipo == b"M":
+            _validar_meta(obj)
+            # Solo metadatos: preguntas y catálogo llegan en sus propios registros (ya validados)
+            desconocidos = sorted(set(obj) - set(_CAMPOS_META))
+            if desconocidos:
+                raise FormatoInvalido(f"Metadatos: campos no permitidos {', '.join(desconocidos)}.")
+            proyecto.update(obj)
+        elif tipo == b"Q":
+            _validar_pregunta(obj, len(proyecto["preguntas"]) + 1, names, qids)
+            proyecto["preguntas"].append(obj)
+        elif tipo == b"C":
+            proyecto["choices_ext_rows"].extend(_columnas_a_catalogo(obj))
+        elif tipo == b"E":
+            if obj.get("preguntas") != len(proyecto["preguntas"]) or obj.get("catalogo") != len(proyecto["choices_ext_rows"]):
+                raise FormatoInvalido("Conteos finales no coinciden: archivo incompleto o alterado.")
+            visto_fin = True
+        else:
+            raise FormatoInvalido(f"Tipo de registro desconocido: {tipo!r}")
+    if not visto_fin:
+        raise FormatoInvalido("Archivo truncado (falta registro de fin).")
+    return migrar(proyecto, schema)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Deshacer / Rehacer con deltas por fila (registro de comandos inverso)
+# - Se guarda UNA sola copia del estado vigente ("head") como filas JSON por clave
+#   (mismas filas que el almacén SQLite: pregunta por qid, catálogo por (list_name, name)...)
+# - Cada paso guarda solo las filas que cambiaron (ida y vuelta): la memoria por paso es
+#   proporcional al cambio, no al tamaño del proyecto. Las cadenas se comparten con el head.
+# - Profundidad acotada (deque con maxlen configurable)
+# ==========================================================================================
+
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from almacen_proyectos import SECCIONES, aplicar_delta, proyecto_desde_filas
+
+# Metadatos que cambian solos (p. ej. versión por fecha) y no son acciones del usuario
+META_IGNORADA = {"version", "idioma", "version_contador"}
+
+PROFUNDIDAD_DEFAULT = 50
+
+
+def nuevo_historial(profundidad: int = PROFUNDIDAD_DEFAULT) -> Dict:
+    return {"head": None, "undo": deque(maxlen=profundidad), "redo": deque(maxlen=profundidad)}
+
+
+def ajustar_profundidad(hist: Dict, profundidad: int):
+    if hist["undo"].maxlen != profundidad:
+        hist["undo"] = deque(hist["undo"], maxlen=profundidad)
+        hist["redo"] = deque(hist["redo"], maxlen=profundidad)
+
+
+def _filtrar(filas: Dict) -> Dict:
+    out = dict(filas)
+    out["meta"] = {k: v for k, v in filas.get("meta", {}).items() if k not in META_IGNORADA}
+    return out
+
+
+def _resumen(delta: Dict) -> str:
+    partes = []
+    for s in SECCIONES:
+        n = len(delta["set"].get(s, {})) + len(delta["del"].get(s, []))
+        if n:
+            partes.append(f"{s}: {n}")
+    return ", ".join(partes)
+
+
+def registrar(hist: Dict, filas: Dict, etiqueta: Optional[str] = None) -> bool:
+    """
+    Compara las filas actuales contra el head y, si hubo cambios, apila el paso
+    (delta de ida y delta inverso). Devuelve True si se registró un paso.
+    """
+    filas = _filtrar(filas)
+    head = hist["head"]
+    hist["head"] = filas
+    if head is None:
+        return False
+
+    ida = {"set": {}, "del": {}}
+    vuelta = {"set": {}, "del": {}}
+    for s in SECCIONES:
+        a = head.get(s, {})
+        b = filas.get(s, {})
+        for k, v in b.items():
+            old = a.get(k)
+            if old == v:
+                continue
+            ida["set"].setdefault(s, {})[k] = v
+            if old is None:
+                vuelta["del"].setdefault(s, []).append(k)
+            else:
+                vuelta["set"].setdefault(s, {})[k] = old
+        for k, old in a.items():
+            if k not in b:
+                ida["del"].setdefault(s, []).append(k)
+                vuelta["set"].setdefault(s, {})[k] = old
+
+    if not ida["set"] and not ida["del"]:
+        return False
+
+    hist["undo"].append({"ida": ida, "vuelta": vuelta, "etiqueta": etiqueta or _resumen(ida)})
+    hist["redo"].clear()
+    return True
+
+
+def _mover(hist: Dict, origen: str, destino: str, clave_delta: str) -> Optional[Tuple[Dict, str]]:
+    if not hist[origen] or hist["head"] is None:
+        return None
+    paso = hist[origen].pop()
+    filas = {s: dict(rows) for s, rows in hist["head"].items()}
+    aplicar_delta(filas, paso[clave_delta])
+    hist["head"] = filas
+    hist[destino].append(paso)
+    return proyecto_desde_filas(filas), paso["etiqueta"]
+
+
+def deshacer(hist: Dict) -> Optional[Tuple[Dict, str]]:
+    """Devuelve (proyecto, etiqueta) del estado anterior, o None si no hay pasos."""
+    return _mover(hist, "undo", "redo", "vuelta")
+
+
+def rehacer(hist: Dict) -> Optional[Tuple[Dict, str]]:
+    return _mover(hist, "redo", "undo", "ida")
+
+
+def bytes_historial(hist: Dict) -> int:
+    """Tamaño aproximado (texto) guardado en los pasos, sin contar el head."""
+    total = 0
+    for pila in (hist["undo"], hist["redo"]):
+        for paso in pila:
+            for d in (paso["ida"], paso["vuelta"]):
+                for rows in d["set"].values():
+                    total += sum(len(v[1]) for v in rows.values())
+    return total
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Importar un XLSForm existente (Excel / Survey123 Connect) al constructor
+# - openpyxl en modo read_only (streaming por filas, sin cargar estilos ni celdas vacías)
+# - survey → preguntas (tipo XLSForm → TIPOS), página de origen (begin_group),
+#   matriz table-list → filas con `matriz` + list_override compartido, relevant / choice_filter /
+#   constraint (+ constraint_message) tal cual
+# - Columnas que el constructor no guarda (hint, calculation, otros idiomas...) se listan en los
+#   avisos, por columna y con cuántas filas traían valor
+# - choices → opciones de cada pregunta; listas Cantón / Distrito → catálogo (canton_key)
+# - settings → idioma / versión
+# - Lo que el constructor genera solo (portada, consentimiento, notas de página) se omite
+# ==========================================================================================
+
+import uuid
+from typing import Callable, Dict, List, Tuple
+
+from openpyxl import load_workbook
+
+import matrices
+
+# Tipo XLSForm (primera palabra) → tipo_ui del constructor
+TIPOS_DESDE_XLSFORM = {
+    "text": "Texto (corto)",
+    "integer": "Número",
+    "decimal": "Número",
+    "select_one": "Selección única",
+    "select_multiple": "Selección múltiple",
+    "date": "Fecha",
+    "time": "Hora",
+    "geopoint": "GPS (ubicación)",
+}
+
+# Filas que construir_xlsform agrega por su cuenta (no son preguntas del usuario)
+_GRUPOS_GENERADOS = {"p1_intro", "p2_consentimiento", "p_fin_no"}
+_NOTAS_GENERADAS_PREFIJOS = ("intro_", "cons_", "fin_no_")
+_NOTAS_GENERADAS = {"victima_22_1_titulo"}
+LISTAS_CATALOGO = ("list_canton", "list_distrito")
+
+# Columnas de survey que pasan a la pregunta (label: la que se usó como etiqueta)
+COLUMNAS_PREGUNTA = ("type", "name", "required", "appearance", "choice_filter", "relevant",
+                     "constraint", "constraint_message")
+
+
+def _filas_hoja(ws) -> List[Dict]:
+    """Filas de una hoja como dicts {columna: valor} (cabecera = primera fila no vacía)."""
+    filas = ws.iter_rows(values_only=True)
+    cabecera = None
+    for fila in filas:
+        if any(v not in (None, "") for v in fila):
+            cabecera = [str(v).strip() if v is not None else "" for v in fila]
+            break
+    if cabecera is None:
+        return []
+    out = []
+    idx = [(i, c) for i, c in enumerate(cabecera) if c]
+    for fila in filas:
+        d = {}
+        for i, c in idx:
+            v = fila[i] if i < len(fila) else None
+            if v is not None and v != "":
+                d[c] = v.strip() if isinstance(v, str) else v
+        if d:
+            out.append(d)
+    return out
+
+
+def _columna_label(fila: Dict) -> str:
+    """Columna de la que sale la etiqueta: label o, si no hay, la primera label::idioma."""
+    if "label" in fila:
+        return "label"
+    return next((k for k in fila if k.startswith("label::")), "")
+
+
+def _label(fila: Dict) -> str:
+    col = _columna_label(fila)
+    return str(fila[col]) if col else ""
+
+
+def _contar_omitidas(contador: Dict[str, int], fila: Dict, usadas):
+    etiqueta = _columna_label(fila)
+    for k in fila:
+        if k not in usadas and k != etiqueta:
+            contador[k] = contador.get(k, 0) + 1
+
+
+def _idioma(settings: Dict, survey_cols: set) -> str:
+    idioma = settings.get("default_language")
+    if idioma:
+        return str(idioma)
+    for c in survey_cols:
+        if c.startswith("label::") and "(" in c and c.endswith(")"):
+            return c[c.rindex("(") + 1:-1]
+    return "es"
+
+
+def qid_estable(name: str) -> str:
+    """qid determinista por nombre: reimportar el mismo formulario da los mismos qid."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"xlsform:{name}"))
+
+
+def leer_hojas(fobj) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Filas (dicts) de survey, choices y settings; las hojas que falten quedan vacías."""
+    wb = load_workbook(fobj, read_only=True, data_only=True)
+    try:
+        hojas = {ws.title.strip().lower(): ws for ws in wb.worksheets}
+        if "survey" not in hojas:
+            raise ValueError("El archivo no tiene hoja 'survey'.")
+        return tuple(_filas_hoja(hojas[h]) if h in hojas else [] for h in ("survey", "choices", "settings"))
+    finally:
+        wb.close()
+
+
+def leer_xlsform(fobj, slugify: Callable[[str], str]) -> Tuple[Dict, List[str]]:
+    """
+    Devuelve (proyecto, avisos). `proyecto` tiene la misma forma que el JSON exportado por la app.
+    """
+    survey, choices, settings_filas = leer_hojas(fobj)
+
+    avisos = []
+    settings = settings_filas[0] if settings_filas else {}
+
+    # ------------------------------ choices ------------------------------
+    por_lista: Dict[str, List[Dict]] = {}
+    for r in choices:
+        ln = str(r.get("list_name", "")).strip()
+        if ln and r.get("name") is not None:
+            por_lista.setdefault(ln, []).append(r)
+
+    listas_catalogo = set(LISTAS_CATALOGO)
+    for ln, filas in por_lista.items():
+        if any("canton_key" in f for f in filas):
+            listas_catalogo.add(ln)
+
+    # ------------------------------ survey ------------------------------
+    preguntas = []
+    textos_fijos = {}
+    pila_grupos: List[Dict] = []
+    omitidas = {}
+    cols_omitidas: Dict[str, int] = {}
+    cols_omitidas_choices: Dict[str, int] = {}
+    listas_revisadas = set()
+    nombres_vistos = set()
+
+    for r in survey:
+        tipo = str(r.get("type", "")).strip()
+        nombre = str(r.get("name", "")).strip()
+        partes = tipo.split()
+        base = partes[0] if partes else ""
+
+        if base in ("begin_group", "begin", "begin_repeat"):
+            if base == "begin" and len(partes) > 1 and partes[1] != "group":
+                omitidas[tipo] = omitidas.get(tipo, 0) + 1
+            pila_grupos.append({"name": nombre, "label": _label(r),
+                                "table_list": str(r.get("appearance", "")).strip() == "table-list"})
+            continue
+        if base in ("end_group", "end", "end_repeat"):
+            if pila_grupos:
+                pila_grupos.pop()
+            continue
+
+        grupos = [g for g in pila_grupos if not g["table_list"]]
+        pagina = grupos[-1] if grupos else None
+        matriz = next((g for g in reversed(pila_grupos) if g["table_list"]), None)
+
+        if base == "note":
+            generada = (pagina and pagina["name"] in _GRUPOS_GENERADOS) or nombre in _NOTAS_GENERADAS \
+                or nombre.startswith(_NOTAS_GENERADAS_PREFIJOS) or nombre.endswith("_intro")
+            if not generada:
+                omitidas["note"] = omitidas.get("note", 0) + 1
+            continue
+        if base not in TIPOS_DESDE_XLSFORM:
+            omitidas[base or "(vacío)"] = omitidas.get(base or "(vacío)", 0) + 1
+            continue
+        if not nombre or nombre in nombres_vistos:
+            avisos.append(f"Fila omitida: nombre vacío o repetido ({nombre or '—'}).")
+            continue
+        nombres_vistos.add(nombre)
+
+        tipo_ui = TIPOS_DESDE_XLSFORM[base]
+        appearance = str(r["appearance"]) if r.get("appearance") else None
+        if base == "text" and appearance == "multiline":
+            tipo_ui, appearance = "Párrafo (texto largo)", None
+
+        q = {
+            "qid": qid_estable(nombre),
+            "tipo_ui": tipo_ui,
+            "label": _label(r) or nombre,
+            "name": nombre,
+            "required": str(r.get("required", "")).strip().lower() in ("yes", "true", "1", "true()"),
+            "opciones": [],
+            "appearance": appearance,
+            "choice_filter": str(r["choice_filter"]) if r.get("choice_filter") else None,
+            "relevant": str(r["relevant"]) if r.get("relevant") else None,
+        }
+        for k in ("constraint", "constraint_message"):
+            if r.get(k):
+                q[k] = str(r[k])
+        _contar_omitidas(cols_omitidas, r, COLUMNAS_PREGUNTA)
+        if pagina and pagina["name"] not in _GRUPOS_GENERADOS:
+            q["pagina"] = pagina["label"] or pagina["name"]
+
+        if base in ("select_one", "select_multiple"):
+            lista = partes[1] if len(partes) > 1 else ""
+            if lista not in listas_catalogo and nombre not in ("canton", "distrito"):
+                q["opciones"] = [_label(c) or str(c["name"]) for c in por_lista.get(lista, [])]
+                if lista not in listas_revisadas:
+                    listas_revisadas.add(lista)
+                    for c in por_lista.get(lista, []):
+                        _contar_omitidas(cols_omitidas_choices, c, ("list_name", "name"))
+                distintos = [c for c in por_lista.get(lista, []) if slugify(_label(c)) != str(c["name"])]
+                if distintos:
+                    avisos.append(
+                        f"'{nombre}': {len(distintos)} opciones con name distinto de la etiqueta "
+                        f"(p. ej. {distintos[0]['name']}); al exportar se regeneran desde la etiqueta."
+                    )
+            if lista in listas_catalogo and nombre in ("canton", "distrito") and lista != f"list_{nombre}":
+                avisos.append(f"'{nombre}' usa la lista '{lista}'; el constructor usa 'list_{nombre}' para el catálogo.")
+            elif lista not in listas_catalogo and (matriz is not None or lista != f"list_{nombre}"):
+                q["list_override"] = lista
+            if matriz is not None:
+                q["matriz"] = matriz["name"]
+                if matriz["label"]:
+                    textos_fijos[matrices.clave_texto(matriz["name"])] = matriz["label"]
+        preguntas.append(q)
+
+    # ------------------------------ catálogo ------------------------------
+    catalogo = []
+    extra_cols = set()
+    for ln in por_lista:
+        if ln not in listas_catalogo:
+            continue
+        for c in por_lista[ln]:
+            fila = {"list_name": ln, "name": str(c["name"]), "label": _label(c) or str(c["name"])}
+            for k, v in c.items():
+                if k not in ("list_name", "name", "label") and not k.startswith("label::"):
+                    fila[k] = str(v)
+                    extra_cols.add(k)
+            catalogo.append(fila)
+
+    if omitidas:
+        avisos.append("Filas no soportadas por el constructor (omitidas): " +
+                      ", ".join(f"{k} ×{v}" for k, v in sorted(omitidas.items())))
+    for hoja, cols in (("survey", cols_omitidas), ("choices", cols_omitidas_choices)):
+        if cols:
+            avisos.append(f"Columnas de {hoja} que el constructor no guarda (se omiten; filas con valor): " +
+                          ", ".join(f"{k} ×{v}" for k, v in sorted(cols.items())))
+
+    proyecto = {
+        "idioma": _idioma(settings, {k for r in survey for k in r}),
+        "version": str(settings.get("version") or ""),
+        "preguntas": preguntas,
+        "reglas_visibilidad": [],
+        "reglas_finalizar": [],
+        "choices_ext_rows": catalogo,
+        "choices_extra_cols": sorted(extra_cols),
+    }
+    if textos_fijos:
+        proyecto["textos_fijos"] = textos_fijos
+    if settings.get("form_title"):
+        proyecto["form_title"] = str(settings["form_title"])
+    return proyecto, avisos
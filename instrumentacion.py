@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Instrumentación opcional por fase del rerun (tiempo, memoria asignada y tamaños)
+# - Registro = dict {fase: {"ms", "n", "neto_kb", "pico_kb", ...tamaños}}; None = apagado
+#   (con None cada llamada es un `if` y nada más: costo ~0 cuando está desactivada)
+# - Memoria con tracemalloc (opcional, aparte del tiempo: tracemalloc hace todo más lento);
+#   tracemalloc es del proceso: se enciende con la primera sesión que lo pide y se apaga
+#   cuando la última lo suelta (conteo por sesión)
+# - Fases anidadas: el pico de la fase externa incluye el de las internas; la pila de fases
+#   abiertas vive en el registro de la sesión, no en el módulo
+# - Log local en JSON Lines (una línea por rerun)
+# ==========================================================================================
+
+import os
+import json
+import time
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set
+
+LOG_PATH_DEFAULT = "encuesta_perf.log"
+LOG_MAX_BYTES = 5 * 1024 * 1024
+
+# Clave del registro con la pila de fases abiertas con memoria: [mem_inicial, pico_acumulado]
+# (cada rerun empieza con un registro nuevo: lo que dejó abierto una excepción se descarta solo).
+# tracemalloc sigue siendo global: con varias sesiones midiendo a la vez, la memoria de una
+# fase incluye lo que asignen las otras.
+PILA = "_pila"
+
+_sesiones_memoria: Set[str] = set()
+_iniciado_aqui = False
+_lock = threading.Lock()
+
+
+def activar_memoria(sesion: str, activa: bool):
+    """
+    Registra si `sesion` quiere medir memoria. tracemalloc arranca con la primera sesión y se
+    detiene con la última (si lo encendió este módulo: un PYTHONTRACEMALLOC externo se respeta).
+    """
+    global _iniciado_aqui
+    with _lock:
+        if activa:
+            _sesiones_memoria.add(sesion)
+        else:
+            _sesiones_memoria.discard(sesion)
+        if _sesiones_memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _iniciado_aqui = True
+        elif not _sesiones_memoria and _iniciado_aqui and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            _iniciado_aqui = False
+
+
+def fase_ini(registro: Optional[Dict]):
+    if registro is None:
+        return None
+    if tracemalloc.is_tracing():
+        _pila = registro.setdefault(PILA, [])
+        actual, pico = tracemalloc.get_traced_memory()
+        if _pila:
+            _pila[-1][1] = max(_pila[-1][1], pico)
+        tracemalloc.reset_peak()
+        _pila.append([actual, actual])
+        return (time.perf_counter(), len(_pila))
+    return (time.perf_counter(), 0)
+
+
+def fase_fin(registro: Optional[Dict], nombre: str, t0, **tamanos):
+    if t0 is None or registro is None:
+        return
+    ms = (time.perf_counter() - t0[0]) * 1000.0
+    f = registro.setdefault(nombre, {"ms": 0.0, "n": 0})
+    f["ms"] += ms
+    f["n"] += 1
+    _pila = registro.get(PILA, [])
+    if t0[1] and tracemalloc.is_tracing() and len(_pila) == t0[1]:
+        actual, pico = tracemalloc.get_traced_memory()
+        mem0, pico_prev = _pila.pop()
+        pico = max(pico, pico_prev)
+        if _pila:
+            _pila[-1][1] = max(_pila[-1][1], pico)
+        f["neto_kb"] = f.get("neto_kb", 0.0) + (actual - mem0) / 1024.0
+        f["pico_kb"] = max(f.get("pico_kb", 0.0), (pico - mem0) / 1024.0)
+    for k, v in tamanos.items():
+        f[k] = v
+
+
+def envolver(registro: Optional[Dict], nombre: str, fn: Callable) -> Callable:
+    """Devuelve `fn` tal cual si el registro está apagado; si no, una versión medida."""
+    if registro is None:
+        return fn
+
+    def _medida(*args, **kwargs):
+        t0 = fase_ini(registro)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            fase_fin(registro, nombre, t0)
+    return _medida
+
+
+def escribir_log(registro: Dict, path: str = LOG_PATH_DEFAULT, **contexto):
+    """Agrega una línea JSON al log local; lo rota (.1) al superar LOG_MAX_BYTES."""
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > LOG_MAX_BYTES:
+            os.replace(path, path + ".1")
+        fases = {k: v for k, v in registro.items() if k != PILA}
+        linea = {"fecha": datetime.now().isoformat(timespec="seconds"), **contexto, "fases": fases}
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(linea, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass
+
+
+def filas_tabla(registro: Dict):
+    """Filas para mostrar en la UI (ordenadas por tiempo, de mayor a menor)."""
+    filas = []
+    fases = [(k, v) for k, v in registro.items() if k != PILA]
+    for nombre, f in sorted(fases, key=lambda kv: -kv[1].get("ms", 0.0)):
+        fila = {"fase": nombre, "ms": round(f.get("ms", 0.0), 2), "llamadas": f.get("n", 0)}
+        if "pico_kb" in f:
+            fila["neto_kb"] = round(f["neto_kb"], 1)
+            fila["pico_kb"] = round(f["pico_kb"], 1)
+        extras = {k: v for k, v in f.items() if k not in ("ms", "n", "neto_kb", "pico_kb")}
+        fila["tamaños"] = ", ".join(f"{k}={v}" for k, v in extras.items())
+        filas.append(fila)
+    return filas
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Matrices (table-list): una lista de opciones compartida + N filas
+# - Cada fila es una pregunta normal (reglas, capas y comparación la ven por su name) con
+#   `matriz` = name del grupo y `list_override` = lista compartida
+# - construir_xlsform abre / cierra el grupo table-list al generar las filas (sin tocar el
+#   DataFrame después); cualquier cantidad de matrices por formulario
+# - El encabezado de cada matriz es un texto fijo (textos_fijos[clave_texto(name)])
+# ==========================================================================================
+
+from typing import Callable, Dict, List
+
+TIPO_MATRIZ = "Matriz (table-list)"
+
+# Matriz 9 de Comercio: la única que existía antes (filas reconocidas solo por su name)
+MATRIZ_9 = "matriz_seguridad_9_comercio"
+FILAS_MATRIZ_9 = ("seg_afuera_comercio", "seg_pasillos_aceras", "seg_parqueos", "seg_paradas_bus",
+                  "seg_calles_cercanas")
+
+
+def clave_texto(matriz: str) -> str:
+    """Clave del encabezado en textos_fijos (la Matriz 9 conserva la suya)."""
+    return "matriz_9_label_comercio" if matriz == MATRIZ_9 else f"matriz_label_{matriz}"
+
+
+def lista(matriz: str) -> str:
+    return f"list_{matriz}"
+
+
+def crear_filas(matriz: str, filas: List[str], opciones: List[str], tipo_ui: str, required: bool,
+                slugify: Callable[[str], str], nombre_unico: Callable[[str, set], str],
+                usados: set) -> List[Dict]:
+    """Preguntas-fila de una matriz nueva (names únicos frente a `usados`, que se actualiza)."""
+    out = []
+    for etiqueta in filas:
+        nombre = nombre_unico(f"{matriz}_{slugify(etiqueta)}"[:60], usados)
+        usados.add(nombre)
+        out.append({
+            "tipo_ui": tipo_ui,
+            "label": etiqueta,
+            "name": nombre,
+            "required": required,
+            "opciones": list(opciones),
+            "appearance": None,
+            "choice_filter": None,
+            "relevant": None,
+            "list_override": lista(matriz),
+            "matriz": matriz,
+        })
+    return out
+
+
+def nombres(preguntas) -> List[str]:
+    """Matrices del proyecto, en orden de aparición."""
+    return list(dict.fromkeys(q["matriz"] for q in preguntas if q.get("matriz")))
+
+
+def marcar_legadas(preguntas) -> List:
+    """Filas de la Matriz 9 sin `matriz` (proyectos anteriores) → marcadas con su grupo."""
+    return [
+        {**q, "matriz": MATRIZ_9} if q.get("name") in FILAS_MATRIZ_9 and not q.get("matriz") else q
+        for q in preguntas
+    ]
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Medios del formulario (logo) y empaquetado para Survey123 Connect
+# - Hash de contenido (sha256) de cada imagen: se procesa una sola vez por contenido
+# - Reducción de tamaño para dispositivos de campo: lado máximo + presupuesto de bytes
+#   (PNG: optimize y, si no alcanza o crece, paleta de 256 colores; JPEG: calidad decreciente)
+# - Se conserva el formato (y por tanto el nombre en media::image)
+# - ZIP de carpeta de Survey123 Connect: <carpeta>/<carpeta>.xlsx + <carpeta>/media/...
+# - Pillow es opcional: sin Pillow la imagen se usa tal cual
+# ==========================================================================================
+
+import hashlib
+import zipfile
+from io import BytesIO
+from typing import Dict, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow no instalado
+    Image = None
+
+MAX_LADO_DEFAULT = 512
+PRESUPUESTO_BYTES_DEFAULT = 150 * 1024
+_CALIDADES_JPEG = (85, 75, 65, 55, 45)
+
+
+def hash_bytes(datos: bytes) -> str:
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _guardar(img, formato: str, **opciones) -> bytes:
+    out = BytesIO()
+    img.save(out, format=formato, **opciones)
+    return out.getvalue()
+
+
+def procesar_imagen(datos: bytes, max_lado: int = MAX_LADO_DEFAULT,
+                    presupuesto: int = PRESUPUESTO_BYTES_DEFAULT) -> Tuple[bytes, Dict]:
+    """
+    Reduce la imagen a `max_lado` píxeles (lado mayor) y la recomprime hasta caber en
+    `presupuesto` bytes si es posible. Devuelve (bytes, info). Si la imagen ya es
+    pequeña y cabe en el presupuesto, o no hay Pillow, devuelve los bytes originales.
+    """
+    info = {"bytes_original": len(datos), "hash": hash_bytes(datos)}
+    if Image is None:
+        info.update(bytes=len(datos), procesada=False, motivo="Pillow no instalado")
+        return datos, info
+    try:
+        img = Image.open(BytesIO(datos))
+        img.load()
+    except Exception as e:
+        info.update(bytes=len(datos), procesada=False, motivo=f"imagen no válida: {e}")
+        return datos, info
+
+    formato = (img.format or "PNG").upper()
+    info["formato"] = formato
+    info["dimensiones_original"] = img.size
+    if max(img.size) <= max_lado and len(datos) <= presupuesto:
+        info.update(bytes=len(datos), dimensiones=img.size, procesada=False, motivo="ya cabe en el presupuesto")
+        return datos, info
+
+    if max(img.size) > max_lado:
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+
+    if formato in ("JPEG", "JPG"):
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        salida = b""
+        for q in _CALIDADES_JPEG:
+            salida = _guardar(img, "JPEG", quality=q, optimize=True, progressive=True)
+            if len(salida) <= presupuesto:
+                break
+    else:
+        formato = "PNG"
+        salida = _guardar(img, "PNG", optimize=True)
+        if len(salida) > min(presupuesto, len(datos)) and img.mode != "P":
+            base = img.convert("RGBA") if "A" in img.getbands() or "transparency" in img.info else img.convert("RGB")
+            metodo = Image.Quantize.FASTOCTREE if base.mode == "RGBA" else Image.Quantize.MEDIANCUT
+            salida = _guardar(base.quantize(256, method=metodo), "PNG", optimize=True)
+
+    if len(salida) >= len(datos):
+        info.update(bytes=len(datos), dimensiones=info["dimensiones_original"], procesada=False,
+                    motivo="la recompresión no reduce el tamaño")
+        return datos, info
+    info.update(bytes=len(salida), dimensiones=img.size, procesada=True)
+    return salida, info
+
+
+def zip_archivos(archivos: Dict[str, bytes]) -> bytes:
+    """ZIP reproducible (fecha fija, orden de inserción) sin recomprimir el contenido."""
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as z:
+        for nombre, datos in archivos.items():
+            zi = zipfile.ZipInfo(nombre, date_time=(1980, 1, 1, 0, 0, 0))
+            zi.external_attr = 0o644 << 16
+            z.writestr(zi, datos)
+    return out.getvalue()
+
+
+def paquete_connect(carpeta: str, xlsx: bytes, medios: Dict[str, bytes]) -> bytes:
+    """
+    ZIP con la carpeta de un proyecto de Survey123 Connect: el XLSForm con el mismo nombre
+    que la carpeta y los archivos en media/. Entradas con fecha fija (bytes reproducibles);
+    se guardan sin recomprimir (el .xlsx y las imágenes ya están comprimidos).
+    """
+    archivos = {f"{carpeta}/{carpeta}.xlsx": xlsx}
+    archivos.update({f"{carpeta}/media/{nombre}": datos for nombre, datos in sorted(medios.items())})
+    return zip_archivos(archivos)
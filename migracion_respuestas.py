@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Migración de respuestas entre versiones del formulario (un solo conjunto armonizado)
+# - Mapa derivado por continuidad de qid entre dos proyectos (formas de diferencias.py):
+#   columna anterior → columna actual y, por campo de selección, slug anterior → slug actual
+#   (mismo slug o misma etiqueta). Una opción sin par no se adivina: queda con su valor y se
+#   ofrece en el editor para asignarla a mano (quitar "Uva" y agregar "Banano" no es renombrar)
+# - Campos retirados conservan su columna; si su name lo usa otro campo, pasan a <name>_anterior
+# - Aplicación por columna: renombre de columnas (también <name>__<slug> 0/1 del codebook),
+#   fusión de las que van al mismo destino y traducción de valores sobre los valores distintos
+#   de cada columna (no fila por fila)
+# ==========================================================================================
+
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import diccionario_datos
+import diferencias
+
+COLUMNA_VERSION = "version_formulario"
+SUFIJO_RETIRADO = "_anterior"
+SEP_MULTIPLE = ","  # Survey123 guarda select_multiple como slugs separados por coma
+
+
+def _lista(tipo: str) -> str:
+    partes = tipo.split()
+    return partes[1] if len(partes) > 1 and partes[0] in ("select_one", "select_multiple") else ""
+
+
+def _opciones_por_lista(forma: Dict) -> Dict[str, List[Tuple[str, str]]]:
+    out: Dict[str, List[Tuple[str, str]]] = {}
+    for (ln, slug), label in forma["opciones"].items():
+        out.setdefault(ln, []).append((slug, label))
+    return out
+
+
+def _parear_opciones(viejas: List[Tuple[str, str]],
+                     nuevas: List[Tuple[str, str]]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    ({slug anterior: slug actual}, slugs anteriores sin equivalente). Empareja por slug y luego
+    por etiqueta; la posición no cuenta (una opción quitada y otra agregada no son un renombre).
+    """
+    libres = {s: i for i, (s, _) in enumerate(nuevas)}
+    par: Dict[str, str] = {}
+    pendientes = []
+    for i, (s, _) in enumerate(viejas):
+        if s in libres:
+            par[s] = s
+            del libres[s]
+        else:
+            pendientes.append(i)
+
+    por_etiqueta = {}
+    for s, j in libres.items():
+        por_etiqueta.setdefault(nuevas[j][1], []).append(s)
+    sin_par = []
+    for i in pendientes:
+        candidatos = por_etiqueta.get(viejas[i][1])
+        if candidatos:
+            par[viejas[i][0]] = candidatos.pop(0)
+        else:
+            sin_par.append(viejas[i][0])
+    return par, sin_par
+
+
+def derivar(antes: Dict, despues: Dict) -> Dict:
+    """
+    Mapa de migración de `antes` → `despues` (formas de proyecto, clave qid):
+      {"campos": {name anterior: name actual}, "valores": {name actual: {slug anterior: slug actual}},
+       "sin_par": {name actual: [slug anterior]}, "multiples": {names actuales select_multiple},
+       "avisos": [texto]}
+    "valores" solo trae los slugs que cambian; los de "sin_par" se conservan tal cual.
+    """
+    ca, cb = antes["campos"], despues["campos"]
+    ola, olb = _opciones_por_lista(antes), _opciones_por_lista(despues)
+    campos: Dict[str, str] = {}
+    valores: Dict[str, Dict[str, str]] = {}
+    sin_pares: Dict[str, List[str]] = {}
+    multiples = set()
+    avisos: List[str] = []
+
+    for k, a in ca.items():
+        b = cb.get(k)
+        if b is None:
+            continue
+        campos[a["name"]] = b["name"]
+        if b["type"].startswith("select_multiple "):
+            multiples.add(b["name"])
+        if diferencias.tipo_columna(a["type"]) != diferencias.tipo_columna(b["type"]):
+            avisos.append(f"'{b['name']}' cambia de tipo de columna ({diferencias.tipo_columna(a['type'])} → "
+                          f"{diferencias.tipo_columna(b['type'])}): los valores se copian sin convertir.")
+        la, lb = _lista(a["type"]), _lista(b["type"])
+        if not (la and lb):
+            continue
+        par, sin_par = _parear_opciones(ola.get(la, []), olb.get(lb, []))
+        cambios = {s: d for s, d in par.items() if s != d}
+        if cambios:
+            valores[b["name"]] = cambios
+        if sin_par:
+            sin_pares[b["name"]] = sin_par
+            avisos.append(f"'{b['name']}': {', '.join(sin_par)} sin opción equivalente; se conserva el valor "
+                          f"(asígnalo en «Valores» si corresponde a una opción actual).")
+
+    ocupados = {b["name"] for b in cb.values()}
+    for k, a in ca.items():
+        if k in cb:
+            continue
+        destino = a["name"]
+        while destino in ocupados:
+            destino += SUFIJO_RETIRADO
+        ocupados.add(destino)
+        campos[a["name"]] = destino
+        avisos.append(f"'{a['name']}' ya no existe" + (f": se conserva como '{destino}'." if destino != a["name"]
+                                                       else "; se conserva su columna."))
+    return {"campos": campos, "valores": valores, "sin_par": sin_pares, "multiples": multiples, "avisos": avisos}
+
+
+def _vacio(s: pd.Series) -> pd.Series:
+    return s.isna() | (s.astype(str).str.strip() == "")
+
+
+def _traducir(s: pd.Series, trad: Dict[str, str], multiple: bool) -> pd.Series:
+    """Traduce los valores distintos de la columna y los lleva a las filas con un map."""
+    m = {}
+    for v in s.dropna().unique():
+        if multiple:
+            slugs = [p.strip() for p in str(v).split(SEP_MULTIPLE) if p.strip()]
+            m[v] = SEP_MULTIPLE.join(dict.fromkeys(trad.get(p, p) for p in slugs))
+        else:
+            m[v] = trad.get(str(v).strip(), v)
+    if all(k == v for k, v in m.items()):
+        return s
+    return s.map(m).where(s.notna(), s)
+
+
+def aplicar(df: pd.DataFrame, mapa: Dict) -> pd.DataFrame:
+    """
+    Respuestas de la versión anterior con las columnas y valores de la actual. Columnas fuera del
+    mapa (objectid, globalid, fechas...) pasan igual. Varias columnas con el mismo destino se
+    fusionan: primer valor no vacío (texto) o máximo (columnas 0/1).
+    """
+    campos, valores, multiples = mapa["campos"], mapa["valores"], mapa["multiples"]
+    destinos: Dict[str, List[str]] = {}
+    es_01 = set()
+    for col in df.columns:
+        destino = campos.get(col)
+        if destino is None:
+            name, sep, slug = str(col).partition(diccionario_datos.SEP_COLUMNA)
+            if sep and name in campos:
+                nuevo = campos[name]
+                destino = diccionario_datos.columna_opcion(nuevo, valores.get(nuevo, {}).get(slug, slug))
+                es_01.add(destino)
+            else:
+                destino = col
+        destinos.setdefault(destino, []).append(col)
+
+    out = {}
+    for destino, cols in destinos.items():
+        if len(cols) == 1:
+            s = df[cols[0]]
+        elif destino in es_01:
+            s = df[cols].apply(pd.to_numeric, errors="coerce").max(axis=1)
+        else:
+            s = df[cols[0]]
+            for c in cols[1:]:
+                s = s.where(~_vacio(s), df[c])
+        if destino in valores:
+            s = _traducir(s, valores[destino], destino in multiples)
+        out[destino] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def armonizar(partes: List[Tuple[str, pd.DataFrame, Optional[Dict]]]) -> pd.DataFrame:
+    """
+    Un solo conjunto desde [(versión, respuestas, mapa o None si ya está en la versión actual)].
+    Columnas en el orden de la última parte y luego las que solo traen las anteriores;
+    COLUMNA_VERSION indica de qué versión viene cada fila.
+    """
+    dfs = []
+    for etiqueta, df, mapa in partes:
+        d = aplicar(df, mapa) if mapa else df.copy()
+        d.insert(0, COLUMNA_VERSION, etiqueta)
+        dfs.append(d)
+    if not dfs:
+        return pd.DataFrame(columns=[COLUMNA_VERSION])
+    orden = list(dict.fromkeys([c for d in reversed(dfs) for c in d.columns]))
+    return pd.concat(dfs, ignore_index=True, sort=False).reindex(columns=orden)
+
+
+def filas_mapa(mapa: Dict) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Filas (columnas que cambian, valores que cambian o sin par) para mostrar o editar el mapa.
+    Las opciones sin par van con "despues" vacío: solo se traducen si el usuario lo completa.
+    """
+    columnas = [{"antes": a, "despues": b} for a, b in mapa["campos"].items() if a != b]
+    vals = [{"campo": c, "antes": a, "despues": b, "estado": "emparejada"}
+            for c, t in mapa["valores"].items() for a, b in t.items()]
+    vals += [{"campo": c, "antes": a, "despues": "", "estado": "sin par"}
+             for c, slugs in mapa.get("sin_par", {}).items() for a in slugs]
+    return columnas, vals
+
+
+def con_ediciones(mapa: Dict, columnas: List[Dict], vals: List[Dict]) -> Dict:
+    """Mapa con las filas editadas de filas_mapa(): destinos iguales = fusión."""
+    campos = dict(mapa["campos"])
+    for f in columnas:
+        if f.get("antes") in campos and str(f.get("despues") or "").strip():
+            campos[f["antes"]] = str(f["despues"]).strip()
+    valores: Dict[str, Dict[str, str]] = {}
+    for f in vals:
+        if f.get("campo") and f.get("antes") and str(f.get("despues") or "").strip():
+            valores.setdefault(f["campo"], {})[f["antes"]] = str(f["despues"]).strip()
+    return {**mapa, "campos": campos, "valores": valores}
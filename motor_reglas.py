@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Motor de reglas (relevant): condiciones con grupos Y / O anidados → expresión XLSForm mínima
+# - Regla guardada: {"src", "op", "values"} (una condición, formato original) o
+#   {"grupo": "y"|"o", "condiciones": [regla, ...]} (anidable)
+# - Operadores: "=" / "selected" (alguno de los valores), "!=" / "!selected" (ninguno)
+# - parsear(): relevant escrito a mano (subconjunto XLSForm: ${x}='v', !=, selected(), not(),
+#   and / or, paréntesis); lo que no entiende queda como término opaco, tal cual
+# - simplificar(): aplana, quita duplicados, absorbe (A y (A o B) = A), saca factores comunes
+#   ((A y B) o (A y C) = A y (B o C)) y pliega lo que ya garantiza la página
+#   (${consentimiento}='si' en el relevant del grupo) o contradice una igualdad conocida
+# - a_xlsform(): texto más corto (sin paréntesis de más; "y" liga más fuerte que "o")
+# ==========================================================================================
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# Nodos (tuplas inmutables, comparables y hashables):
+#   ("=", src, valor)  ("sel", src, valor)  ("no", nodo)  ("y", (nodos))  ("o", (nodos))
+#   ("txt", texto)  VERDADERO  FALSO
+VERDADERO = ("1",)
+FALSO = ("0",)
+
+OPERADORES = {
+    "=": "es",
+    "!=": "no es",
+    "selected": "marcó",
+    "!selected": "no marcó",
+}
+GRUPOS = {"y": "todas (y)", "o": "alguna (o)"}
+
+
+# ------------------------------------------------------------------------------------------
+# Regla guardada → nodo
+# ------------------------------------------------------------------------------------------
+def desde_regla(regla: Dict):
+    """Nodo de una regla guardada (condición simple o grupo); None si no tiene valores."""
+    regla = condicion(regla)
+    if "grupo" in regla:
+        hijos = tuple(h for h in (desde_regla(c) for c in regla.get("condiciones", [])) if h is not None)
+        return ("o" if regla["grupo"] == "o" else "y", hijos) if hijos else None
+    src, op, vals = regla["src"], regla.get("op", "="), list(regla.get("values", []))
+    if not vals:
+        return None
+    if op == "selected":
+        return ("o", tuple(("sel", src, v) for v in vals))
+    if op == "!selected":
+        return ("y", tuple(("no", ("sel", src, v)) for v in vals))
+    if op == "!=":
+        return ("y", tuple(("no", ("=", src, v)) for v in vals))
+    return ("o", tuple(("=", src, v) for v in vals))
+
+
+def condicion(regla: Dict) -> Dict:
+    """Parte de condición de una regla (la propia regla en el formato original)."""
+    return regla.get("condicion") or regla
+
+
+def fuentes(regla: Dict) -> List[str]:
+    """Preguntas de las que depende una regla (en orden, sin repetir)."""
+    c = condicion(regla)
+    if "grupo" in c:
+        return list(dict.fromkeys(s for h in c.get("condiciones", []) for s in fuentes(h)))
+    return [c["src"]] if c.get("src") else []
+
+
+def describir(regla: Dict) -> str:
+    """Texto corto de la condición (listados, comparación de versiones)."""
+    c = condicion(regla)
+    if "grupo" in c:
+        une = " y " if c["grupo"] == "y" else " o "
+        partes = [describir(h) for h in c.get("condiciones", [])]
+        return "(" + une.join(partes) + ")" if len(partes) > 1 else "".join(partes)
+    return f"{c.get('src')} {c.get('op', '=')} {','.join(str(v) for v in c.get('values', []))}"
+
+
+# ------------------------------------------------------------------------------------------
+# Parser del subconjunto XLSForm
+# ------------------------------------------------------------------------------------------
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<var>\$\{[^}]+\}) | (?P<str>'[^']*'|"[^"]*") | (?P<op>!=|>=|<=|=|>|<) |
+    (?P<par>[(),]) | (?P<pal>[A-Za-z_][\w\-.:]*) | (?P<num>-?\d+(?:\.\d+)?) | (?P<otro>\S)
+)""", re.VERBOSE)
+
+
+class _NoSoportado(Exception):
+    pass
+
+
+def _tokens(texto: str) -> List[Tuple[str, str, int, int]]:
+    out, pos = [], 0
+    texto = texto.rstrip()
+    while pos < len(texto):
+        m = _TOKEN.match(texto, pos)
+        if not m or m.end() == pos:
+            raise _NoSoportado(texto[pos:])
+        clase = m.lastgroup
+        out.append((clase, m.group(clase), m.start(clase), m.end(clase)))
+        pos = m.end()
+    return out
+
+
+class _Parser:
+    def __init__(self, texto: str):
+        self.texto = texto
+        self.t = _tokens(texto)
+        self.i = 0
+
+    def _ver(self, k: int = 0):
+        j = self.i + k
+        return self.t[j] if j < len(self.t) else (None, None, len(self.texto), len(self.texto))
+
+    def _es(self, clase: str, valor: str = None, k: int = 0) -> bool:
+        c, v, _, _ = self._ver(k)
+        return c == clase and (valor is None or v == valor)
+
+    def _tomar(self, clase: str, valor: str = None) -> str:
+        if not self._es(clase, valor):
+            raise _NoSoportado(self._ver()[1])
+        self.i += 1
+        return self.t[self.i - 1][1]
+
+    def expr(self):
+        hijos = [self._y()]
+        while self._es("pal", "or"):
+            self.i += 1
+            hijos.append(self._y())
+        return hijos[0] if len(hijos) == 1 else ("o", tuple(hijos))
+
+    def _y(self):
+        hijos = [self._unario()]
+        while self._es("pal", "and"):
+            self.i += 1
+            hijos.append(self._unario())
+        return hijos[0] if len(hijos) == 1 else ("y", tuple(hijos))
+
+    def _unario(self):
+        if self._es("pal", "not") and self._es("par", "(", 1):
+            self.i += 2
+            n = self.expr()
+            self._tomar("par", ")")
+            return ("no", n)
+        if self._es("par", "("):
+            self.i += 1
+            n = self.expr()
+            self._tomar("par", ")")
+            return n
+        return self._atomo()
+
+    def _atomo(self):
+        # selected(${x}, 'v')
+        if self._es("pal", "selected") and self._es("par", "(", 1) and self._es("var", k=2) \
+                and self._es("par", ",", 3) and self._es("str", k=4) and self._es("par", ")", 5):
+            src, val = self.t[self.i + 2][1][2:-1], self.t[self.i + 4][1][1:-1]
+            self.i += 6
+            return ("sel", src, val)
+        # ${x} = 'v' / ${x} != 'v'
+        if self._es("var") and (self._es("op", "=", 1) or self._es("op", "!=", 1)) and self._es("str", k=2) \
+                and self._fin_de_termino(3):
+            src, op, val = self.t[self.i][1][2:-1], self.t[self.i + 1][1], self.t[self.i + 2][1][1:-1]
+            self.i += 3
+            return ("=", src, val) if op == "=" else ("no", ("=", src, val))
+        # Cualquier otra cosa: término opaco hasta el próximo and / or / ) del mismo nivel
+        ini, prof = self.i, 0
+        while self.i < len(self.t):
+            c, v, _, _ = self.t[self.i]
+            if prof == 0 and ((c == "pal" and v in ("and", "or")) or (c == "par" and v in (")", ","))):
+                break
+            if c == "par" and v == "(":
+                prof += 1
+            elif c == "par" and v == ")":
+                prof -= 1
+            self.i += 1
+        if self.i == ini or prof != 0:
+            raise _NoSoportado(self._ver()[1])
+        return ("txt", self.texto[self.t[ini][2]:self.t[self.i - 1][3]].strip())
+
+    def _fin_de_termino(self, k: int) -> bool:
+        c, v, _, _ = self._ver(k)
+        return c is None or (c == "pal" and v in ("and", "or")) or (c == "par" and v == ")")
+
+
+@lru_cache(maxsize=4096)
+def parsear(texto: Optional[str]):
+    """Nodo de un relevant escrito a mano; si no se entiende, un único término opaco."""
+    if not texto or not str(texto).strip():
+        return VERDADERO
+    texto = str(texto).strip()
+    try:
+        p = _Parser(texto)
+        nodo = p.expr()
+        if p.i != len(p.t):
+            raise _NoSoportado(p._ver()[1])
+        return nodo
+    except _NoSoportado:
+        return ("txt", texto)
+
+
+# ------------------------------------------------------------------------------------------
+# Simplificación
+# ------------------------------------------------------------------------------------------
+def conocidos(nodo) -> FrozenSet:
+    """Términos que un nodo garantiza (los de su conjunción de nivel superior)."""
+    if nodo[0] == "y":
+        return frozenset(h for h in nodo[1] if h[0] in ("=", "sel", "no", "txt"))
+    if nodo[0] in ("=", "sel", "no", "txt"):
+        return frozenset([nodo])
+    return frozenset()
+
+
+def _contradice(atomo, hechos: FrozenSet) -> bool:
+    """${x}='a' es falso si se sabe ${x}='b' (b ≠ a), o si se sabe not(${x}='a')."""
+    if ("no", atomo) in hechos:
+        return True
+    if atomo[0] == "=":
+        return any(h[0] == "=" and h[1] == atomo[1] and h[2] != atomo[2] for h in hechos)
+    return False
+
+
+def _sin_repetir(hijos) -> List:
+    return list(dict.fromkeys(hijos))
+
+
+def _partes(n, tipo: str) -> Tuple:
+    return n[1] if n[0] == tipo else (n,)
+
+
+@lru_cache(maxsize=16384)
+def _claves(nodo) -> FrozenSet:
+    """Preguntas (o textos opacos) que menciona un nodo: solo términos con la misma clave interactúan."""
+    if nodo[0] in ("=", "sel"):
+        return frozenset([nodo[1]])
+    if nodo[0] == "txt":
+        return frozenset([nodo])
+    if nodo[0] == "no":
+        return _claves(nodo[1])
+    if nodo[0] in ("y", "o"):
+        return frozenset().union(*(_claves(h) for h in nodo[1]))
+    return frozenset()
+
+
+@lru_cache(maxsize=16384)
+def simplificar(nodo, hechos: FrozenSet = frozenset()):
+    """Expresión equivalente más corta, sabiendo que los términos de `hechos` son verdaderos."""
+    tipo = nodo[0]
+    if tipo in ("1", "0"):
+        return nodo
+    if tipo in ("=", "sel", "txt"):
+        if nodo in hechos:
+            return VERDADERO
+        return FALSO if _contradice(nodo, hechos) else nodo
+    if tipo == "no":
+        h = simplificar(nodo[1], hechos)
+        if h == VERDADERO:
+            return FALSO
+        if h == FALSO:
+            return VERDADERO
+        if h[0] == "no":
+            return h[1]
+        n = ("no", h)
+        return VERDADERO if n in hechos else (FALSO if h in hechos else n)
+    return _simplificar_grupo(tipo, nodo[1], hechos)
+
+
+def _simplificar_grupo(tipo: str, hijos, hechos: FrozenSet):
+    neutro, absorbente = (VERDADERO, FALSO) if tipo == "y" else (FALSO, VERDADERO)
+    otro = "o" if tipo == "y" else "y"
+
+    planos = []
+    for h in hijos:
+        h = simplificar(h, hechos)
+        if h == absorbente:
+            return absorbente
+        if h != neutro:
+            planos.extend(_partes(h, tipo))
+    planos = _sin_repetir(planos)
+
+    if tipo == "y":
+        # Cada término se evalúa sabiendo que los demás de la conjunción son verdaderos
+        # (solo los que mencionan alguna de sus mismas preguntas)
+        por_clave: Dict = {}
+        for a in planos:
+            if a[0] in ("=", "sel", "no", "txt"):
+                for c in _claves(a):
+                    por_clave.setdefault(c, []).append(a)
+        nuevos = []
+        for h in planos:
+            propios = frozenset(a for c in _claves(h) for a in por_clave.get(c, ()) if a != h)
+            s = simplificar(h, hechos | propios) if propios else h
+            if s == FALSO:
+                return FALSO
+            if s != VERDADERO:
+                nuevos.extend(_partes(s, "y"))
+        planos = _sin_repetir(nuevos)
+
+    # Absorción: A y (A o B) = A ; A o (A y B) = A
+    conjunto = set(planos)
+    planos = [h for h in planos if not (h[0] == otro and conjunto.intersection(h[1]))]
+
+    # Factor común: (A y B) o (A y C) = A y (B o C) ; (A o B) y (A o C) = A o (B y C)
+    if len(planos) > 1:
+        grupos = [_partes(h, otro) for h in planos]
+        comunes = [a for a in grupos[0] if all(a in g for g in grupos[1:])]
+        if comunes:
+            restos = tuple(
+                tuple(a for a in g if a not in comunes) for g in grupos
+            )
+            resto = (tipo, tuple(r[0] if len(r) == 1 else (otro, r) for r in restos if r)) \
+                if all(restos) else absorbente
+            return simplificar((otro, tuple(comunes) + (resto,)), hechos)
+
+    if not planos:
+        return neutro
+    return planos[0] if len(planos) == 1 else (tipo, tuple(planos))
+
+
+@lru_cache(maxsize=8192)
+def combinar(partes: Tuple, hechos: FrozenSet = frozenset()) -> Optional[str]:
+    """
+    relevant final de una pregunta: Y de todas las partes (nodos o textos), simplificado.
+    Memorizado: las preguntas seguidas suelen compartir las mismas partes (reglas de fin).
+    """
+    nodos = tuple(parsear(p) if isinstance(p, str) or p is None else p for p in partes)
+    return a_xlsform(simplificar(("y", nodos), hechos))
+
+
+# ------------------------------------------------------------------------------------------
+# Nodo → texto XLSForm
+# ------------------------------------------------------------------------------------------
+_RE_LOGICO = re.compile(r"\b(and|or)\b")
+
+
+def _texto(n, padre: str = "") -> str:
+    tipo = n[0]
+    if tipo == "=":
+        return f"${{{n[1]}}}='{n[2]}'"
+    if tipo == "sel":
+        return f"selected(${{{n[1]}}}, '{n[2]}')"
+    if tipo == "no":
+        if n[1][0] == "=":
+            return f"${{{n[1][1]}}}!='{n[1][2]}'"
+        return f"not({_texto(n[1])})"
+    if tipo == "txt":
+        return f"({n[1]})" if padre and _RE_LOGICO.search(re.sub(r"'[^']*'", "", n[1])) else n[1]
+    if tipo == "1":
+        return "true()"
+    if tipo == "0":
+        return "false()"
+    if len(n[1]) == 1:
+        return _texto(n[1][0], padre)
+    if tipo == "y":
+        s = " and ".join(_texto(h, "y") for h in n[1])
+        # not(A) and not(B) ... → not(A or B ...) si queda más corto
+        negados = [h for h in n[1] if h[0] == "no"]
+        if len(negados) > 1:
+            resto = [_texto(h, "y") for h in n[1] if h[0] != "no"]
+            junto = " and ".join(resto + [f"not({_texto(('o', tuple(h[1] for h in negados)))})"])
+            if len(junto) < len(s):
+                s = junto
+        return s
+    s = " or ".join(_texto(h, "o") for h in n[1])
+    return f"({s})" if padre == "y" else s
+
+
+def a_xlsform(nodo) -> Optional[str]:
+    """Texto del relevant; None si la condición es siempre verdadera."""
+    return None if nodo == VERDADERO else _texto(nodo)
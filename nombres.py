@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Names XLSForm (survey.name / choices.name) a partir de textos en español
+# - slugify_name: minúsculas sin tildes, solo [a-z0-9_]; "campo" si queda vacío
+# - asegurar_nombre_unico: sufijo _2, _3... frente a los ya usados
+# - slugs_opciones: names de las opciones de una lista tal como los genera la compilación;
+#   memoizado por proceso (lo consulta la validación de reglas en cada rerun)
+# ==========================================================================================
+
+import re
+from functools import lru_cache
+from typing import FrozenSet, Tuple
+
+
+def slugify_name(texto: str) -> str:
+    if not texto:
+        return "campo"
+    t = texto.lower()
+    t = re.sub(r"[áàäâ]", "a", t)
+    t = re.sub(r"[éèëê]", "e", t)
+    t = re.sub(r"[íìïî]", "i", t)
+    t = re.sub(r"[óòöô]", "o", t)
+    t = re.sub(r"[úùüû]", "u", t)
+    t = re.sub(r"ñ", "n", t)
+    t = re.sub(r"[^a-z0-9]+", "_", t).strip("_")
+    return t or "campo"
+
+
+def asegurar_nombre_unico(base: str, usados: set) -> str:
+    if base not in usados:
+        return base
+    i = 2
+    while f"{base}_{i}" in usados:
+        i += 1
+    return f"{base}_{i}"
+
+
+@lru_cache(maxsize=4096)
+def slugs_opciones(opciones: Tuple[str, ...]) -> FrozenSet[str]:
+    usados = set()
+    for o in opciones:
+        usados.add(asegurar_nombre_unico(slugify_name(o), usados))
+    return frozenset(usados)
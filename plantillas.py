@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Registro de plantillas de encuesta (plantillas/<id>.json)
+# - Una plantilla es un archivo de datos: id, nombre, version, preguntas [, textos_fijos]
+# - Se lee y precompila UNA vez por proceso (la app la cachea por id + firma del archivo):
+#   valores por defecto, qid estable (uuid5 de id + name), versión de alta de cada pregunta
+# - Solo se lee la plantilla elegida; listar el registro no abre los archivos
+# - Actualizar un proyecto a una versión nueva de su plantilla: agrega las preguntas con
+#   "desde" > versión del proyecto que falten (conjunto de names), en su posición relativa
+# ==========================================================================================
+
+import json
+import os
+import uuid
+from typing import Dict, List, Tuple
+
+DIR_PLANTILLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plantillas")
+PLANTILLA_DEFAULT = "comercio"
+
+# Campos de una pregunta y su valor si la plantilla no los trae
+DEFECTOS_PREGUNTA = {
+    "tipo_ui": "Texto (corto)",
+    "label": "",
+    "name": None,
+    "required": False,
+    "opciones": [],
+    "appearance": None,
+    "choice_filter": None,
+    "relevant": None,
+}
+
+
+def _ruta(plantilla_id: str, directorio: str) -> str:
+    return os.path.join(directorio, f"{plantilla_id}.json")
+
+
+def disponibles(directorio: str = DIR_PLANTILLAS) -> List[str]:
+    """Ids de las plantillas del registro (nombres de archivo, sin leerlos)."""
+    try:
+        return sorted(f[:-len(".json")] for f in os.listdir(directorio) if f.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+
+def firma(plantilla_id: str, directorio: str = DIR_PLANTILLAS) -> Tuple[int, int]:
+    """(mtime_ns, tamaño) del archivo: cambia si se edita la plantilla (invalida la caché)."""
+    st = os.stat(_ruta(plantilla_id, directorio))
+    return st.st_mtime_ns, st.st_size
+
+
+def qid_plantilla(plantilla_id: str, name: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"plantilla:{plantilla_id}:{name}"))
+
+
+def leer(plantilla_id: str, directorio: str = DIR_PLANTILLAS) -> Dict:
+    """
+    Lee y precompila una plantilla:
+      {"id", "nombre", "version", "preguntas": [dict], "desde": {name: versión}, "textos_fijos": {}}
+    Cada pregunta trae todos los campos del constructor y un qid estable.
+    """
+    with open(_ruta(plantilla_id, directorio), encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data.get("preguntas"), list):
+        raise ValueError(f"Plantilla '{plantilla_id}': falta la lista 'preguntas'.")
+    version = int(data.get("version") or 1)
+
+    preguntas, desde, vistos = [], {}, set()
+    for i, q in enumerate(data["preguntas"]):
+        if not isinstance(q, dict) or not q.get("name"):
+            raise ValueError(f"Plantilla '{plantilla_id}': la pregunta #{i + 1} no tiene 'name'.")
+        if q["name"] in vistos:
+            raise ValueError(f"Plantilla '{plantilla_id}': name repetido '{q['name']}'.")
+        vistos.add(q["name"])
+        p = {k: q.get(k, v) for k, v in DEFECTOS_PREGUNTA.items()}
+        p.update({k: v for k, v in q.items() if k not in DEFECTOS_PREGUNTA and k not in ("desde", "qid")})
+        p["opciones"] = list(p["opciones"] or [])
+        p["qid"] = qid_plantilla(plantilla_id, q["name"])
+        preguntas.append(p)
+        desde[q["name"]] = int(q.get("desde") or 1)
+        if desde[q["name"]] > version:
+            raise ValueError(f"Plantilla '{plantilla_id}': '{q['name']}' es de una versión ({desde[q['name']]}) "
+                             f"posterior a la plantilla ({version}).")
+
+    return {
+        "id": data.get("id") or plantilla_id,
+        "nombre": data.get("nombre") or plantilla_id,
+        "version": version,
+        "preguntas": preguntas,
+        "desde": desde,
+        "textos_fijos": dict(data.get("textos_fijos") or {}),
+    }
+
+
+def actualizar(preguntas: List, plantilla: Dict, version_proyecto: int) -> Tuple[List, List[str]]:
+    """
+    Devuelve (preguntas, names agregados). Agrega las preguntas de la plantilla posteriores a
+    `version_proyecto` que el proyecto no tenga, justo después de la última pregunta de la
+    plantilla que las precede y sí está en el proyecto (o al inicio). Un recorrido por lista.
+    """
+    posicion = {q.get("name"): i for i, q in enumerate(preguntas)}
+    insertar: Dict[int, List] = {}
+    ancla = -1
+    agregados = []
+    for q in plantilla["preguntas"]:
+        nombre = q["name"]
+        if nombre in posicion:
+            ancla = max(ancla, posicion[nombre])
+        elif plantilla["desde"].get(nombre, 1) > version_proyecto:
+            insertar.setdefault(ancla, []).append(q)
+            agregados.append(nombre)
+    if not agregados:
+        return preguntas, []
+
+    out = list(insertar.get(-1, []))
+    for i, q in enumerate(preguntas):
+        out.append(q)
+        out.extend(insertar.get(i, []))
+    return out, agregados
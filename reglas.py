@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Índice de reglas (visibilidad / finalizar) sobre las listas guardadas del proyecto
+# - Id estable por contenido: tipo + target + condición canónica (valores ordenados, grupos
+#   sin importar el orden); mismo id = regla duplicada → se descarta al agregar
+# - Búsqueda O(1) por id, por target y por pregunta fuente (toda pregunta de la condición)
+# - Validación contra el formulario actual: target / fuente inexistentes, valores que ya no
+#   son opciones (slugs) de la fuente, condición imposible, pregunta que una regla de
+#   finalizar oculta siempre, posición de origen (index_src) desactualizada
+# - Las listas siguen siendo el formato guardado (archivo, SQLite, deshacer, capas); el
+#   índice se actualiza junto con ellas en agregar / quitar
+# ==========================================================================================
+
+import hashlib
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import motor_reglas
+
+TIPOS = {"vis": "reglas_visibilidad", "fin": "reglas_finalizar"}
+
+
+def _canonica(c: Dict) -> Dict:
+    if "grupo" in c:
+        hijos = [_canonica(h) for h in c.get("condiciones", [])]
+        return {"grupo": c["grupo"],
+                "condiciones": sorted(hijos, key=lambda h: json.dumps(h, sort_keys=True, ensure_ascii=False))}
+    return {"src": c.get("src"), "op": c.get("op", "="), "values": sorted(set(map(str, c.get("values", []))))}
+
+
+def id_regla(tipo: str, regla: Dict) -> str:
+    """Id por contenido (index_src se deriva de la posición y no cuenta)."""
+    canon = {"tipo": tipo, "target": regla.get("target") if tipo == "vis" else None,
+             "condicion": _canonica(motor_reglas.condicion(regla))}
+    return hashlib.sha1(json.dumps(canon, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+
+def indexar(reglas_vis: List[Dict], reglas_fin: List[Dict]) -> Dict:
+    """
+    {"por_id": {id: (tipo, regla)}, "por_target": {target: [id]}, "por_fuente": {name: [id]},
+     "duplicadas": {id repetido: veces}}. Con duplicados guardados, el índice apunta a la primera.
+    """
+    indice = {"por_id": {}, "por_target": {}, "por_fuente": {}, "duplicadas": {}}
+    for tipo, lista in (("vis", reglas_vis), ("fin", reglas_fin)):
+        for r in lista:
+            rid = id_regla(tipo, r)
+            if rid in indice["por_id"]:
+                indice["duplicadas"][rid] = indice["duplicadas"].get(rid, 1) + 1
+                continue
+            indice["por_id"][rid] = (tipo, r)
+            if tipo == "vis":
+                indice["por_target"].setdefault(r.get("target"), []).append(rid)
+            for src in motor_reglas.fuentes(r):
+                indice["por_fuente"].setdefault(src, []).append(rid)
+    return indice
+
+
+def agregar(reglas: List[Dict], tipo: str, regla: Dict, indice: Dict) -> bool:
+    """Agrega la regla (lista e índice) salvo que ya exista una igual; True si se agregó."""
+    rid = id_regla(tipo, regla)
+    if rid in indice["por_id"]:
+        return False
+    reglas.append(regla)
+    indice["por_id"][rid] = (tipo, regla)
+    if tipo == "vis":
+        indice["por_target"].setdefault(regla.get("target"), []).append(rid)
+    for src in motor_reglas.fuentes(regla):
+        indice["por_fuente"].setdefault(src, []).append(rid)
+    return True
+
+
+def quitar(reglas: List[Dict], tipo: str, rid: str, indice: Dict, dejar: int = 0) -> int:
+    """
+    Quita las reglas con ese id salvo las primeras `dejar` (1 = deja una sin repetir) y
+    actualiza el índice; devuelve cuántas quitó.
+    """
+    out = []
+    vistas = 0
+    for r in reglas:
+        if id_regla(tipo, r) == rid:
+            vistas += 1
+            if vistas > dejar:
+                continue
+        out.append(r)
+    quitadas = len(reglas) - len(out)
+    reglas[:] = out
+    if quitadas:
+        indice["duplicadas"].pop(rid, None)
+        if not dejar:
+            _, regla = indice["por_id"].pop(rid)
+            for clave, grupo in ((regla.get("target"), indice["por_target"]),
+                                 *((src, indice["por_fuente"]) for src in motor_reglas.fuentes(regla))):
+                ids = grupo.get(clave)
+                if ids and rid in ids:
+                    ids.remove(rid)
+                    if not ids:
+                        del grupo[clave]
+    return quitadas
+
+
+def cantidad(indice: Dict) -> int:
+    """Reglas guardadas que cubre el índice (con las repetidas)."""
+    return len(indice["por_id"]) + sum(v - 1 for v in indice["duplicadas"].values())
+
+
+def _hojas(c: Dict) -> Iterable[Dict]:
+    if "grupo" in c:
+        for h in c.get("condiciones", []):
+            yield from _hojas(h)
+    else:
+        yield c
+
+
+def problemas(indice: Dict, preguntas: List[Dict],
+              opciones_de: Callable[[Dict], Optional[Set[str]]]) -> Dict[str, List[str]]:
+    """
+    {id: [problema, ...]} de las reglas con algo que revisar. `opciones_de(pregunta)` da los
+    slugs válidos de la fuente (None = sin lista que validar, p. ej. texto o catálogo).
+    """
+    por_name = {q["name"]: (i, q) for i, q in enumerate(preguntas)}
+    slugs: Dict[str, Optional[Set[str]]] = {}
+    out: Dict[str, List[str]] = {}
+
+    def _marcar(rid, texto):
+        out.setdefault(rid, []).append(texto)
+
+    for rid, veces in indice["duplicadas"].items():
+        _marcar(rid, f"duplicada ({veces} veces)")
+
+    nodos = {}
+    for rid, (tipo, r) in indice["por_id"].items():
+        if tipo == "vis" and r.get("target") not in por_name:
+            _marcar(rid, f"la pregunta a mostrar '{r.get('target')}' ya no existe")
+        for hoja in _hojas(motor_reglas.condicion(r)):
+            src = hoja.get("src")
+            if src not in por_name:
+                _marcar(rid, f"la pregunta fuente '{src}' ya no existe")
+                continue
+            if src not in slugs:
+                slugs[src] = opciones_de(por_name[src][1])
+            validos = slugs[src]
+            if validos is not None:
+                faltan = [v for v in hoja.get("values", []) if v not in validos]
+                if faltan:
+                    _marcar(rid, f"{', '.join(faltan)} ya no es opción de '{src}'")
+        nodo = motor_reglas.desde_regla(r)
+        nodos[rid] = nodo
+        if nodo is not None and motor_reglas.simplificar(nodo) == motor_reglas.FALSO:
+            _marcar(rid, "la condición nunca se cumple")
+        if tipo == "fin":
+            fuentes = [por_name[s][0] for s in motor_reglas.fuentes(r) if s in por_name]
+            if fuentes and r.get("index_src") != max(fuentes):
+                _marcar(rid, "la pregunta de origen cambió de posición "
+                             f"(index_src {r.get('index_src')} → {max(fuentes)})")
+
+    # Visibilidad anulada por una regla de finalizar: solo pueden chocar si comparten fuente
+    for rid, (tipo, r) in indice["por_id"].items():
+        nodo = nodos.get(rid)
+        if tipo != "vis" or nodo is None or r.get("target") not in por_name:
+            continue
+        idx_target = por_name[r["target"]][0]
+        candidatas = {f for s in motor_reglas.fuentes(r) for f in indice["por_fuente"].get(s, ())}
+        for fid in candidatas:
+            ftipo, fr = indice["por_id"][fid]
+            fnodo = nodos.get(fid)
+            if ftipo != "fin" or fnodo is None or int(fr.get("index_src", -1)) >= idx_target:
+                continue
+            if motor_reglas.simplificar(("y", (nodo, ("no", fnodo)))) == motor_reglas.FALSO:
+                _marcar(rid, f"'{r['target']}' nunca se muestra: una regla de finalizar lo oculta "
+                             f"({motor_reglas.describir(fr)})")
+    return out
+
+
+def resumen(problemas_por_id: Dict[str, List[str]], indice: Dict, name: str) -> Tuple[int, int]:
+    """(reglas con problemas donde `name` es fuente, donde es target)."""
+    como_fuente = sum(1 for rid in indice["por_fuente"].get(name, ()) if rid in problemas_por_id)
+    como_target = sum(1 for rid in indice["por_target"].get(name, ()) if rid in problemas_por_id)
+    return como_fuente, como_target
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# ==========================================================================================
+# Etiquetas multilingües del XLSForm con memoria de traducción
+# - El texto fuente (español) es la clave: hash del texto normalizado → traducción, así una
+#   misma etiqueta ("Sí", "Otro", "No aplica"...) se traduce una vez para todas las
+#   preguntas, notas, bloques de consentimiento y plantillas
+# - Memoria compartida por idioma (plantillas/traducciones/<idioma>.json, legible: fuente →
+#   traducción) + memoria del proyecto (ediciones del usuario, por hash) que la sobrescribe
+# - Columnas por idioma (label::English (en)...) a partir del survey/choices ya compilados:
+#   un idioma más es un mapeo de los textos únicos, no otra compilación
+# ==========================================================================================
+
+import csv
+import hashlib
+import io
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+IDIOMA_FUENTE = "es"
+IDIOMAS = {"es": "Español", "en": "English", "fr": "Français", "pt": "Português"}
+
+# Columnas de texto traducibles de cada hoja
+COLUMNAS_SURVEY = ("label", "hint", "constraint_message", "required_message")
+COLUMNAS_CHOICES = ("label",)
+
+DIR_MEMORIAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plantillas", "traducciones")
+
+
+def nombre_idioma(idioma: str) -> str:
+    """Nombre XLSForm del idioma: "English (en)"."""
+    return f"{IDIOMAS.get(idioma, idioma)} ({idioma})"
+
+
+def columna(base: str, idioma: str) -> str:
+    return f"{base}::{nombre_idioma(idioma)}"
+
+
+def clave(texto: str) -> str:
+    """Hash del texto fuente normalizado (espacios colapsados)."""
+    return hashlib.sha1(" ".join(str(texto).split()).encode("utf-8")).hexdigest()[:16]
+
+
+def hash_memoria(memoria: Dict[str, str]) -> str:
+    canon = json.dumps(memoria, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+def firma(idioma: str, directorio: str = DIR_MEMORIAS) -> Tuple[int, int]:
+    """(mtime_ns, tamaño) de la memoria compartida; (0, 0) si el idioma no tiene archivo."""
+    try:
+        st = os.stat(os.path.join(directorio, f"{idioma}.json"))
+    except FileNotFoundError:
+        return 0, 0
+    return st.st_mtime_ns, st.st_size
+
+
+def leer_memoria_compartida(idioma: str, directorio: str = DIR_MEMORIAS) -> Dict[str, str]:
+    """{clave: traducción} desde <directorio>/<idioma>.json ({"textos": {fuente: traducción}})."""
+    ruta = os.path.join(directorio, f"{idioma}.json")
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        textos = json.load(f).get("textos", {})
+    return {clave(k): v for k, v in textos.items() if v}
+
+
+def textos_fuente(df_survey: pd.DataFrame, df_choices: pd.DataFrame) -> List[str]:
+    """Textos únicos traducibles, en orden de aparición (survey y luego choices)."""
+    vistos = {}
+    for df, cols in ((df_survey, COLUMNAS_SURVEY), (df_choices, COLUMNAS_CHOICES)):
+        for c in cols:
+            if c in df.columns:
+                for v in df[c].dropna().unique():
+                    if str(v).strip():
+                        vistos.setdefault(str(v), None)
+    return list(vistos)
+
+
+def columnas_idioma(df_survey: pd.DataFrame, df_choices: pd.DataFrame,
+                    memoria: Dict[str, str]) -> Tuple[Dict[str, pd.Series], Dict[str, pd.Series], int]:
+    """
+    Columnas traducidas de un idioma: ({col_survey: serie}, {col_choices: serie}, faltantes).
+    Sin traducción se usa el texto fuente (Survey123 mostraría la celda vacía).
+    """
+    traducidas: Dict[str, str] = {}
+    faltantes = set()
+
+    def _mapa(serie: pd.Series) -> pd.Series:
+        unicos = [v for v in serie.dropna().unique() if v not in traducidas]
+        for v in unicos:
+            t = memoria.get(clave(v))
+            if t is None:
+                faltantes.add(v)
+            traducidas[v] = t if t is not None else v
+        return serie.map(traducidas, na_action="ignore")
+
+    survey = {c: _mapa(df_survey[c]) for c in COLUMNAS_SURVEY if c in df_survey.columns}
+    choices = {c: _mapa(df_choices[c]) for c in COLUMNAS_CHOICES if c in df_choices.columns}
+    return survey, choices, len(faltantes)
+
+
+def con_idiomas(df: pd.DataFrame, columnas_por_idioma: Dict[str, Dict[str, pd.Series]],
+                fuente: str = IDIOMA_FUENTE) -> pd.DataFrame:
+    """
+    Renombra cada columna de texto a su versión con idioma (label → label::Español (es)) y
+    agrega a continuación las de los demás idiomas, en el orden de `columnas_por_idioma`.
+    """
+    bases = next(iter(columnas_por_idioma.values())).keys() if columnas_por_idioma else ()
+    cols = []
+    datos = {}
+    for c in df.columns:
+        if c in bases:
+            cols.append(columna(c, fuente))
+            datos[columna(c, fuente)] = df[c]
+            for idioma, series in columnas_por_idioma.items():
+                cols.append(columna(c, idioma))
+                datos[columna(c, idioma)] = series[c]
+        else:
+            cols.append(c)
+            datos[c] = df[c]
+    return pd.DataFrame(datos, columns=cols)
+
+
+def a_csv(textos: Iterable[str], memorias: Dict[str, Dict[str, str]]) -> bytes:
+    """CSV fuente + una columna por idioma (para traducir fuera de la app)."""
+    idiomas = list(memorias)
+    out = io.StringIO()
+    w = csv.writer(out)
+    w.writerow([IDIOMA_FUENTE] + idiomas)
+    for t in textos:
+        w.writerow([t] + [memorias[i].get(clave(t), "") for i in idiomas])
+    return out.getvalue().encode("utf-8-sig")
+
+
+def desde_csv(datos: bytes) -> Dict[str, Dict[str, str]]:
+    """{idioma: {clave: traducción}} desde un CSV como el de `a_csv` (celdas vacías se ignoran)."""
+    lector = csv.reader(io.StringIO(datos.decode("utf-8-sig")))
+    cabecera = next(lector, None)
+    if not cabecera or cabecera[0].strip() != IDIOMA_FUENTE:
+        raise ValueError(f"La primera columna del CSV debe ser '{IDIOMA_FUENTE}' (texto fuente).")
+    idiomas = [c.strip() for c in cabecera[1:]]
+    out = {i: {} for i in idiomas}
+    for fila in lector:
+        if not fila or not fila[0].strip():
+            continue
+        k = clave(fila[0])
+        for i, t in zip(idiomas, fila[1:]):
+            if t.strip():
+                out[i][k] = t.strip()
+    return out